@@ -1,146 +1,1063 @@
 import os
+import logging
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
-from scipy.stats import ttest_ind
-from column_normalization import normalize_columns
+from analysis_registry import ANALYSES
+import metrics
+from metrics import STAGE_SECONDS, AGGREGATE_SECONDS, ROWS
+from column_normalization import normalize_col, normalize_list
+from columnar_store import load_table, iter_table, table_rows
+from join_engine import (
+    KeySpaceTooLarge,
+    asof_join,
+    asof_join_index,
+    lookup_index,
+    sorted_join,
+    sorted_join_index,
+)
+from compact_table import CompactTable, group_frame, group_reduce, group_state
+from rollups import VisitRollup, ROLLUP_DATE, ROLLUP_VALUE
+from stats_engine import (
+    BOOTSTRAP_RESAMPLES,
+    GroupMoments,
+    bootstrap_mean_ci,
+    corr_frame,
+    group_comoments,
+    group_corr,
+    merge_comoments,
+    welch_pairs,
+)
 
 
-# ---------- LOAD ----------
-def load_basic_clinic(data_dir):
-    patients = normalize_columns(
-        pd.read_csv(os.path.join(data_dir, "patients.csv"))
-    )
-    visits = normalize_columns(
-        pd.read_csv(os.path.join(data_dir, "visits.csv"))
-    )
-    return patients, visits
+log = logging.getLogger(__name__)
 
+# Bump when outputs change for the same spec and inputs (join or
+# aggregate semantics, output columns): cached results from older
+# versions are then never served again.
+ENGINE_VERSION = 2
 
 
-def load_clinic_outcomes(data_dir):
-    patients = normalize_columns(pd.read_csv(os.path.join(data_dir, "patients.csv")))
-    visits = normalize_columns(pd.read_csv(os.path.join(data_dir, "visits.csv")))
-    metrics = normalize_columns(pd.read_csv(os.path.join(data_dir, "metrics.csv")))
-    return patients, visits, metrics
+# ---------- FILTER ----------
+def date_range_mask(values, start_date, end_date):
+    """Rows of values within [start_date, end_date]; None if neither is set."""
+    if not start_date and not end_date:
+        return None
 
+    values = pd.to_datetime(values, errors="coerce")
+    mask = np.ones(len(values), dtype=bool)
 
-# ---------- MERGE ----------
-def merge_data(patients, visits, metrics):
-    visits_full = visits.merge(patients, on="patientid", how="left")
+    if start_date:
+        mask &= (values >= pd.to_datetime(start_date)).to_numpy()
+    if end_date:
+        mask &= (values <= pd.to_datetime(end_date)).to_numpy()
 
-    full_data = visits_full.merge(
-        metrics,
-        left_on=["patientid", "visitdate"],
-        right_on=["patientid", "metricdate"],
-        how="left"
-    )
-    return full_data
+    return mask
 
 
-# ---------- FILTER ----------
-def filter_by_date(df, start_date, end_date):
-    if start_date:
-        df["visitdate"] = pd.to_datetime(df["visitdate"], errors="coerce")
-        df = df[df["visitdate"] >= pd.to_datetime(start_date)]
-
-    if end_date:
-        df = df[df["visitdate"] <= pd.to_datetime(end_date)]
+def filter_by_date(df, start_date, end_date, column="visitdate"):
+    mask = date_range_mask(df[column], start_date, end_date)
+    return df if mask is None else df[mask]
 
-    return df
 
+FILTERS = {
+    "date_range": lambda df, f, start_date, end_date:
+        filter_by_date(df, start_date, end_date, f["column"]),
+}
 
 
 # ---------- AGGREGATES ----------
-def compute_aggregates(df):
+AGGREGATES = {}
+
+
+def register_aggregate(op):
+    """
+    Register fn(df, **result_spec) -> DataFrame as an aggregate usable in
+    the "results" of an analysis.
+    """
+    def wrap(fn):
+        AGGREGATES[op] = fn
+        return fn
+    return wrap
+
+
+@register_aggregate("mean")
+def agg_mean(df, by, column, **_):
+    return df.groupby(by, observed=True)[column].mean().reset_index()
+
+
+@register_aggregate("sum")
+def agg_sum(df, by, column, **_):
+    return df.groupby(by, observed=True)[column].sum().reset_index()
+
+
+@register_aggregate("count")
+def agg_count(df, by, name="count", **_):
+    return df.groupby(by, observed=True).size().reset_index(name=name)
+
+
+@register_aggregate("corr")
+def agg_corr(df, columns, **_):
+    return df[columns].corr().reset_index()
+
+
+# ---------- STATS ----------
+@register_aggregate("welch_pairs")
+def agg_welch_pairs(df, by, column, **_):
+    return welch_pairs(GroupMoments.from_values(df[by], df[column]), by, column)
+
+
+@register_aggregate("group_corr")
+def agg_group_corr(df, by, columns, **_):
+    return group_corr(df, by, columns)
+
+
+@register_aggregate("bootstrap_mean")
+def agg_bootstrap_mean(df, by, column, resamples=BOOTSTRAP_RESAMPLES, confidence=0.95, **_):
+    return bootstrap_mean_ci(df, by, column, resamples=resamples, confidence=confidence)
+
+
+# ---------- PLAN ----------
+def _normalize_spec(spec):
+    out = dict(spec)
+    for key in ("by", "column", "on", "left_on", "right_on"):
+        if isinstance(out.get(key), str):
+            out[key] = normalize_col(out[key])
+        elif out.get(key) is not None:
+            out[key] = normalize_list(out[key])
+    if out.get("columns") is not None:
+        out["columns"] = normalize_list(out["columns"])
+    return out
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def plan(analysis_key):
+    """
+    Work out, from the registry alone, which roles to load, which of
+    their columns each needs, how to join them and what to compute.
+    Roles that nothing references are left out entirely.
+    """
+    analysis = ANALYSES[analysis_key]
+
+    joins = [_normalize_spec(j) for j in analysis.get("joins", [])]
+    filters = [_normalize_spec(f) for f in analysis.get("filters", [])]
+    results = {
+        name: _normalize_spec(r) for name, r in analysis["results"].items()
+    }
+
+    for j in joins:
+        if j.get("method", "merge") not in JOIN_METHODS:
+            raise ValueError(f"{analysis_key}: unknown join method {j['method']!r}")
+
+    for name, r in results.items():
+        if r["op"] not in AGGREGATES:
+            raise ValueError(f"{analysis_key}: unknown aggregate {r['op']!r} in {name}")
+
+    base = joins[0]["left"] if joins else next(iter(analysis["files"]))
+    order = [base] + [j["right"] for j in joins]
+
+    # join keys are loaded from both sides
+    role_columns = {role: [] for role in order}
+    for i, j in enumerate(joins):
+        left = j.get("left", base) if i == 0 else None
+        left_keys = j.get("on") or j.get("left_on")
+        right_keys = j.get("on") or j.get("right_on")
+
+        role_columns[j["right"]] += right_keys
+        if left:
+            role_columns[left] += left_keys
+        else:
+            # later steps join against the merged frame; the key must
+            # come from whichever role declares it first
+            for key in left_keys:
+                if not any(key in cols for cols in role_columns.values()):
+                    role_columns[_owner(analysis, order, key)].append(key)
+
+    # every other referenced column comes from the first role declaring it
+    referenced = []
+    for f in filters:
+        referenced += _as_list(f.get("column"))
+    for r in results.values():
+        referenced += _as_list(r.get("by")) + _as_list(r.get("column")) + _as_list(r.get("columns"))
+
+    for col in referenced:
+        if not any(col in cols for cols in role_columns.values()):
+            role_columns[_owner(analysis, order, col)].append(col)
+
     return {
-        "avg_charge_by_insurance":
-            df.groupby("insurance")["servicecharge"].mean().reset_index(),
+        "key": analysis_key,
+        "base": base,
+        "roles": {
+            role: list(dict.fromkeys(cols))
+            for role, cols in role_columns.items()
+        },
+        "joins": joins,
+        "filters": filters,
+        "results": results,
+        "rollup_roles": analysis.get("rollup_roles", []),
+    }
+
+
+def _owner(analysis, order, column):
+    for role in order:
+        if column in normalize_list(analysis["files"][role]["required_columns"]):
+            return role
+    raise ValueError(f"No input file provides column {column!r}")
+
+
+# ---------- EXECUTE ----------
+def load_inputs(p, data_dir, workers=1):
+    """
+    Load every role of the plan. With workers > 1, roles that only have a
+    raw CSV are parsed in parallel processes; Parquet reads are already
+    multi-threaded inside pyarrow and stay in this process.
+    """
+    csv_roles = [
+        role for role in p["roles"]
+        if not os.path.exists(os.path.join(data_dir, f"{role}.parquet"))
+    ]
 
-        "revenue_by_city":
-            df.groupby("city")["servicecharge"].sum().reset_index(),
+    frames = {}
+    if workers > 1 and len(csv_roles) > 1:
+        with STAGE_SECONDS.time(stage="csv_parse"):
+            with ProcessPoolExecutor(min(workers, len(csv_roles)), mp_context=_pool_context()) as pool:
+                futures = {
+                    role: pool.submit(load_table, data_dir, role, p["roles"][role])
+                    for role in csv_roles
+                }
+                frames = {role: f.result() for role, f in futures.items()}
 
-        "avg_pain_by_insurance":
-            df.groupby("insurance")["painscore"].mean().reset_index(),
+    for role, columns in p["roles"].items():
+        if role not in frames:
+            stage = "csv_parse" if role in csv_roles else "parquet_read"
+            with STAGE_SECONDS.time(stage=stage):
+                frames[role] = load_table(data_dir, role, columns)
 
-        "visit_counts":
-            df.groupby("patientid").size().reset_index(name="visitcount"),
+        ROWS.inc(len(frames[role]), analysis=p["key"], role=role)
+
+    return {role: frames[role] for role in p["roles"]}
+
+
+def _merge_join(left, right, j):
+    keys = {"on": j["on"]} if j.get("on") else {
+        "left_on": j["left_on"],
+        "right_on": j["right_on"],
     }
+    return left.merge(right, how=j.get("how", "inner"), **keys)
 
 
-# ---------- STATS ----------
-def run_stats(df):
-    stats = {}
+def _sorted_join(left, right, j):
+    try:
+        return sorted_join(
+            left, right,
+            j.get("on") or j["left_on"],
+            j.get("on") or j["right_on"],
+            how=j.get("how", "inner"),
+        )
+    except KeySpaceTooLarge:
+        return _merge_join(left, right, j)
 
-    stats["pain_mobility_corr"] = (
-        df[["painscore", "mobilityscore"]].corr()
+
+def _asof_join(left, right, j):
+    return asof_join(
+        left, right,
+        j.get("on") or j["left_on"],
+        j.get("on") or j["right_on"],
+        how=j.get("how", "left"),
+        direction=j.get("direction", "nearest"),
+        tolerance=j.get("tolerance"),
     )
 
-    bluecross = df.loc[df["insurance"] == "bluecross", "servicecharge"]
-    aetna = df.loc[df["insurance"] == "aetna", "servicecharge"]
 
-    if len(bluecross) >= 2 and len(aetna) >= 2:
-        t_stat, p_value = ttest_ind(bluecross, aetna, equal_var=False)
-        stats["charge_ttest"] = {
-            "t_stat": float(t_stat),
-            "p_value": float(p_value),
-        }
-    else:
-        stats["charge_ttest"] = {
-            "error": "Not enough data for t-test"
-        }
+JOIN_METHODS = {
+    "merge": _merge_join,
+    "sorted": _sorted_join,
+    "asof": _asof_join,
+}
+
+
+def apply_joins(p, frames):
+    full = frames[p["base"]]
+
+    for j in p["joins"]:
+        full = JOIN_METHODS[j.get("method", "merge")](full, frames[j["right"]], j)
+
+    return full
+
+
+def apply_filters(p, df, start_date, end_date):
+    for f in p["filters"]:
+        df = FILTERS[f["type"]](df, f, start_date, end_date)
+    return df
+
+
+def execute(p, data_dir, start_date=None, end_date=None):
+    frames = load_inputs(p, data_dir)
+
+    with STAGE_SECONDS.time(stage="join"):
+        full = apply_joins(p, frames)
+    with STAGE_SECONDS.time(stage="filter"):
+        full = apply_filters(p, full, start_date, end_date)
+
+    results = {}
+    for name, r in p["results"].items():
+        with AGGREGATE_SECONDS.time(analysis=p["key"], output=name, op=r["op"]):
+            results[name] = AGGREGATES[r["op"]](full, **r)
+
+    return results
+
+
+# ---------- COMPACT ----------
+# In-memory runs keep the join as row indexes over the loaded inputs
+# (compact_table.CompactTable) instead of a merged frame; 0 falls back
+# to execute().
+ANALYSIS_COMPACT = os.environ.get("ANALYSIS_COMPACT", "1").lower() not in ("0", "false", "no", "off")
 
-    return stats
+# compact runs read the largest streamable input this many rows at a
+# time (0 = load it whole)
+COMPACT_CHUNK_ROWS = int(os.environ.get("COMPACT_CHUNK_ROWS", "500000"))
 
-def run_basic_clinic(data_dir, out_dir, start_date=None, end_date=None):
-    patients, visits = load_basic_clinic(data_dir)
-    full = patients.merge(
-        visits,
-        on="patientid",
-        how="inner"
+
+def _join_keys(j):
+    return j.get("on") or j["left_on"], j.get("on") or j["right_on"]
+
+
+def _merge_join_index(left, right, j):
+    left_on, right_on = _join_keys(j)
+    rows = left[left_on].assign(_left=np.arange(len(left))).merge(
+        right[right_on].assign(_right=np.arange(len(right))),
+        how=j.get("how", "inner"),
+        left_on=left_on,
+        right_on=right_on,
     )
-    full = filter_by_date(full, start_date, end_date)
+    return rows["_left"].to_numpy(), rows["_right"].fillna(-1).to_numpy("int64")
 
-    results = {
-        "avg_charge_by_insurance":
-            full.groupby("insurance")["servicecharge"].mean().reset_index(),
 
-        "revenue_by_city":
-            full.groupby("city")["servicecharge"].sum().reset_index(),
+def _sorted_join_index(left, right, j):
+    left_on, right_on = _join_keys(j)
+    how = j.get("how", "inner")
+
+    if how == "inner":
+        # patients joined to their visits: each visit looks up its
+        # patient, and the rows follow the visits
+        found = lookup_index(right, left, right_on, left_on)
+        if found is not None:
+            right_idx = np.flatnonzero(found >= 0)
+            return found[right_idx], right_idx
+
+    try:
+        return sorted_join_index(left, right, left_on, right_on, how=how)
+    except KeySpaceTooLarge:
+        return _merge_join_index(left, right, j)
+
+
+def _asof_join_index(left, right, j):
+    return asof_join_index(
+        left, right, *_join_keys(j),
+        how=j.get("how", "left"),
+        direction=j.get("direction", "nearest"),
+        tolerance=j.get("tolerance"),
+    )
+
+
+COMPACT_JOINS = {
+    "merge": _merge_join_index,
+    "sorted": _sorted_join_index,
+    "asof": _asof_join_index,
+}
+
+COMPACT_FILTERS = {
+    "date_range": lambda table, f, start_date, end_date:
+        date_range_mask(table.column(f["column"]), start_date, end_date),
+}
+
+# ops reduced on group codes by compact_table.group_reduce
+GROUP_KERNELS = {"mean", "sum", "count"}
+
 
-        "visit_counts":
-            full.groupby("patientid").size().reset_index(name="visit_count"),
+def compact_ready(p):
+    if not ANALYSIS_COMPACT:
+        return False
+    if any(f["type"] not in COMPACT_FILTERS for f in p["filters"]):
+        return False
+    return all(
+        j.get("method", "merge") in COMPACT_JOINS and j.get("how", "inner") in ("inner", "left")
+        for j in p["joins"]
+    )
+
+
+def _kernel_fits(table, r):
+    if r["op"] not in GROUP_KERNELS or not isinstance(r.get("by"), str):
+        return False
+    if r["op"] == "count":
+        return True
+    # integer sums stay exact in pandas; the kernel sums in float64
+    kind = table.dtype(r["column"]).kind
+    return kind == "f" or (r["op"] == "mean" and kind in "iu")
+
+
+def _result_columns(r):
+    return _as_list(r.get("by")) + _as_list(r.get("column")) + _as_list(r.get("columns"))
+
+
+def compact_aggregate(table, r):
+    if _kernel_fits(table, r):
+        return group_reduce(table, **r)
+    return AGGREGATES[r["op"]](table.frame(_result_columns(r)), **r)
+
+
+def compact_table(p, frames, start_date=None, end_date=None, encoded=None):
+    """The plan's joined, filtered rows of frames as a CompactTable."""
+    with STAGE_SECONDS.time(stage="join"):
+        table = CompactTable(frames, p["base"], encoded)
+        for j in p["joins"]:
+            left = table.frame(_join_keys(j)[0])
+            left_idx, right_idx = COMPACT_JOINS[j.get("method", "merge")](left, frames[j["right"]], j)
+            table.join(j["right"], left_idx, right_idx)
+            del left, left_idx, right_idx
+
+    with STAGE_SECONDS.time(stage="filter"):
+        for f in p["filters"]:
+            mask = COMPACT_FILTERS[f["type"]](table, f, start_date, end_date)
+            if mask is not None:
+                table.select(mask)
+
+    return table
+
+
+class CompactPartial:
+    """
+    One result folded over the chunks of a compact run: the summed
+    group_state where the kernel fits (decided on the first chunk), the
+    op's streaming aggregate over the gathered columns otherwise.
+    """
+
+    def __init__(self, r):
+        self.r = r
+        self.kernel = None
+        self.labels = self.dtype = self.state = None
+
+    def update(self, table):
+        if self.kernel is None:
+            self.kernel = _kernel_fits(table, self.r)
+            if not self.kernel:
+                self.state = STREAMING_AGGREGATES[self.r["op"]](**self.r)
+
+        if not self.kernel:
+            self.state.update(table.frame(_result_columns(self.r)))
+            return
+
+        labels, dtype, state = group_state(table, **self.r)
+        if self.state is None:
+            self.labels, self.dtype, self.state = labels, dtype, state
+        elif labels is self.labels:
+            # grouped by a column of an input held whole: same codes
+            for k, v in state.items():
+                self.state[k] += v
+        else:
+            # grouped by a column of the streamed input: merge by label
+            merged = pd.concat([
+                pd.DataFrame(self.state, index=self.labels),
+                pd.DataFrame(state, index=labels),
+            ]).groupby(level=0, sort=True).sum()
+            self.labels, self.dtype = merged.index, merged.index.dtype
+            self.state = {k: merged[k].to_numpy() for k in merged.columns}
+
+    def result(self):
+        if self.kernel:
+            return group_frame(self.labels, self.dtype, self.state, **self.r)
+        return self.state.result()
+
+
+def execute_compact(p, data_dir, start_date=None, end_date=None, chunk_rows=None):
+    """
+    execute() without the merged frame: each join adds a row index into
+    its right input, filters select rows, and aggregates gather only the
+    columns they use. The largest streamable input (see streaming_role)
+    is read chunk_rows (default COMPACT_CHUNK_ROWS) at a time, so only
+    one chunk of it and its row indexes is in memory. Outputs match
+    execute() up to float summation order.
+    """
+    if chunk_rows is None:
+        chunk_rows = COMPACT_CHUNK_ROWS
+
+    role = streaming_role(p, data_dir) if chunk_rows else None
+    if role is None or table_rows(data_dir, role) <= chunk_rows:
+        table = compact_table(p, load_inputs(p, data_dir), start_date, end_date)
+
+        results = {}
+        for name, r in p["results"].items():
+            with AGGREGATE_SECONDS.time(analysis=p["key"], output=name, op=r["op"]):
+                results[name] = compact_aggregate(table, r)
+        return results
+
+    resident = {
+        r: load_table(data_dir, r, cols)
+        for r, cols in p["roles"].items()
+        if r != role
     }
+    # every chunk's joins pass over the inputs held whole again, and
+    # loading those already sets the peak: smaller chunks only cost time
+    chunk_rows = max([chunk_rows] + [len(df) // 4 for df in resident.values()])
 
-    save_results(results, out_dir)
+    # an as-of right side is sorted on its keys once (np.lexsort is
+    # stable, so ties keep their order), so the join of every chunk finds
+    # it already in order
+    for j in p["joins"]:
+        if j.get("method") == "asof" and j["right"] in resident:
+            right = resident[j["right"]]
+            order = np.lexsort([right[c].to_numpy() for c in reversed(_join_keys(j)[1])])
+            resident[j["right"]] = right.take(order).reset_index(drop=True)
+            del right, order
 
-def run_clinic_outcomes(data_dir, out_dir, start_date=None, end_date=None):
-    patients, visits, metrics = load_clinic_outcomes(data_dir)
-    full = merge_data(patients, visits, metrics)
-    full = filter_by_date(full, start_date, end_date)
+    encoded = {r: {} for r in resident}
+    partials = {name: CompactPartial(r) for name, r in p["results"].items()}
 
-    results = {
-        "avg_pain_by_insurance":
-            full.groupby("insurance")["painscore"].mean().reset_index(),
+    for chunk in iter_table(data_dir, role, p["roles"][role], chunk_rows):
+        ROWS.inc(len(chunk), analysis=p["key"], role=role)
+        table = compact_table(p, {**resident, role: chunk}, start_date, end_date, encoded)
+        for name, partial in partials.items():
+            with AGGREGATE_SECONDS.time(analysis=p["key"], output=name, op=partial.r["op"]):
+                partial.update(table)
+        del table, chunk
+
+    return {name: partial.result() for name, partial in partials.items()}
+
+
+# ---------- STREAMING ----------
+ANALYSIS_MEMORY_BUDGET_MB = int(os.environ.get("ANALYSIS_MEMORY_BUDGET_MB", "1024"))
+
+# rough in-memory bytes per cell of a merged frame (8-byte numerics and
+# dates, categorical codes, merge temporaries)
+BYTES_PER_CELL = 16
+MIN_CHUNK_ROWS = 10_000
 
-        "pain_mobility_corr":
-            full[["painscore", "mobilityscore"]].corr().reset_index(),
+STREAMING_AGGREGATES = {}
+
+
+def register_streaming_aggregate(op):
+    """
+    Register a class with update(df) and result() that folds an aggregate
+    chunk by chunk, so the op can run in out-of-core mode.
+    """
+    def wrap(cls):
+        STREAMING_AGGREGATES[op] = cls
+        return cls
+    return wrap
+
+
+class _GroupedPartial(ABC):
+    """Keeps per-group partial columns, combined after every chunk."""
+
+    def __init__(self, by, **_):
+        self.by = by
+        self.state = None
+
+    @abstractmethod
+    def partial(self, df):
+        """Per-group partial columns of one chunk, indexed by group."""
+
+    def update(self, df):
+        self._fold(self.partial(df))
+
+    def merge(self, other):
+        """Fold in the partial state of the same aggregate over other rows."""
+        if other.state is not None:
+            self._fold(other.state)
+
+    def _fold(self, part):
+        if self.state is not None:
+            part = pd.concat([self.state, part]).groupby(level=0).sum()
+        self.state = part
+
+
+@register_streaming_aggregate("mean")
+class StreamingMean(_GroupedPartial):
+    def __init__(self, by, column, **_):
+        super().__init__(by)
+        self.column = column
+
+    def partial(self, df):
+        g = df.groupby(self.by, observed=True)[self.column]
+        return pd.DataFrame({"sum": g.sum(), "count": g.count()})
+
+    def result(self):
+        s = self.state
+        return (s["sum"] / s["count"]).rename(self.column).reset_index()
+
+
+@register_streaming_aggregate("sum")
+class StreamingSum(_GroupedPartial):
+    def __init__(self, by, column, **_):
+        super().__init__(by)
+        self.column = column
+
+    def partial(self, df):
+        return df.groupby(self.by, observed=True)[[self.column]].sum()
+
+    def result(self):
+        return self.state.reset_index()
+
+
+@register_streaming_aggregate("count")
+class StreamingCount(_GroupedPartial):
+    def __init__(self, by, name="count", **_):
+        super().__init__(by)
+        self.name = name
+
+    def partial(self, df):
+        return df.groupby(self.by, observed=True).size().to_frame(self.name)
+
+    def result(self):
+        return self.state.reset_index()
+
+
+@register_streaming_aggregate("corr")
+class StreamingCorr:
+    """
+    Pearson correlation matrix over pairwise-complete rows, like
+    DataFrame.corr, folded with the parallel co-moment update of
+    Chan et al. so chunks merge without loss of stability.
+    """
+
+    def __init__(self, columns, **_):
+        self.columns = columns
+        k = len(columns)
+        # per pair (i, j): n, mean_i, mean_j, M2_i, M2_j, C_ij
+        self.n = np.zeros((k, k))
+        self.mean_i = np.zeros((k, k))
+        self.mean_j = np.zeros((k, k))
+        self.m2_i = np.zeros((k, k))
+        self.m2_j = np.zeros((k, k))
+        self.c = np.zeros((k, k))
+
+    def update(self, df):
+        values = df[self.columns].to_numpy(dtype="float64")
+
+        for i in range(len(self.columns)):
+            for j in range(i + 1):
+                x, y = values[:, i], values[:, j]
+                ok = ~(np.isnan(x) | np.isnan(y))
+                nb = ok.sum()
+                if not nb:
+                    continue
+
+                x, y = x[ok], y[ok]
+                mx, my = x.mean(), y.mean()
+                dx, dy = x - mx, y - my
+                self._merge(i, j, nb, mx, my, dx @ dx, dy @ dy, dx @ dy)
+
+    def merge(self, other):
+        for i in range(len(self.columns)):
+            for j in range(i + 1):
+                if other.n[i, j]:
+                    self._merge(
+                        i, j, other.n[i, j],
+                        other.mean_i[i, j], other.mean_j[i, j],
+                        other.m2_i[i, j], other.m2_j[i, j], other.c[i, j],
+                    )
+
+    def _merge(self, i, j, nb, mx, my, m2x, m2y, cxy):
+        na = self.n[i, j]
+        n = na + nb
+        delta_x = mx - self.mean_i[i, j]
+        delta_y = my - self.mean_j[i, j]
+        w = na * nb / n
+
+        self.mean_i[i, j] += delta_x * nb / n
+        self.mean_j[i, j] += delta_y * nb / n
+        self.m2_i[i, j] += m2x + delta_x * delta_x * w
+        self.m2_j[i, j] += m2y + delta_y * delta_y * w
+        self.c[i, j] += cxy + delta_x * delta_y * w
+        self.n[i, j] = n
+
+    def result(self):
+        k = len(self.columns)
+        out = np.full((k, k), np.nan)
+
+        for i in range(k):
+            for j in range(i + 1):
+                divisor = np.sqrt(self.m2_i[i, j] * self.m2_j[i, j])
+                if self.n[i, j] >= 1 and divisor != 0:
+                    out[i, j] = out[j, i] = self.c[i, j] / divisor
+
+        return pd.DataFrame(out, index=self.columns, columns=self.columns).reset_index()
+
+
+@register_streaming_aggregate("welch_pairs")
+class StreamingWelchPairs:
+    def __init__(self, by, column, **_):
+        self.by = by
+        self.column = column
+        self.moments = None
+
+    def update(self, df):
+        self._fold(GroupMoments.from_values(df[self.by], df[self.column]))
+
+    def merge(self, other):
+        if other.moments is not None:
+            self._fold(other.moments)
+
+    def _fold(self, moments):
+        self.moments = moments if self.moments is None else self.moments.merge(moments)
+
+    def result(self):
+        return welch_pairs(self.moments, self.by, self.column)
+
+
+@register_streaming_aggregate("group_corr")
+class StreamingGroupCorr:
+    def __init__(self, by, columns, **_):
+        self.by = by
+        self.columns = columns
+        self.comoments = None
+
+    def update(self, df):
+        self._fold(group_comoments(df, self.by, self.columns))
+
+    def merge(self, other):
+        if other.comoments is not None:
+            self._fold(other.comoments)
+
+    def _fold(self, comoments):
+        if self.comoments is not None:
+            comoments = merge_comoments(self.comoments, comoments)
+        self.comoments = comoments
+
+    def result(self):
+        return corr_frame(self.comoments, self.by, self.columns)
+
+
+def streamable(p, role):
+    """
+    Whether joining chunks of role with the other inputs, whole, gives
+    the full join's rows. Role must enter the join as the right side of
+    an inner equality join (or be the base), and every join after that
+    must be inner or left with role's rows on its left side. An as-of
+    match needs every right row, so role can never be an as-of right.
+    """
+    left = {p["base"]}
+
+    for j in p["joins"]:
+        if role in left:
+            if j.get("how", "inner") not in ("inner", "left"):
+                return False
+        elif j["right"] == role:
+            if j.get("how", "inner") != "inner" or j.get("method", "merge") == "asof":
+                return False
+        left.add(j["right"])
+
+    return True
+
+
+def streaming_role(p, data_dir):
+    """
+    The largest input the plan can be run chunk by chunk over (see
+    streamable), or None. Every aggregate must have a streaming form.
+    """
+    if any(r["op"] not in STREAMING_AGGREGATES for r in p["results"].values()):
+        return None
+
+    rows = {role: table_rows(data_dir, role) for role in p["roles"]}
+    for role in sorted(rows, key=rows.get, reverse=True):
+        if streamable(p, role):
+            return role
+
+    return None
+
+
+def estimate_bytes(p, data_dir):
+    """Rough peak memory of running the plan fully in memory."""
+    rows = max(table_rows(data_dir, role) for role in p["roles"])
+    cells = sum(len(cols) for cols in p["roles"].values())
+    return rows * cells * BYTES_PER_CELL
+
+
+def execute_streaming(p, data_dir, role, start_date=None, end_date=None,
+                      memory_budget_bytes=ANALYSIS_MEMORY_BUDGET_MB * 1024 * 1024):
+    """
+    Out-of-core run: the other inputs stay in memory, the streamed role is
+    read in chunks sized to the budget, and each chunk's joined, filtered
+    rows are folded into mergeable partial aggregates.
+    """
+    resident = {
+        r: load_table(data_dir, r, cols)
+        for r, cols in p["roles"].items()
+        if r != role
     }
+    resident_bytes = sum(
+        df.memory_usage(deep=True).sum() for df in resident.values()
+    )
+
+    cells = sum(len(cols) for cols in p["roles"].values())
+    chunk_rows = max(
+        MIN_CHUNK_ROWS,
+        int((memory_budget_bytes - resident_bytes) // (cells * BYTES_PER_CELL)),
+    )
+
+    aggregates = {
+        name: STREAMING_AGGREGATES[r["op"]](**r)
+        for name, r in p["results"].items()
+    }
+
+    for chunk in iter_table(data_dir, role, p["roles"][role], chunk_rows):
+        ROWS.inc(len(chunk), analysis=p["key"], role=role)
+        full = apply_joins(p, {**resident, role: chunk})
+        full = apply_filters(p, full, start_date, end_date)
+
+        for agg in aggregates.values():
+            agg.update(full)
+
+    return {name: agg.result() for name, agg in aggregates.items()}
+
+
+# ---------- PARALLEL ----------
+# 0 means one worker per core
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "0")) or os.cpu_count() or 1
+ANALYSIS_START_METHOD = os.environ.get("ANALYSIS_START_METHOD", "forkserver")
+
+# below this many rows the pool costs more than it saves
+PARALLEL_MIN_ROWS = int(os.environ.get("PARALLEL_MIN_ROWS", "500000"))
+
+
+def _pool_context():
+    ctx = multiprocessing.get_context(ANALYSIS_START_METHOD)
+    if ANALYSIS_START_METHOD == "forkserver":
+        # workers fork from a server that already imported pandas
+        ctx.set_forkserver_preload(["analysis_engine"])
+    return ctx
+
+
+def partition_key(p):
+    """
+    A column every join matches on both sides (patientid when it
+    qualifies). Hash-partitioning every role on it keeps each join
+    partition-local, whatever the join type.
+    """
+    keys = None
+    for j in p["joins"]:
+        left = j.get("on") or j["left_on"]
+        right = j.get("on") or j["right_on"]
+        same = {l for l, r in zip(left, right) if l == r}
+        keys = same if keys is None else keys & same
+
+    if not keys:
+        return None
+    return "patientid" if "patientid" in keys else sorted(keys)[0]
+
+
+def _partition_codes(values, parts):
+    if pd.api.types.is_numeric_dtype(values):
+        # int and float copies of the same id must land together
+        values = values.astype("float64")
+    hashed = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    return (hashed % np.uint64(parts)).astype("int64")
+
+
+def split_frames(frames, key, parts):
+    """Hash-partition every frame on key; without a key, by row position."""
+    out = [{} for _ in range(parts)]
+
+    for role, df in frames.items():
+        if key:
+            codes = _partition_codes(df[key], parts)
+        else:
+            codes = np.arange(len(df)) % parts
+
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(parts + 1))
+        df = df.iloc[order]
+
+        for i in range(parts):
+            out[i][role] = df.iloc[bounds[i]:bounds[i + 1]]
+
+    return out
+
+
+def _run_partition(p, frames, start_date, end_date):
+    # a pool worker's registry is never scraped, so its observations go
+    # back with the partials and are recorded by the parent
+    with metrics.captured() as observations:
+        with STAGE_SECONDS.time(stage="join", mode="parallel"):
+            full = apply_joins(p, frames)
+        with STAGE_SECONDS.time(stage="filter", mode="parallel"):
+            full = apply_filters(p, full, start_date, end_date)
+
+        aggregates = {
+            name: STREAMING_AGGREGATES[r["op"]](**r)
+            for name, r in p["results"].items()
+        }
+        for name, agg in aggregates.items():
+            r = p["results"][name]
+            with AGGREGATE_SECONDS.time(analysis=p["key"], output=name, op=r["op"]):
+                agg.update(full)
+
+    return aggregates, observations
+
+
+def parallel_ready(p):
+    if any(r["op"] not in STREAMING_AGGREGATES for r in p["results"].values()):
+        return False
+    return not p["joins"] or partition_key(p) is not None
+
+
+def execute_parallel(p, data_dir, workers, start_date=None, end_date=None):
+    """
+    Hash-partition the inputs on the join key, run joins, filters and
+    partial aggregates for each partition in its own process, then merge
+    the partials.
+    """
+    frames = load_inputs(p, data_dir, workers)
+    parts = split_frames(frames, partition_key(p), workers)
+    del frames
+
+    with ProcessPoolExecutor(workers, mp_context=_pool_context()) as pool:
+        partials = list(pool.map(
+            _run_partition,
+            [p] * workers,
+            parts,
+            [start_date] * workers,
+            [end_date] * workers,
+        ))
+
+    for _, observations in partials:
+        for observation in observations:
+            metrics.apply(*observation)
+
+    merged = partials[0][0]
+    for other, _ in partials[1:]:
+        for name, agg in merged.items():
+            agg.merge(other[name])
+
+    return {name: agg.result() for name, agg in merged.items()}
+
+
+# ---------- ROLLUPS ----------
+ROLLUP_OPS = {"mean", "sum", "count"}
+
+
+def rollup_role(p, data_dir):
+    """
+    The role whose upload-time rollup can answer every result of this
+    plan, or None. That requires a single inner join on patient id, a
+    date_range filter on the visit date only, and mean/sum/count of the
+    charge column.
+    """
+    if len(p["joins"]) != 1:
+        return None
+
+    j = p["joins"][0]
+    if j.get("how", "inner") != "inner" or j.get("on") != ["patientid"]:
+        return None
+
+    if any(f["type"] != "date_range" or f["column"] != ROLLUP_DATE for f in p["filters"]):
+        return None
+
+    for r in p["results"].values():
+        if r["op"] not in ROLLUP_OPS:
+            return None
+        if r["op"] != "count" and r.get("column") != ROLLUP_VALUE:
+            return None
+
+    for role in p["rollup_roles"]:
+        if role in (j["left"], j["right"]) and os.path.exists(
+            os.path.join(data_dir, f"{role}.rollup.parquet")
+        ):
+            return role
+
+    return None
+
+
+def execute_from_rollup(p, data_dir, role, start_date=None, end_date=None):
+    j = p["joins"][0]
+    other = j["right"] if role == j["left"] else j["left"]
+
+    rollup = VisitRollup.load(os.path.join(data_dir, f"{role}.rollup.parquet"))
+    per_patient = rollup.per_patient(start_date, end_date)
+
+    frame = load_table(data_dir, other, p["roles"][other])
+    full = frame.merge(per_patient, on="patientid", how="inner")
+
+    results = {}
+    for name, r in p["results"].items():
+        if r["op"] == "mean":
+            g = full.groupby(r["by"], observed=True)[["charge_sum", "charge_count"]].sum()
+            out = (g["charge_sum"] / g["charge_count"]).rename(r["column"])
+        elif r["op"] == "sum":
+            out = full.groupby(r["by"], observed=True)["charge_sum"].sum().rename(r["column"])
+        else:
+            out = full.groupby(r["by"], observed=True)["visits"].sum().rename(r.get("name", "count"))
+
+        results[name] = out.reset_index()
+
+    return results
 
-    save_results(results, out_dir)
 
 # ---------- SAVE ----------
-def save_results(results, out_dir):
+def save_results(results, out_dir, progress=None):
     os.makedirs(out_dir, exist_ok=True)
-    for name, df in results.items():
+    for i, (name, df) in enumerate(results.items(), 1):
         df.to_csv(os.path.join(out_dir, f"{name}.csv"), index=False)
+        if progress:
+            progress(name, i, len(results))
 
 
 # ---------- MAIN ----------
-def run_analysis(analysis_key, data_dir, out_dir, start_date=None, end_date=None):
-    if analysis_key == "basic_clinic":
-        return run_basic_clinic(data_dir, out_dir, start_date, end_date)
+def run_analysis(analysis_key, data_dir, out_dir, start_date=None, end_date=None,
+                 memory_budget_mb=None, workers=None, progress=None):
+    """
+    memory_budget_mb (default ANALYSIS_MEMORY_BUDGET_MB) switches to the
+    chunked out-of-core mode when the in-memory run would exceed it;
+    0 disables that check. workers (default ANALYSIS_WORKERS) spreads
+    large in-memory runs over that many processes. progress(name, done,
+    total) is called as each output is written.
+    """
+    if analysis_key not in ANALYSES:
+        raise ValueError(f"Unknown analysis: {analysis_key}")
+
+    if memory_budget_mb is None:
+        memory_budget_mb = ANALYSIS_MEMORY_BUDGET_MB
+    budget = memory_budget_mb * 1024 * 1024
+
+    if workers is None:
+        workers = ANALYSIS_WORKERS
 
-    if analysis_key == "clinic_outcomes":
-        return run_clinic_outcomes(data_dir, out_dir, start_date, end_date)
+    p = plan(analysis_key)
+
+    stream = None
+    role = rollup_role(p, data_dir)
+    if not role and budget and estimate_bytes(p, data_dir) > budget:
+        stream = streaming_role(p, data_dir)
+        if not stream:
+            log.warning("%s: over the memory budget but no input can be streamed", analysis_key)
+
+    if role:
+        mode, run = "rollup", lambda: execute_from_rollup(p, data_dir, role, start_date, end_date)
+    elif stream:
+        mode, run = "streaming", lambda: execute_streaming(
+            p, data_dir, stream, start_date, end_date, budget
+        )
+    elif (
+        workers > 1
+        and parallel_ready(p)
+        and max(table_rows(data_dir, r) for r in p["roles"]) >= PARALLEL_MIN_ROWS
+    ):
+        mode, run = "parallel", lambda: execute_parallel(p, data_dir, workers, start_date, end_date)
+    elif compact_ready(p):
+        mode, run = "compact", lambda: execute_compact(p, data_dir, start_date, end_date)
+    else:
+        mode, run = "memory", lambda: execute(p, data_dir, start_date, end_date)
 
-    raise ValueError(f"Unknown analysis: {analysis_key}")
+    with STAGE_SECONDS.time(stage="compute", mode=mode):
+        results = run()
 
+    with STAGE_SECONDS.time(stage="write_results"):
+        save_results(results, out_dir, progress)
@@ -1,50 +1,140 @@
-ANALYSES = {
-    "basic_clinic": {
-        "label": "Basic Clinic Analysis",
-        "outputs": [
-            "Average service charge by insurance",
-            "Revenue by city",
-            "Visit counts per patient"
-        ],
-        "files": {
-            "patients": {
-                "required_columns": [
-                    "patient_id", "insurance", "dob", "city", "state"
-                ]
-            },
-            "visits": {
-                "required_columns": [
-                    "patient_id", "visit_date", "service_charge"
-                ]
-            },
+# Each analysis declares what it needs and the engine plans the rest:
+#
+#   files        role -> required_columns, checked at upload and before a run
+#   joins        merge steps; the first step's "left" role is the base frame.
+#                "method" picks the join: "merge" (DataFrame.merge, default),
+#                "sorted" (sort-based equality join) or "asof" (nearest
+#                match on the last key within "tolerance", "direction"
+#                nearest/backward/forward; the other keys match exactly)
+#   filters      row filters applied to the merged frame
+#   results      output name -> aggregate ({"op", "by", "column(s)", "name"})
+#   rollup_roles roles that may be answered from upload-time rollups
+#
+# Column names are written as users see them and normalized with
+# column_normalization.normalize_col wherever they are used.
+
+ANALYSES = {}
+
+
+def register_analysis(key, spec):
+    """Add an analysis, checking that its joins only reference its files."""
+    roles = set(spec["files"])
+
+    for step in spec.get("joins", []):
+        for side in ("left", "right"):
+            if side in step and step[side] not in roles:
+                raise ValueError(f"{key}: join references unknown role {step[side]!r}")
+
+    if spec.get("joins") and "left" not in spec["joins"][0]:
+        raise ValueError(f"{key}: first join step must name its left role")
+
+    if not spec.get("results"):
+        raise ValueError(f"{key}: no results declared")
+
+    ANALYSES[key] = spec
+    return spec
+
+
+register_analysis("basic_clinic", {
+    "label": "Basic Clinic Analysis",
+    "outputs": [
+        "Average service charge by insurance",
+        "Revenue by city",
+        "Visit counts per patient"
+    ],
+    "files": {
+        "patients": {
+            "required_columns": [
+                "patient_id", "insurance", "dob", "city", "state"
+            ]
         },
+        "visits": {
+            "required_columns": [
+                "patient_id", "visit_date", "service_charge"
+            ]
+        },
+    },
+    "joins": [
+        {
+            "left": "patients",
+            "right": "visits",
+            "on": ["patient_id"],
+            "how": "inner",
+            "method": "sorted",
+        },
+    ],
+    "filters": [
+        {"type": "date_range", "column": "visit_date"},
+    ],
+    "results": {
+        "avg_charge_by_insurance":
+            {"op": "mean", "by": "insurance", "column": "service_charge"},
+        "revenue_by_city":
+            {"op": "sum", "by": "city", "column": "service_charge"},
+        "visit_counts":
+            {"op": "count", "by": "patient_id", "name": "visit_count"},
     },
+    "rollup_roles": ["visits"],
+})
 
-    "clinic_outcomes": {
-        "label": "Clinic Outcomes Analysis",
-        "outputs": [
-            "Average pain score by insurance",
-            "Pain vs mobility correlation"
-        ],
-        "files": {
-            "patients": {
-                "required_columns": [
-                    "patient_id", "insurance", "dob"
-                ]
-            },
-            "visits": {
-                "required_columns": [
-                    "patient_id", "visit_date", "service_charge"
-                ]
-            },
-            "metrics": {
-                "required_columns": [
-                    "patient_id",
-                    "metric_date",
-                    "pain_score",
-                    "mobility_score"
-                ]
-            },
+
+register_analysis("clinic_outcomes", {
+    "label": "Clinic Outcomes Analysis",
+    "outputs": [
+        "Average pain score by insurance",
+        "Pain vs mobility correlation",
+        "Service charge t-tests between insurers",
+        "Pain vs mobility correlation per insurer"
+    ],
+    "files": {
+        "patients": {
+            "required_columns": [
+                "patient_id", "insurance", "dob"
+            ]
+        },
+        "visits": {
+            "required_columns": [
+                "patient_id", "visit_date", "service_charge"
+            ]
+        },
+        "metrics": {
+            "required_columns": [
+                "patient_id",
+                "metric_date",
+                "pain_score",
+                "mobility_score"
+            ]
+        },
+    },
+    "joins": [
+        {
+            "left": "visits",
+            "right": "patients",
+            "on": ["patient_id"],
+            "how": "left",
+            "method": "sorted",
+        },
+        {
+            # metrics taken a day either side of a visit still count
+            "right": "metrics",
+            "left_on": ["patient_id", "visit_date"],
+            "right_on": ["patient_id", "metric_date"],
+            "how": "left",
+            "method": "asof",
+            "tolerance": "1D",
         },
+    ],
+    "filters": [
+        {"type": "date_range", "column": "visit_date"},
+    ],
+    "results": {
+        "avg_pain_by_insurance":
+            {"op": "mean", "by": "insurance", "column": "pain_score"},
+        "pain_mobility_corr":
+            {"op": "corr", "columns": ["pain_score", "mobility_score"]},
+        "charge_ttests_by_insurance":
+            {"op": "welch_pairs", "by": "insurance", "column": "service_charge"},
+        "pain_mobility_corr_by_insurance":
+            {"op": "group_corr", "by": "insurance", "columns": ["pain_score", "mobility_score"]},
     },
-}
+})
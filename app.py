@@ -1,19 +1,39 @@
 import os
-import shutil
-from fastapi import FastAPI, UploadFile, File
-
-from analysis_engine import run_analysis
-from b2_storage import upload_file, download_file, generate_signed_url, delete_file
+import queue
+import asyncio
+import time
+from fastapi import FastAPI, UploadFile, File, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
+from fastapi.concurrency import run_in_threadpool
+
+import b2_storage
+import result_cache
+import supabase_client
+import result_publisher
+from b2_storage import upload_file, generate_signed_url, adelete_file, run_async
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Depends
 from auth import get_user_id
-from supabase_client import supabase
+from supabase_client import supabase, async_supabase
 from datetime import datetime
 from fastapi import HTTPException
-import pandas as pd
 from analysis_registry import ANALYSES
 from fastapi import Body
-from column_normalization import normalize_list, normalize_columns
+from jobs import JobQueue
+from job_events import make_bus, stream_events
+import direct_uploads
+import blob_store
+from direct_uploads import UploadValidator
+from workspace import workspaces
+from columnar_store import columnar_path
+from rollups import build_rollup, rollup_path
+from ingest import ingest_csv, MissingColumns, InconsistentColumn
+from schema_check import check_schema, schema_error_message, stored_schema
+from metadata import list_cache
+import auth
+import metrics
+from metrics import STAGE_SECONDS, HTTP_SECONDS
+from profiling import should_profile
 
 
 
@@ -36,16 +56,156 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+event_bus = make_bus()
+job_queue = JobQueue(supabase, b2_storage, events=event_bus)
+upload_validator = UploadValidator(supabase, b2_storage)
+
+
+# ---------- METRICS ----------
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    if not metrics.METRICS_ENABLED:
+        return await call_next(request)
+
+    t0 = time.perf_counter()
+    response = await call_next(request)
+
+    # label by route template, not the raw path, to keep series bounded
+    route = request.scope.get("route")
+    HTTP_SECONDS.observe(
+        time.perf_counter() - t0,
+        method=request.method,
+        route=route.path if route else "unmatched",
+        status=response.status_code,
+    )
+    return response
+
+
+@metrics.register_collector
+def collect_live_state():
+    metrics.JOBS_RUNNING.set(job_queue.running())
+    metrics.JOBS_QUEUED.set(job_queue.pending())
+    metrics.cache_stats("input", b2_storage.input_cache.stats())
+    metrics.cache_stats("list", list_cache.stats())
+    metrics.cache_stats("token", auth.token_cache.stats())
+
+
+@app.get("/metrics")
+def metrics_endpoint(request: Request):
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404)
+
+    client = request.client.host if request.client else None
+    if not metrics.scrape_allowed(client, request.headers.get("authorization")):
+        raise HTTPException(status_code=403)
+
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.on_event("startup")
+def start_job_queue():
+    job_queue.start()
+    upload_validator.start()
 
-DATA_DIR = "/tmp/data"
-OUT_DIR = "/tmp/output"
 
-os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(OUT_DIR, exist_ok=True)
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await run_in_threadpool(job_queue.stop)
+    await run_in_threadpool(upload_validator.stop)
+    await event_bus.close()
+    await supabase_client.close()
+
+
+def store_upload(ws, csv_path, parquet_path, remote_path):
+    """Upload a cleaned CSV with its Parquet copy and, for visits, its rollup."""
+    upload_file(csv_path, remote_path)
+    upload_file(parquet_path, columnar_path(remote_path))
+
+    rollup = ws.path(os.path.basename(rollup_path(csv_path)))
+    if build_rollup(parquet_path, rollup):
+        upload_file(rollup, rollup_path(remote_path))
+
+
+def ingest_upload(file, remote_path, **ingest_args):
+    """
+    Stream an uploaded CSV into a cleaned CSV plus typed Parquet copy and
+    store them. Blocking; async endpoints run it on the thread pool.
+    Returns the detected columns.
+    """
+    with workspaces.workspace("upload") as ws:
+        tmp_path = ws.path(os.path.basename(remote_path))
+        parquet_path = columnar_path(tmp_path)
+
+        with STAGE_SECONDS.time(stage="csv_parse"):
+            columns, _ = ingest_csv(
+                file.file,
+                tmp_path,
+                parquet_path,
+                on_chunk=lambda _: ws.check_quota(),
+                **ingest_args,
+            )
+
+        with STAGE_SECONDS.time(stage="upload"):
+            store_upload(ws, tmp_path, parquet_path, remote_path)
+
+    return columns
+
+
+def store_blob(file, user_id, digest, variant, schema, **ingest_args):
+    """
+    ingest_upload into a new blob for digest and register it. Blocking.
+    Returns the file_blobs row the upload now references.
+    """
+    path = blob_store.blob_path(user_id, digest, variant)
+    columns = ingest_upload(file, path, **ingest_args)
+
+    return blob_store.register(
+        supabase, b2_storage, user_id, digest, variant, path, columns, stored_schema(schema)
+    )
+
+
+async def release_upload(blob_id, storage_path):
+    """
+    Drop a user_files row's hold on its stored objects, deleting them
+    once nothing references them. Rows without a blob own their objects.
+    """
+    if blob_id:
+        storage_path = await run_in_threadpool(blob_store.release, supabase, blob_id)
+
+    if storage_path:
+        await asyncio.gather(*(adelete_file(key) for key in blob_store.blob_objects(storage_path)))
+
+
+async def record_upload(user_id, filename, blob):
+    """Insert the user_files row for an upload stored as blob. Returns its id."""
+    try:
+        result = await async_supabase.table("user_files").insert({
+            "user_id": user_id,
+            "filename": filename,
+            "storage_path": blob["storage_path"],
+            "detected_columns": blob["detected_columns"],
+            "inferred_schema": blob["inferred_schema"],
+            "blob_id": blob["id"],
+        }).execute()
+    except Exception as e:
+        print("UPLOAD RECORD ERROR:", repr(e))
+        result = None
+
+    if not result or not result.data:
+        await release_upload(blob["id"], blob["storage_path"])
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to record uploaded file"
+        )
+
+    list_cache.invalidate("files", user_id)
+    return result.data[0]["id"]
 
 
 @app.post("/upload")
-def upload_csv(
+async def upload_csv(
     analysis_key: str,
     file_role: str,
     file: UploadFile = File(...),
@@ -63,60 +223,47 @@ def upload_csv(
     if file_role not in analysis["files"]:
         raise HTTPException(status_code=400, detail="Invalid file role")
 
-    # 3. read csv + normalize columns
-    df = pd.read_csv(file.file)
-    df.columns = [c.lower() for c in df.columns]
-
-    # 4. validate required columns
-    required = [
-        c.lower()
-        for c in analysis["files"][file_role]["required_columns"]
-    ]
-
-    missing = [c for c in required if c not in df.columns]
+    # 3. header-only schema check before touching the body
+    schema = await run_in_threadpool(
+        check_schema, file.file, analysis["files"][file_role]["required_columns"]
+    )
 
-    if missing:
+    if not schema["ok"]:
         raise HTTPException(
             status_code=400,
-            detail=f"Missing required columns: {missing}",
+            detail=schema_error_message(schema),
         )
 
-    # 5. save normalized csv
-    os.makedirs("/tmp", exist_ok=True)
-    tmp_path = f"/tmp/{file_role}.csv"
-    df.to_csv(tmp_path, index=False)
-
-    # 6. upload to storage
-    remote_path = f"raw/{user_id}/{analysis_key}/{file_role}.csv"
-    upload_file(tmp_path, remote_path)
+    # 4. the same bytes uploaded before: reference the stored blob
+    digest = await run_in_threadpool(blob_store.content_hash, file.file)
+    blob = await run_in_threadpool(blob_store.reuse, supabase, user_id, digest, "analysis")
+    deduplicated = blob is not None
 
+    # 5. otherwise stream csv: normalize columns, write csv + typed
+    #    columnar copy chunk by chunk, then multipart upload to storage
+    if not deduplicated:
+        try:
+            blob = await run_in_threadpool(store_blob, file, user_id, digest, "analysis", schema)
+        except (MissingColumns, InconsistentColumn) as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    result = supabase.table("user_files").insert({
-        "user_id": user_id,
-        "filename": file.filename or "uploaded.csv",
-        "storage_path": remote_path,
-        "detected_columns": list(df.columns),
-    }).execute()
-
-    if not result.data:
-        raise HTTPException(
-            status_code=500,
-            detail="Failed to record uploaded file"
-        )
+    file_id = await record_upload(user_id, file.filename or "uploaded.csv", blob)
 
     return {
         "status": "uploaded",
-        "file_id": result.data[0]["id"],
+        "file_id": file_id,
         "filename": file.filename,
+        "deduplicated": deduplicated,
     }
 
 
 
 @app.post("/analyze")
-def analyze(
+async def analyze(
     analysis_key: str = None,
     start_date: str = None,
     end_date: str = None,
+    profile: bool = False,
     body: dict = Body(default=None),
     user_id: str = Depends(get_user_id),
 ):
@@ -125,151 +272,116 @@ def analyze(
         analysis_key = body.get("analysis_key", analysis_key)
         start_date = body.get("start_date", start_date)
         end_date = body.get("end_date", end_date)
+        profile = body.get("profile", profile)
         selected_files = body.get("files")
     else:
         selected_files = None
 
+    # profiled jobs always run, so they never come from the result cache
+    profile = should_profile(profile)
+
     if not analysis_key or analysis_key not in ANALYSES:
         raise HTTPException(status_code=400, detail="Unknown analysis")
-    
-    # 1. create job
-    job = supabase.table("analysis_jobs").insert({
-        "user_id": user_id,
-        "status": "running",
-        "start_date": start_date,
-        "end_date": end_date,
-    }).execute()
-
-    job_id = job.data[0]["id"]
-
-
-
-    analysis = ANALYSES[analysis_key]
-
-    try:
-        # clean output dir per job
-        for f in os.listdir(OUT_DIR):
-            os.remove(os.path.join(OUT_DIR, f))
-
-        # ensure inputs exist locally
-        os.makedirs(DATA_DIR, exist_ok=True)
-
-        required_roles = set(ANALYSES[analysis_key]["files"].keys())
-
-        if not selected_files:
-            raise HTTPException(400, "No files selected")
-
-        missing_roles = [
-            r for r in required_roles
-            if r not in selected_files or not selected_files[r]
-        ]
-
-        if missing_roles:
-            raise HTTPException(
-                400,
-                f"Missing files for roles: {missing_roles}"
-            )
-
-        # now download files (guaranteed to exist)
-        for role, file_id in selected_files.items():
-            row = (
-                supabase
-                .table("user_files")
-                .select("storage_path")
-                .eq("id", file_id)
-                .eq("user_id", user_id)
-                .single()
-                .execute()
-            )
-
-            download_file(
-                row.data["storage_path"],
-                os.path.join(DATA_DIR, f"{role}.csv"),
-            )
-
-        analysis = ANALYSES[analysis_key]
 
-        for role, cfg in analysis["files"].items():
-            path = os.path.join(DATA_DIR, f"{role}.csv")
-
-            if not os.path.exists(path):
-                raise HTTPException(400, f"Missing file for role: {role}")
+    required_roles = set(ANALYSES[analysis_key]["files"].keys())
 
-            df = pd.read_csv(path)
-            df = normalize_columns(df)
+    if not selected_files:
+        raise HTTPException(400, "No files selected")
 
-            required = normalize_list(cfg["required_columns"])
-            missing = [c for c in required if c not in df.columns]
+    missing_roles = [
+        r for r in required_roles
+        if r not in selected_files or not selected_files[r]
+    ]
 
-            if missing:
-                supabase.table("analysis_jobs").update({
-                    "status": "failed",
-                    "error": f"{role} missing columns: {missing}",
-                    "finished_at": datetime.utcnow().isoformat(),
-                }).eq("id", job_id).execute()
+    if missing_roles:
+        raise HTTPException(
+            400,
+            f"Missing files for roles: {missing_roles}"
+        )
 
-                return {
-                    "job_id": job_id,
-                    "error": f"{role} missing columns: {missing}",
-                }
+    # 1. reuse the outputs of an identical earlier run
+    fingerprint = None
+    cached = None
 
-        # run analysis ONCE
+    if not profile:
         try:
-            run_analysis(
-                analysis_key,
-                DATA_DIR,
-                OUT_DIR,
-                start_date=start_date,
-                end_date=end_date,
-            )
-
+            with STAGE_SECONDS.time(stage="metadata_lookup"):
+                versions = await run_in_threadpool(
+                    result_cache.input_versions, supabase, b2_storage, user_id, selected_files
+                )
+            if versions:
+                fingerprint = result_cache.fingerprint(
+                    user_id, analysis_key, versions, start_date, end_date
+                )
+                cached = await run_in_threadpool(result_cache.lookup, supabase, fingerprint)
         except Exception as e:
-            supabase.table("analysis_jobs").update({
-                "status": "failed",
-                "error": str(e),
-                "finished_at": datetime.utcnow().isoformat(),
-            }).eq("id", job_id).execute()
-
-            raise HTTPException(status_code=400, detail=str(e))
+            print("RESULT CACHE ERROR:", repr(e))
 
-
-
-        # upload results
-        job_prefix = f"results/{job_id}"
-        uploaded_files = []
-
-        for fname in os.listdir(OUT_DIR):
-            upload_file(
-                os.path.join(OUT_DIR, fname),
-                f"{job_prefix}/{fname}",
-            )
-            uploaded_files.append(fname)
-
-        # mark complete
-        supabase.table("analysis_jobs").update({
+    if cached:
+        job = await async_supabase.table("analysis_jobs").insert({
+            "user_id": user_id,
             "status": "completed",
+            "start_date": start_date,
+            "end_date": end_date,
             "finished_at": datetime.utcnow().isoformat(),
-            "result_files": uploaded_files,
-        }).eq("id", job_id).execute()
+            "result_files": cached["result_files"],
+            "result_prefix": cached["result_prefix"],
+            "result_manifest": cached.get("result_manifest"),
+        }).execute()
+        list_cache.invalidate("jobs", user_id)
+
+        return {
+            "job_id": job.data[0]["id"],
+            "status": "completed",
+            "cached": True,
+        }
 
-        return {"job_id": job_id}
+    # 2. create job; the row carries everything needed to run it, so
+    #    another process can pick it up if this one goes away
+    job = {
+        "user_id": user_id,
+        "analysis_key": analysis_key,
+        "files": selected_files,
+        "start_date": start_date,
+        "end_date": end_date,
+        "fingerprint": fingerprint,
+        "profile": profile,
+    }
+    with STAGE_SECONDS.time(stage="job_insert"):
+        inserted = await async_supabase.table("analysis_jobs").insert(
+            job_queue.new_row(job)
+        ).execute()
 
-    except Exception as e:
-        # 4. mark failed
-        supabase.table("analysis_jobs").update({
+    job_id = inserted.data[0]["id"]
+    list_cache.invalidate("jobs", user_id)
+
+    # 3. hand off to the worker pool
+    try:
+        job_queue.submit({"job_id": job_id, **job})
+    except queue.Full:
+        await async_supabase.table("analysis_jobs").update({
             "status": "failed",
-            "error": str(e),
+            "error": "Job queue is full",
             "finished_at": datetime.utcnow().isoformat(),
         }).eq("id", job_id).execute()
 
-        raise
+        raise HTTPException(
+            status_code=503,
+            detail="Too many queued analyses, try again later",
+        )
+
+    return {"job_id": job_id, "status": "queued"}
 
 
 
 @app.get("/jobs")
-def list_jobs(user_id: str = Depends(get_user_id)):
-    res = (
-        supabase
+async def list_jobs(user_id: str = Depends(get_user_id)):
+    cached = list_cache.get("jobs", user_id)
+    if cached is not None:
+        return cached
+
+    res = await (
+        async_supabase
         .table("analysis_jobs")
         .select(
             "id,status,start_date,end_date,created_at,finished_at,error,result_files"
@@ -279,18 +391,104 @@ def list_jobs(user_id: str = Depends(get_user_id)):
         .execute()
     )
 
+    list_cache.put("jobs", user_id, res.data)
     return res.data
 
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(
+    job_id: str,
+    user_id: str = Depends(get_user_id),
+):
+    # ownership check
+    job = await (
+        async_supabase.table("analysis_jobs")
+        .select("id,status")
+        .eq("id", job_id)
+        .eq("user_id", user_id)
+        .single()
+        .execute()
+    )
+
+    if not job.data:
+        raise HTTPException(status_code=404)
+
+    if job.data["status"] not in ("queued", "running"):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job is already {job.data['status']}",
+        )
+
+    if not job_queue.cancel(job_id):
+        # owned by another process, or orphaned by a restart: the owner
+        # sees the cancelled row at its next heartbeat and stops the job,
+        # and its status writes skip cancelled rows
+        res = await async_supabase.table("analysis_jobs").update({
+            "status": "cancelled",
+            "error": "Cancelled",
+            "finished_at": datetime.utcnow().isoformat(),
+        }).eq("id", job_id).in_("status", ["queued", "running"]).execute()
+
+        if not res.data:
+            raise HTTPException(status_code=409, detail="Job has already finished")
+
+    list_cache.invalidate("jobs", user_id)
+    return {"job_id": job_id, "status": "cancelled"}
+
+async def job_state(job_id, user_id):
+    res = await (
+        async_supabase.table("analysis_jobs")
+        .select("id,status,error,result_files")
+        .eq("id", job_id)
+        .eq("user_id", user_id)
+        .single()
+        .execute()
+    )
+    return res.data
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events_stream(
+    job_id: str,
+    request: Request,
+    user_id: str = Depends(get_user_id),
+):
+    """
+    Server-Sent Events for one job, in place of polling /jobs. One event
+    per stage (queued, validating, downloading, running with one event
+    per output written, uploading), then a final completed / failed /
+    cancelled event carrying result_files or error, after which the
+    stream ends.
+    """
+    job = await job_state(job_id, user_id)
+
+    if not job:
+        raise HTTPException(status_code=404)
+
+    return StreamingResponse(
+        stream_events(
+            event_bus,
+            job_id,
+            job,
+            load_state=lambda: job_state(job_id, user_id),
+            is_disconnected=request.is_disconnected,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/jobs/{job_id}/download/{filename}")
-def download_result(
+async def download_result(
     job_id: str,
     filename: str,
+    request: Request,
     user_id: str = Depends(get_user_id),
 ):
     # ownership check
-    job = (
-        supabase.table("analysis_jobs")
-        .select("id")
+    job = await (
+        async_supabase.table("analysis_jobs")
+        .select("id,result_prefix,result_files,result_manifest")
         .eq("id", job_id)
         .eq("user_id", user_id)
         .single()
@@ -300,13 +498,58 @@ def download_result(
     if not job.data:
         raise HTTPException(status_code=404)
 
-    path = f"results/{job_id}/{filename}"
-    return {"url": generate_signed_url(path)}
+    # cache hits point at the outputs of the job that computed them
+    prefix = job.data.get("result_prefix") or f"results/{job_id}"
+    manifest = job.data.get("result_manifest")
+
+    if manifest and filename not in (job.data.get("result_files") or []):
+        raise HTTPException(status_code=404)
+
+    # bundled outputs are served from the bundle by bundled_result
+    if result_publisher.bundle_member(manifest, filename):
+        url = request.url_for("bundled_result", job_id=job_id, filename=filename)
+        try:
+            params = result_publisher.sign_member(job_id, filename)
+        except result_publisher.LinkSigningDisabled as e:
+            # bundled while a secret was configured; never sign without one
+            raise HTTPException(status_code=503, detail=str(e))
+        return {"url": str(url.include_query_params(**params))}
+
+    return {"url": generate_signed_url(f"{prefix}/{filename}")}
+
+
+@app.get("/jobs/{job_id}/files/{filename}")
+async def bundled_result(job_id: str, filename: str, expires: int, signature: str):
+    # the signed link from download_result is the authorization
+    if not result_publisher.verify_member(job_id, filename, expires, signature):
+        raise HTTPException(status_code=403)
+
+    job = await (
+        async_supabase.table("analysis_jobs")
+        .select("id,result_prefix,result_manifest")
+        .eq("id", job_id)
+        .single()
+        .execute()
+    )
+
+    manifest = job.data.get("result_manifest") if job.data else None
+    if not result_publisher.bundle_member(manifest, filename):
+        raise HTTPException(status_code=404)
+
+    prefix = job.data.get("result_prefix") or f"results/{job_id}"
+    data = await run_async(result_publisher.read_member, b2_storage, prefix, filename, manifest)
+
+    encoding = manifest.get("encoding", {}).get(filename)
+    return Response(
+        data,
+        media_type=result_publisher.content_type(filename),
+        headers={"Content-Encoding": encoding} if encoding else None,
+    )
 
 from analysis_registry import ANALYSES
 
 @app.get("/analyses")
-def list_analyses():
+async def list_analyses():
     """
     Public, read-only endpoint that exposes
     available analyses and their file requirements.
@@ -340,9 +583,13 @@ def list_analyses():
 
 
 @app.get("/files")
-def list_files(user_id: str = Depends(get_user_id)):
-    res = (
-        supabase
+async def list_files(user_id: str = Depends(get_user_id)):
+    cached = list_cache.get("files", user_id)
+    if cached is not None:
+        return cached
+
+    res = await (
+        async_supabase
         .table("user_files")
         .select("id, filename, detected_columns, uploaded_at")
         .eq("user_id", user_id)
@@ -350,42 +597,254 @@ def list_files(user_id: str = Depends(get_user_id)):
         .limit(10)
         .execute()
     )
+
+    list_cache.put("files", user_id, res.data)
     return res.data
 
 
 
 @app.post("/upload_file")
-def upload_file_generic(
+async def upload_file_generic(
     file: UploadFile = File(...),
     user_id: str = Depends(get_user_id),
 ):
-    df = pd.read_csv(file.file)
-    df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
+    schema = await run_in_threadpool(check_schema, file.file)
 
-    tmp_path = f"/tmp/{file.filename}"
-    df.to_csv(tmp_path, index=False)
+    if not schema["ok"]:
+        raise HTTPException(
+            status_code=400,
+            detail=schema_error_message(schema),
+        )
 
-    storage_path = f"raw/{user_id}/files/{file.filename}"
-    upload_file(tmp_path, storage_path)
+    digest = await run_in_threadpool(blob_store.content_hash, file.file)
+    blob = await run_in_threadpool(blob_store.reuse, supabase, user_id, digest, "files")
+    deduplicated = blob is not None
 
-    supabase.table("user_files").insert({
-        "user_id": user_id,
-        "filename": file.filename,
-        "storage_path": storage_path,
-        "detected_columns": list(df.columns),
-    }).execute()
+    if not deduplicated:
+        try:
+            blob = await run_in_threadpool(
+                store_blob,
+                file,
+                user_id,
+                digest,
+                "files",
+                schema,
+                rename=lambda c: c.strip().lower().replace(" ", "_"),
+            )
+        except InconsistentColumn as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    await record_upload(user_id, file.filename, blob)
+    return {"status": "uploaded", "deduplicated": deduplicated}
+
+
+# ---------- DIRECT UPLOADS ----------
+@app.post("/upload/direct")
+async def start_direct_upload(
+    filename: str,
+    size: int = 0,
+    analysis_key: str = None,
+    file_role: str = None,
+    sha256: str = None,
+    user_id: str = Depends(get_user_id),
+):
+    """
+    Phase one of a direct upload: returns presigned URL(s) the client
+    sends the file to, plus an upload_id for /upload/direct/{id}/complete.
+    Files of DIRECT_UPLOAD_PART_MB or more get one URL per part.
+
+    With the file's sha256, content the caller already uploaded is
+    referenced again and the session comes back completed, with no
+    transfer at all. Blobs are per user, so a wrong hash can only ever
+    point at the caller's own files. Uploaded content is hashed before
+    it is registered under its sha256 (see direct_uploads.validate).
+    """
+    if analysis_key is not None:
+        if analysis_key not in ANALYSES:
+            raise HTTPException(status_code=400, detail="Unknown analysis")
+        if file_role not in ANALYSES[analysis_key]["files"]:
+            raise HTTPException(status_code=400, detail="Invalid file role")
+
+    if size > direct_uploads.DIRECT_UPLOAD_MAX_MB * 1024 * 1024:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File is larger than {direct_uploads.DIRECT_UPLOAD_MAX_MB} MB",
+        )
+
+    if sha256 is not None:
+        if not blob_store.is_digest(sha256):
+            raise HTTPException(status_code=400, detail="sha256 must be a hex SHA-256 digest")
+        sha256 = sha256.lower()
+
+        required = direct_uploads.required_columns({"analysis_key": analysis_key, "file_role": file_role})
+        blob = await run_in_threadpool(blob_store.reuse, supabase, user_id, sha256, "raw", required)
+
+        if blob:
+            file_id = await record_upload(user_id, filename, blob)
+            session = await async_supabase.table("upload_sessions").insert({
+                "user_id": user_id,
+                "analysis_key": analysis_key,
+                "file_role": file_role,
+                "filename": filename,
+                "storage_path": blob["storage_path"],
+                "sha256": sha256,
+                "status": "completed",
+                "file_id": file_id,
+                "finished_at": datetime.utcnow().isoformat(),
+            }).execute()
+
+            return {
+                "upload_id": session.data[0]["id"],
+                "status": "completed",
+                "file_id": file_id,
+                "deduplicated": True,
+            }
+
+    path = direct_uploads.storage_path(user_id, filename, analysis_key, file_role)
+    parts = direct_uploads.part_count(size)
+    expires = direct_uploads.DIRECT_UPLOAD_URL_SECONDS
+
+    multipart_id = None
+    if parts:
+        multipart_id, urls = await run_async(
+            b2_storage.start_multipart_upload, path, parts, expires
+        )
+
+    try:
+        session = await async_supabase.table("upload_sessions").insert({
+            "user_id": user_id,
+            "analysis_key": analysis_key,
+            "file_role": file_role,
+            "filename": filename,
+            "storage_path": path,
+            "multipart_id": multipart_id,
+            "sha256": sha256,
+            "status": "pending",
+        }).execute()
+    except Exception:
+        # nothing would ever complete or expire the multipart upload
+        if multipart_id:
+            await run_async(b2_storage.abort_multipart_upload, path, multipart_id)
+        raise
+
+    out = {
+        "upload_id": session.data[0]["id"],
+        "expires_in": expires,
+    }
+
+    if parts:
+        out["part_size"] = direct_uploads.DIRECT_UPLOAD_PART_MB * 1024 * 1024
+        out["part_urls"] = urls
+    else:
+        out["url"] = b2_storage.generate_upload_url(path, expires)
+
+    return out
+
+
+@app.post("/upload/direct/{upload_id}/complete", status_code=202)
+async def complete_direct_upload(
+    upload_id: str,
+    body: dict = Body(default=None),
+    user_id: str = Depends(get_user_id),
+):
+    """
+    Phase two: the client has sent the file. Multipart uploads pass the
+    part ETags as {"parts": [{"PartNumber": n, "ETag": "..."}]}. The file
+    is validated in the background; poll GET /upload/direct/{id}.
+    """
+    session = await (
+        async_supabase.table("upload_sessions")
+        .select("*")
+        .eq("id", upload_id)
+        .eq("user_id", user_id)
+        .single()
+        .execute()
+    )
+
+    if not session.data:
+        raise HTTPException(status_code=404)
+
+    session = session.data
+
+    if session["status"] != "pending":
+        return {"upload_id": upload_id, "status": session["status"]}
+
+    if session.get("multipart_id"):
+        parts = (body or {}).get("parts")
+        if not parts:
+            raise HTTPException(status_code=400, detail="Missing uploaded parts")
+
+        try:
+            await run_async(
+                b2_storage.complete_multipart_upload,
+                session["storage_path"],
+                session["multipart_id"],
+                parts,
+            )
+        except Exception as e:
+            print("UPLOAD COMPLETE ERROR:", repr(e))
+            error = "Could not complete multipart upload"
+
+            # end the session and free the uploaded parts
+            failed = await (
+                async_supabase.table("upload_sessions")
+                .update({
+                    "status": "failed",
+                    "error": error,
+                    "finished_at": datetime.utcnow().isoformat(),
+                })
+                .eq("id", upload_id)
+                .eq("status", "pending")
+                .execute()
+            )
+            if failed.data:
+                await run_async(direct_uploads.discard, b2_storage, session)
+
+            raise HTTPException(status_code=400, detail=error)
+
+    # only the first completion call moves the session on
+    claimed = await (
+        async_supabase.table("upload_sessions")
+        .update({"status": "validating"})
+        .eq("id", upload_id)
+        .eq("status", "pending")
+        .execute()
+    )
+
+    if claimed.data:
+        upload_validator.submit(session)
+
+    return {"upload_id": upload_id, "status": "validating"}
+
+
+@app.get("/upload/direct/{upload_id}")
+async def direct_upload_status(
+    upload_id: str,
+    user_id: str = Depends(get_user_id),
+):
+    session = await (
+        async_supabase.table("upload_sessions")
+        .select("id,filename,status,error,file_id")
+        .eq("id", upload_id)
+        .eq("user_id", user_id)
+        .single()
+        .execute()
+    )
+
+    if not session.data:
+        raise HTTPException(status_code=404)
 
-    return {"status": "uploaded"}
+    return session.data
 
 @app.delete("/files/{file_id}")
-def delete_file_endpoint(
+async def delete_file_endpoint(
     file_id: str,
     user_id: str = Depends(get_user_id),
 ):
-    row = (
-        supabase
+    row = await (
+        async_supabase
         .table("user_files")
-        .select("storage_path")
+        .select("storage_path,blob_id")
         .eq("id", file_id)
         .eq("user_id", user_id)
         .single()
@@ -395,8 +854,12 @@ def delete_file_endpoint(
     if not row.data:
         raise HTTPException(status_code=404)
 
-    delete_file(row.data["storage_path"])
+    # the row goes first, so a failed object delete never leaves a file
+    # listed without its data
+    await async_supabase.table("user_files").delete().eq("id", file_id).execute()
+    list_cache.invalidate("files", user_id)
 
-    supabase.table("user_files").delete().eq("id", file_id).execute()
+    await release_upload(row.data.get("blob_id"), row.data["storage_path"])
+    await run_in_threadpool(result_cache.invalidate_file, supabase, file_id)
 
     return {"status": "deleted"}
@@ -1,30 +1,125 @@
 import os
+import time
+import logging
+import threading
+from collections import OrderedDict
 from jose import jwt
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 security = HTTPBearer()
+log = logging.getLogger(__name__)
 
 SUPABASE_JWT_SECRET = os.environ["SUPABASE_JWT_SECRET"]
 SUPABASE_ISSUER = "https://oemlaccyxsxmhawgvzfg.supabase.co/auth/v1"
 
+# verified tokens kept (0 = verify every request); an entry never
+# outlives the token's exp, nor JWT_CACHE_TTL_SECONDS
+JWT_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", "10000"))
+JWT_CACHE_TTL_SECONDS = float(os.environ.get("JWT_CACHE_TTL_SECONDS", "300"))
+
+
+class TokenCache:
+    """LRU of verified tokens -> (user id, expiry)."""
+
+    def __init__(self, max_size=JWT_CACHE_SIZE, ttl=JWT_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.failures = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry[1] <= time.time():
+                del self._entries[token]
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token, user_id, exp):
+        # tokens without exp are never cached
+        if self.max_size <= 0 or not exp:
+            return
+
+        expires = min(float(exp), time.time() + self.ttl)
+
+        with self._lock:
+            self._entries[token] = (user_id, expires)
+            self._entries.move_to_end(token)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "failures": self.failures,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+token_cache = TokenCache()
+
+
+def verify_token(token):
+    """Full signature, audience, issuer and expiry check. Returns the claims."""
+    return jwt.decode(
+        token,
+        SUPABASE_JWT_SECRET,
+        algorithms=["HS256"],
+        audience="authenticated",
+        issuer=SUPABASE_ISSUER,
+    )
+
 
 def get_user_id(
     creds: HTTPAuthorizationCredentials = Depends(security)
 ):
-    try:
-        token = creds.credentials
+    token = creds.credentials
 
-        payload = jwt.decode(
-            token,
-            SUPABASE_JWT_SECRET,
-            algorithms=["HS256"],
-            audience="authenticated",
-            issuer=SUPABASE_ISSUER,
-        )
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
 
-        return payload["sub"]
+    try:
+        payload = verify_token(token)
+        user_id = payload["sub"]
 
     except Exception as e:
-        print("JWT ERROR:", repr(e))
+        token_cache.failed()
+        # client error; the counter in token_cache.stats() tracks the rate
+        log.info("rejected token: %s", type(e).__name__)
         raise HTTPException(status_code=401, detail="Invalid token")
+
+    token_cache.put(token, user_id, payload.get("exp"))
+    return user_id
@@ -1,6 +1,25 @@
 import os
+import fcntl
+import hashlib
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+import anyio
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from metrics import BYTES
+
+# keep-alive HTTP connections shared by every thread using the client
+B2_MAX_POOL_CONNECTIONS = int(os.environ.get("B2_MAX_POOL_CONNECTIONS", "32"))
+
+# B2 calls allowed in flight at once from async endpoints
+B2_MAX_INFLIGHT = int(os.environ.get("B2_MAX_INFLIGHT", "16"))
 
 s3 = boto3.client(
     "s3",
@@ -10,29 +29,297 @@ s3 = boto3.client(
     config=Config(
         signature_version="s3v4",
         s3={"addressing_style": "path"},  # 🔴 REQUIRED FOR BACKBLAZE
+        max_pool_connections=B2_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
     ),
 )
 
 BUCKET = os.environ["B2_BUCKET"]
 
+# multipart transfers buffer roughly chunk size x concurrency in memory
+B2_MULTIPART_CHUNK_MB = int(os.environ.get("B2_MULTIPART_CHUNK_MB", "8"))
+B2_MAX_CONCURRENCY = int(os.environ.get("B2_MAX_CONCURRENCY", "4"))
 
-def upload_file(local_path, remote_path):
-    s3.upload_file(local_path, BUCKET, remote_path)
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=B2_MULTIPART_CHUNK_MB * 1024 * 1024,
+    multipart_chunksize=B2_MULTIPART_CHUNK_MB * 1024 * 1024,
+    max_concurrency=B2_MAX_CONCURRENCY,
+)
+
+
+def _object_args(content_type=None, content_encoding=None):
+    args = {}
+    if content_type:
+        args["ContentType"] = content_type
+    if content_encoding:
+        args["ContentEncoding"] = content_encoding
+    return args
+
+
+def upload_file(local_path, remote_path, content_type=None, content_encoding=None):
+    s3.upload_file(
+        local_path,
+        BUCKET,
+        remote_path,
+        ExtraArgs=_object_args(content_type, content_encoding) or None,
+        Config=TRANSFER_CONFIG,
+    )
+    BYTES.inc(os.path.getsize(local_path), direction="upload")
 
 
 def download_file(remote_path, local_path):
-    s3.download_file(BUCKET, remote_path, local_path)
+    s3.download_file(BUCKET, remote_path, local_path, Config=TRANSFER_CONFIG)
+    BYTES.inc(os.path.getsize(local_path), direction="download")
 
 
-def generate_signed_url(object_key: str, expires_seconds: int = 3600) -> str:
+def generate_signed_url(
+    object_key: str,
+    expires_seconds: int = 3600,
+    operation: str = "get_object",
+    **params,
+) -> str:
     return s3.generate_presigned_url(
-        "get_object",
+        operation,
         Params={
             "Bucket": BUCKET,
             "Key": object_key,
+            **params,
         },
         ExpiresIn=expires_seconds,
     )
 
+
+# ---------- DIRECT UPLOADS ----------
+# clients send file bodies straight to the bucket with presigned URLs
+def generate_upload_url(object_key, expires_seconds=3600):
+    return generate_signed_url(object_key, expires_seconds, "put_object")
+
+
+def start_multipart_upload(object_key, parts, expires_seconds=3600):
+    """Open a multipart upload; returns its id and one presigned URL per part."""
+    upload_id = s3.create_multipart_upload(Bucket=BUCKET, Key=object_key)["UploadId"]
+
+    urls = [
+        generate_signed_url(
+            object_key,
+            expires_seconds,
+            "upload_part",
+            UploadId=upload_id,
+            PartNumber=n,
+        )
+        for n in range(1, parts + 1)
+    ]
+    return upload_id, urls
+
+
+def complete_multipart_upload(object_key, upload_id, parts):
+    """parts: [{"PartNumber": n, "ETag": etag}] as reported by the client."""
+    s3.complete_multipart_upload(
+        Bucket=BUCKET,
+        Key=object_key,
+        UploadId=upload_id,
+        MultipartUpload={
+            "Parts": sorted(
+                ({"PartNumber": int(p["PartNumber"]), "ETag": p["ETag"]} for p in parts),
+                key=lambda p: p["PartNumber"],
+            ),
+        },
+    )
+
+
+def abort_multipart_upload(object_key, upload_id):
+    s3.abort_multipart_upload(Bucket=BUCKET, Key=object_key, UploadId=upload_id)
+
+
+@contextmanager
+def _not_found(remote_path):
+    """Turn B2's missing-object errors into FileNotFoundError."""
+    try:
+        yield
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            raise FileNotFoundError(remote_path) from e
+        raise
+
+
+def _head(remote_path):
+    with _not_found(remote_path):
+        return s3.head_object(Bucket=BUCKET, Key=remote_path)
+
+
+def object_size(remote_path):
+    """Size in bytes of a stored object; raises FileNotFoundError if it is missing."""
+    return _head(remote_path)["ContentLength"]
+
+
+def read_range(remote_path, start, length):
+    """Bytes [start, start + length) of an object (fewer at its end)."""
+    res = s3.get_object(
+        Bucket=BUCKET,
+        Key=remote_path,
+        Range=f"bytes={start}-{start + length - 1}",
+    )
+    data = res["Body"].read()
+    BYTES.inc(len(data), direction="download")
+    return data
+
+
+def object_sha256(remote_path, chunk_bytes=1024 * 1024):
+    """sha256 hex digest of a stored object, streamed through in chunks."""
+    with _not_found(remote_path):
+        body = s3.get_object(Bucket=BUCKET, Key=remote_path)["Body"]
+    h = hashlib.sha256()
+    size = 0
+
+    for block in iter(lambda: body.read(chunk_bytes), b""):
+        h.update(block)
+        size += len(block)
+
+    BYTES.inc(size, direction="download")
+    return h.hexdigest()
+
+
 def delete_file(remote_path):
     s3.delete_object(Bucket=BUCKET, Key=remote_path)
+
+
+def object_etag(remote_path):
+    """ETag of a stored object; raises FileNotFoundError if it is missing."""
+    return _head(remote_path)["ETag"].strip('"')
+
+
+# ---------- ASYNC ----------
+# boto3 is blocking, so async callers run it on worker threads, at most
+# B2_MAX_INFLIGHT at a time, over the same pooled client
+b2_limiter = anyio.CapacityLimiter(B2_MAX_INFLIGHT)
+
+
+async def run_async(fn, *args, **kwargs):
+    return await anyio.to_thread.run_sync(partial(fn, *args, **kwargs), limiter=b2_limiter)
+
+
+async def adelete_file(remote_path):
+    await run_async(delete_file, remote_path)
+
+
+# ---------- INPUT CACHE ----------
+B2_CACHE_DIR = os.environ.get("B2_CACHE_DIR", "/tmp/b2_cache")
+B2_CACHE_MAX_MB = int(os.environ.get("B2_CACHE_MAX_MB", "1024"))
+
+
+class InputCache:
+    """
+    On-disk LRU cache of downloaded B2 objects, keyed by storage path and
+    ETag so a changed object is never served stale. Entries are shared by
+    every worker process on the host: writes go through a temp file and an
+    atomic rename, and eviction runs under an exclusive file lock.
+    """
+
+    def __init__(self, cache_dir=B2_CACHE_DIR, max_bytes=B2_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, remote_path, etag):
+        key = hashlib.sha256(f"{remote_path}\0{etag}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    @contextmanager
+    def _file_lock(self):
+        with open(os.path.join(self.cache_dir, ".lock"), "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def fetch(self, remote_path, local_path):
+        etag = object_etag(remote_path)
+        entry = self._entry_path(remote_path, etag)
+
+        try:
+            os.utime(entry)  # bump LRU position
+            self._count("hits")
+        except FileNotFoundError:
+            self._count("misses")
+
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+            os.close(fd)
+            try:
+                s3.download_file(BUCKET, remote_path, tmp, Config=TRANSFER_CONFIG)
+                BYTES.inc(os.path.getsize(tmp), direction="download")
+                os.replace(tmp, entry)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+            self.evict()
+
+        self._materialize(entry, local_path, remote_path)
+
+    def _materialize(self, entry, local_path, remote_path):
+        if os.path.exists(local_path):
+            os.remove(local_path)
+
+        try:
+            os.link(entry, local_path)
+        except FileNotFoundError:
+            # evicted by another worker between fetch and link
+            download_file(remote_path, local_path)
+        except OSError:
+            # different filesystem
+            shutil.copyfile(entry, local_path)
+
+    def evict(self):
+        with self._file_lock():
+            entries = []
+            total = 0
+
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(".") or name.endswith(".part"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+            entries.sort()
+
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                total -= size
+                self._count("evictions")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+input_cache = InputCache()
+
+
+def download_file_cached(remote_path, local_path):
+    input_cache.fetch(remote_path, local_path)
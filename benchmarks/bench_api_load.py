@@ -0,0 +1,164 @@
+"""
+Requests per second on /jobs and /files against a stand-in Supabase.
+
+    python -m benchmarks.bench_api_load --concurrency 50 --seconds 10
+
+Starts a fake PostgREST server that answers every read after --latency
+seconds, runs the API under uvicorn pointed at it, and drives both
+endpoints from concurrent keep-alive clients.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def standin(port, latency):
+    """Fake PostgREST: every GET returns a small row list after a delay."""
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    rows = [
+        {"id": str(i), "status": "completed", "filename": f"f{i}.csv", "created_at": "2024-01-01"}
+        for i in range(10)
+    ]
+
+    async def table(request):
+        await asyncio.sleep(latency)
+        return JSONResponse(rows)
+
+    app = Starlette(routes=[Route("/rest/v1/{table}", table, methods=["GET"])])
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start")
+
+
+async def drive(base, token, paths, concurrency, seconds):
+    latencies = {p: [] for p in paths}
+    errors = 0
+    stop = time.monotonic() + seconds
+
+    async with httpx.AsyncClient(
+        base_url=base,
+        headers={"Authorization": f"Bearer {token}"},
+        limits=httpx.Limits(max_connections=concurrency),
+        timeout=30,
+    ) as client:
+
+        async def worker(i):
+            nonlocal errors
+            path = paths[i % len(paths)]
+            while time.monotonic() < stop:
+                t0 = time.perf_counter()
+                r = await client.get(path)
+                if r.status_code != 200:
+                    errors += 1
+                latencies[path].append(time.perf_counter() - t0)
+
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+    out = {}
+    for path, lat in latencies.items():
+        lat.sort()
+        out[path] = {
+            "requests": len(lat),
+            "rps": round(len(lat) / seconds, 1),
+            "p50_ms": round(lat[len(lat) // 2] * 1000, 1) if lat else None,
+            "p95_ms": round(lat[int(len(lat) * 0.95)] * 1000, 1) if lat else None,
+        }
+    out["errors"] = errors
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--standin", nargs=2, metavar=("PORT", "LATENCY"))
+    args = parser.parse_args()
+
+    if args.standin:
+        return standin(int(args.standin[0]), float(args.standin[1]))
+
+    from jose import jwt
+
+    secret = "bench-secret"
+    issuer = "https://oemlaccyxsxmhawgvzfg.supabase.co/auth/v1"
+    token = jwt.encode(
+        {"sub": "bench-user", "aud": "authenticated", "iss": issuer, "exp": int(time.time()) + 3600},
+        secret,
+        algorithm="HS256",
+    )
+
+    db_port, api_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "SUPABASE_URL": f"http://127.0.0.1:{db_port}",
+        "SUPABASE_SERVICE_ROLE_KEY": "bench",
+        "SUPABASE_JWT_SECRET": secret,
+        "B2_ENDPOINT": "http://127.0.0.1:9",
+        "B2_KEY_ID": "bench",
+        "B2_APP_KEY": "bench",
+        "B2_BUCKET": "bench",
+    }
+
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_api_load", "--standin", str(db_port), str(args.latency)],
+            env=env,
+        ),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(api_port), "--log-level", "warning"],
+            env=env,
+        ),
+    ]
+
+    try:
+        wait_for(f"http://127.0.0.1:{db_port}/rest/v1/ping")
+        wait_for(f"http://127.0.0.1:{api_port}/analyses")
+
+        result = asyncio.run(drive(
+            f"http://127.0.0.1:{api_port}",
+            token,
+            ["/jobs", "/files"],
+            args.concurrency,
+            args.seconds,
+        ))
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+
+    print(json.dumps({
+        "concurrency": args.concurrency,
+        "stand_in_latency_ms": args.latency * 1000,
+        **result,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Per-request cost of auth.get_user_id with and without the token cache.
+
+    python -m benchmarks.bench_auth --requests 20000 --users 100
+
+Each user's token is presented --requests / --users times, as a client
+polling /jobs would.
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-secret")
+
+from jose import jwt
+from fastapi.security import HTTPAuthorizationCredentials
+
+import auth
+
+
+def tokens(users):
+    now = int(time.time())
+    return [
+        HTTPAuthorizationCredentials(
+            scheme="Bearer",
+            credentials=jwt.encode(
+                {
+                    "sub": f"user-{i}",
+                    "aud": "authenticated",
+                    "iss": auth.SUPABASE_ISSUER,
+                    "exp": now + 3600,
+                },
+                auth.SUPABASE_JWT_SECRET,
+                algorithm="HS256",
+            ),
+        )
+        for i in range(users)
+    ]
+
+
+def run(cache, creds, requests):
+    auth.token_cache = cache
+
+    t0 = time.perf_counter()
+    for i in range(requests):
+        auth.get_user_id(creds[i % len(creds)])
+    seconds = time.perf_counter() - t0
+
+    return {
+        "cache_size": cache.max_size,
+        "requests": requests,
+        "us_per_request": round(seconds / requests * 1e6, 2),
+        **cache.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+
+    creds = tokens(args.users)
+
+    print(json.dumps([
+        run(auth.TokenCache(max_size=0), creds, args.requests),
+        run(auth.TokenCache(), creds, args.requests),
+    ], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Peak RSS of upload ingestion as file size grows.
+
+    python -m benchmarks.bench_ingest --rows 100000 1000000 5000000
+
+Each (mode, size) runs in a fresh interpreter so peaks don't leak between
+runs. "full" is the old read-everything path, "streaming" is ingest_csv.
+The file is visits.csv from benchmarks.synthetic with --wide, which adds
+free-text columns.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+
+def child(mode, path, workdir):
+    from columnar_store import write_columnar
+    from ingest import ingest_csv
+
+    csv_out = os.path.join(workdir, "out.csv")
+    parquet_out = os.path.join(workdir, "out.parquet")
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    t0 = time.perf_counter()
+    with open(path, "rb") as f:
+        if mode == "full":
+            df = pd.read_csv(f)
+            df.columns = [c.lower() for c in df.columns]
+            df.to_csv(csv_out, index=False)
+            write_columnar(df, parquet_out)
+        else:
+            ingest_csv(f, csv_out, parquet_out, required_columns=["patient_id"])
+    elapsed = time.perf_counter() - t0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "seconds": round(elapsed, 3),
+        "peak_rss_mb": round(peak / 1024, 1),
+        "delta_rss_mb": round((peak - baseline) / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000, 3_000_000])
+    parser.add_argument("--modes", nargs="+", default=["full", "streaming"])
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "PATH", "WORKDIR"))
+    args = parser.parse_args()
+
+    if args.child:
+        return child(*args.child)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            data_dir = os.path.join(tmp, f"data_{rows}")
+            path = os.path.join(data_dir, "visits.csv")
+            # generate out of process: ru_maxrss survives fork+exec, so a
+            # fat parent would inflate every child's baseline
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.synthetic", "--rows", str(rows),
+                 "--out", data_dir, "--wide"],
+                check=True,
+                capture_output=True,
+            )
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+
+            for mode in args.modes:
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_ingest", "--child", mode, path, tmp],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                )
+                results.append({
+                    "mode": mode,
+                    "rows": rows,
+                    "file_mb": round(size_mb, 1),
+                    **json.loads(out.stdout.strip().splitlines()[-1]),
+                })
+
+            shutil.rmtree(data_dir)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+DataFrame.merge against the sorted and as-of joins of join_engine.
+
+    python -m benchmarks.bench_joins --rows 1000000 10000000
+
+Joins visits to metrics on (patientid, date) and visits to patients on
+patientid, the two shapes the registry uses. Inputs come from
+benchmarks.synthetic, loaded the way clinic_outcomes loads them.
+"""
+import argparse
+import json
+import tempfile
+import time
+
+from analysis_engine import load_inputs, plan
+from benchmarks.synthetic import generate
+from join_engine import sorted_join, asof_join
+
+
+def frames(rows, seed=0):
+    with tempfile.TemporaryDirectory() as data_dir:
+        generate(rows, data_dir, seed, parquet=True)
+        inputs = load_inputs(plan("clinic_outcomes"), data_dir)
+    return inputs["patients"], inputs["visits"], inputs["metrics"]
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return round(time.perf_counter() - t0, 3), len(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    args = parser.parse_args()
+
+    dated = (["patientid", "visitdate"], ["patientid", "metricdate"])
+    results = []
+
+    for rows in args.rows:
+        patients, visits, metrics = frames(rows)
+
+        cases = {
+            "merge_patients": lambda: visits.merge(patients, on="patientid", how="left"),
+            "sorted_patients": lambda: sorted_join(visits, patients, ["patientid"], ["patientid"], "left"),
+            "merge_metrics": lambda: visits.merge(metrics, left_on=dated[0], right_on=dated[1], how="left"),
+            "sorted_metrics": lambda: sorted_join(visits, metrics, *dated, how="left"),
+            "asof_metrics_1d": lambda: asof_join(visits, metrics, *dated, tolerance="1D"),
+        }
+
+        for name, fn in cases.items():
+            seconds, out_rows = timed(fn)
+            results.append({"case": name, "rows": rows, "seconds": seconds, "out_rows": out_rows})
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Time and memory of loading basic_clinic inputs.
+
+    python -m benchmarks.bench_loaders --rows 1000000 10000000 50000000
+
+Inputs come from benchmarks.synthetic with --wide, so the raw files carry
+columns no analysis reads. Modes, each run in a fresh interpreter:
+  csv        every column of the raw CSVs with default dtypes (old loaders)
+  parquet    every column of the typed Parquet copies
+  projected  load_inputs(plan("basic_clinic")): planned columns only,
+             categorical labels, compact ids
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+
+def child(mode, data_dir):
+    from analysis_engine import load_inputs, plan
+    from column_normalization import normalize_columns
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+
+    if mode == "csv":
+        frames = {
+            role: normalize_columns(pd.read_csv(os.path.join(data_dir, f"{role}.csv")))
+            for role in ("patients", "visits")
+        }
+    elif mode == "parquet":
+        frames = {
+            role: pd.read_parquet(os.path.join(data_dir, f"{role}.parquet"))
+            for role in ("patients", "visits")
+        }
+    else:
+        frames = load_inputs(plan("basic_clinic"), data_dir)
+
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(json.dumps({
+        "seconds": round(elapsed, 3),
+        "frame_mb": round(sum(
+            df.memory_usage(deep=True).sum() for df in frames.values()
+        ) / (1024 * 1024), 1),
+        "delta_rss_mb": round((peak - baseline) / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000, 50_000_000])
+    parser.add_argument("--modes", nargs="+", default=["csv", "parquet", "projected"])
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "DATA_DIR"))
+    args = parser.parse_args()
+
+    if args.child:
+        return child(*args.child)
+
+    results = []
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as data_dir:
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.synthetic", "--rows", str(rows),
+                 "--out", data_dir, "--parquet", "--wide"],
+                check=True,
+                capture_output=True,
+            )
+
+            for mode in args.modes:
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_loaders", "--child", mode, data_dir],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                )
+                results.append({
+                    "mode": mode,
+                    "rows": rows,
+                    **json.loads(out.stdout.strip().splitlines()[-1]),
+                })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
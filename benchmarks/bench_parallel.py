@@ -0,0 +1,80 @@
+"""
+Wall-clock time of basic_clinic as the number of analysis workers grows.
+
+    python -m benchmarks.bench_parallel --rows 10000000 --workers 1 2 4 8
+
+Inputs come from benchmarks.synthetic. Each run uses a fresh
+interpreter; "parquet" reads the typed copies, "csv" removes them so the
+raw files are parsed (in parallel per role when workers > 1).
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def child(workers, data_dir):
+    from analysis_engine import run_analysis
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        t0 = time.perf_counter()
+        run_analysis("basic_clinic", data_dir, out_dir, memory_budget_mb=0, workers=workers)
+        elapsed = time.perf_counter() - t0
+
+    print(json.dumps({"seconds": round(elapsed, 3)}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000_000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--formats", nargs="+", default=["parquet", "csv"])
+    parser.add_argument("--child", nargs=2, metavar=("WORKERS", "DATA_DIR"))
+    args = parser.parse_args()
+
+    if args.child:
+        return child(int(args.child[0]), args.child[1])
+
+    results = []
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as data_dir:
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.synthetic", "--rows", str(rows),
+                 "--out", data_dir, "--parquet"],
+                check=True,
+                capture_output=True,
+            )
+
+            for fmt in args.formats:
+                if fmt == "csv":
+                    for path in glob.glob(os.path.join(data_dir, "*.parquet")):
+                        os.remove(path)
+
+                for workers in sorted(set(args.workers)):
+                    out = subprocess.run(
+                        [sys.executable, "-m", "benchmarks.bench_parallel", "--child", str(workers), data_dir],
+                        check=True,
+                        capture_output=True,
+                        text=True,
+                    )
+                    results.append({
+                        "format": fmt,
+                        "rows": rows,
+                        "workers": workers,
+                        **json.loads(out.stdout.strip().splitlines()[-1]),
+                    })
+
+    base = {(r["format"], r["rows"]): r["seconds"] for r in results if r["workers"] == 1}
+    for r in results:
+        if (r["format"], r["rows"]) in base:
+            r["speedup"] = round(base[(r["format"], r["rows"])] / r["seconds"], 2)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
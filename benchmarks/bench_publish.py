@@ -0,0 +1,108 @@
+"""
+Serial plain uploads of analysis outputs against result_publisher.publish.
+
+    python -m benchmarks.bench_publish --latency 0.08 --mbps 200
+
+Outputs are synthetic CSVs shaped like the registry's (a few small
+group tables plus one large per-row table). Uploads go to a stand-in
+store that charges a fixed latency per request plus size / bandwidth,
+so the numbers reflect request count and bytes sent, not a real bucket.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import result_publisher
+
+
+class StandIn:
+    def __init__(self, latency, mbps):
+        self.latency = latency
+        self.bytes_per_second = mbps * 1e6 / 8
+        self.requests = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def upload_file(self, local_path, remote_path, content_type=None, content_encoding=None):
+        size = os.path.getsize(local_path)
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+        time.sleep(self.latency + size / self.bytes_per_second)
+
+
+def write_outputs(out_dir, small, large_rows, seed=0):
+    rng = np.random.default_rng(seed)
+
+    for i in range(small):
+        pd.DataFrame({
+            "insurance": ["aetna", "bluecross", "cigna", "medicare"],
+            "value": rng.uniform(0, 500, 4),
+        }).to_csv(os.path.join(out_dir, f"summary_{i}.csv"), index=False)
+
+    if large_rows:
+        pd.DataFrame({
+            "patientid": rng.integers(0, large_rows // 10 + 1, large_rows),
+            "visitdate": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, large_rows), "D"),
+            "servicecharge": rng.uniform(50, 500, large_rows).round(2),
+        }).to_csv(os.path.join(out_dir, "visits_detail.csv"), index=False)
+
+
+def serial(store, out_dir, prefix):
+    for fname in sorted(os.listdir(out_dir)):
+        store.upload_file(os.path.join(out_dir, fname), f"{prefix}/{fname}")
+
+
+def run(name, fn, store):
+    t0 = time.perf_counter()
+    fn()
+    return {
+        "case": name,
+        "seconds": round(time.perf_counter() - t0, 3),
+        "requests": store.requests,
+        "bytes": store.bytes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--small", type=int, default=6)
+    parser.add_argument("--large-rows", type=int, default=500_000)
+    parser.add_argument("--latency", type=float, default=0.08)
+    parser.add_argument("--mbps", type=float, default=200)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        out_dir = os.path.join(root, "output")
+        os.makedirs(out_dir)
+        write_outputs(out_dir, args.small, args.large_rows)
+
+        results = []
+
+        store = StandIn(args.latency, args.mbps)
+        results.append(run("serial_plain", lambda: serial(store, out_dir, "results/a"), store))
+
+        for encoding in ("none", "gzip"):
+            store = StandIn(args.latency, args.mbps)
+            staging = os.path.join(root, f"publish-{encoding}")
+            results.append(run(
+                f"publish_{encoding}",
+                lambda: result_publisher.publish(store, out_dir, staging, "results/b", encoding=encoding),
+                store,
+            ))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
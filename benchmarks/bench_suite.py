@@ -0,0 +1,202 @@
+"""
+Release benchmark: time and peak RSS of the main pipeline steps on
+synthetic clinic data (benchmarks.synthetic).
+
+    python -m benchmarks.bench_suite --rows 10000 1000000 10000000 50000000 > bench.json
+    python -m benchmarks.bench_suite --rows 10000 1000000 --baseline bench.json
+
+Cases, each run in a fresh interpreter so peaks don't leak between runs:
+  basic_clinic       run_analysis("basic_clinic") with the default
+  clinic_outcomes    memory budget and workers (override with flags)
+  upload             what /upload does to visits.csv before storing it:
+                     check_schema, then ingest_csv to CSV + Parquet
+  normalize_columns  normalize_columns on the loaded visits frame
+
+--data-dir keeps generated inputs between runs (keyed by rows and seed).
+With --baseline, cases slower than the baseline by more than --tolerance
+are marked as regressions and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+CASES = ["basic_clinic", "clinic_outcomes", "upload", "normalize_columns"]
+
+# differences below this are timer noise, never a regression
+NOISE_SECONDS = 0.01
+
+
+def _rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def child(case, data_dir, memory_budget_mb=None, workers=None):
+    from analysis_engine import run_analysis
+    from analysis_registry import ANALYSES
+    from column_normalization import normalize_columns
+    from ingest import ingest_csv
+    from schema_check import check_schema
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        if case == "normalize_columns":
+            df = pd.read_csv(os.path.join(data_dir, "visits.csv"))
+            baseline = _rss_mb()
+            t0 = time.perf_counter()
+            normalize_columns(df)
+
+        elif case == "upload":
+            required = ANALYSES["basic_clinic"]["files"]["visits"]["required_columns"]
+            baseline = _rss_mb()
+            t0 = time.perf_counter()
+            with open(os.path.join(data_dir, "visits.csv"), "rb") as f:
+                if not check_schema(f, required)["ok"]:
+                    raise RuntimeError("synthetic visits.csv failed the schema check")
+                f.seek(0)
+                ingest_csv(
+                    f,
+                    os.path.join(out_dir, "visits.csv"),
+                    os.path.join(out_dir, "visits.parquet"),
+                )
+
+        else:
+            baseline = _rss_mb()
+            t0 = time.perf_counter()
+            run_analysis(case, data_dir, out_dir, memory_budget_mb=memory_budget_mb, workers=workers)
+
+        elapsed = time.perf_counter() - t0
+
+    print(json.dumps({
+        "seconds": round(elapsed, 6),
+        "peak_rss_mb": _rss_mb(),
+        "baseline_rss_mb": baseline,
+    }))
+
+
+def prepare(rows, seed, fmt, root):
+    """Generate (or reuse) the inputs for rows visits; returns the directory."""
+    data_dir = os.path.join(root, f"clinic_{rows}_{seed}_{fmt}")
+    marker = os.path.join(data_dir, "_generated.json")
+    if os.path.exists(marker):
+        return data_dir
+
+    cmd = [sys.executable, "-m", "benchmarks.synthetic", "--rows", str(rows), "--out", data_dir, "--seed", str(seed)]
+    if fmt == "parquet":
+        cmd.append("--parquet")
+
+    t0 = time.perf_counter()
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    counts = json.loads(out.stdout.strip().splitlines()[-1])
+    counts["generate_seconds"] = round(time.perf_counter() - t0, 1)
+
+    with open(marker, "w") as f:
+        json.dump(counts, f)
+    return data_dir
+
+
+def run_case(case, data_dir, args):
+    cmd = [sys.executable, "-m", "benchmarks.bench_suite", "--child", case, data_dir]
+    if args.memory_budget_mb is not None:
+        cmd += ["--memory-budget-mb", str(args.memory_budget_mb)]
+    if args.workers is not None:
+        cmd += ["--workers", str(args.workers)]
+
+    out = subprocess.run(cmd, capture_output=True, text=True)
+    if out.returncode != 0:
+        return {"error": out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f"exit {out.returncode}"}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """Add the ratio to the baseline's seconds; True if any case regressed."""
+    before = {(r["case"], r["rows"]): r for r in baseline["results"] if "seconds" in r}
+    regressed = False
+
+    for r in results:
+        old = before.get((r["case"], r["rows"]))
+        if not old or "seconds" not in r:
+            continue
+        r["baseline_seconds"] = old["seconds"]
+        r["ratio"] = round(r["seconds"] / old["seconds"], 2) if old["seconds"] else None
+        r["regression"] = (
+            r["seconds"] > old["seconds"] * (1 + tolerance)
+            and r["seconds"] - old["seconds"] > NOISE_SECONDS
+        )
+        regressed |= r["regression"]
+
+    return regressed
+
+
+def environment(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "format": args.format,
+        "memory_budget_mb": args.memory_budget_mb,
+        "workers": args.workers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet",
+                        help="inputs the analyses read: typed Parquet copies or raw CSV")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir")
+    parser.add_argument("--memory-budget-mb", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--child", nargs=2, metavar=("CASE", "DATA_DIR"))
+    args = parser.parse_args()
+
+    if args.child:
+        return child(*args.child, memory_budget_mb=args.memory_budget_mb, workers=args.workers)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.data_dir or tmp
+
+        for rows in args.rows:
+            data_dir = prepare(rows, args.seed, args.format, root)
+            for case in args.cases:
+                results.append({"case": case, "rows": rows, **run_case(case, data_dir, args)})
+                print(json.dumps(results[-1]), file=sys.stderr)
+
+    report = {"environment": environment(args), "results": results}
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressed = compare(results, json.load(f), args.tolerance)
+
+    print(json.dumps(report, indent=2))
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
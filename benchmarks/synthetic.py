@@ -0,0 +1,192 @@
+"""
+Seeded synthetic clinic data: patients.csv, visits.csv and metrics.csv.
+
+    python -m benchmarks.synthetic --rows 1000000 --out /tmp/clinic --parquet
+
+--rows is the number of visits; there is one patient per PATIENT_RATIO
+visits and about METRICS_PER_VISIT metric rows per visit. The same rows
+and seed always give the same files. Distributions are skewed the way
+real clinic exports are:
+
+  - a few insurers and cities hold most patients (Zipf-like weights)
+  - some patients visit far more often than others
+  - DUPLICATE_VISIT_SHARE of visits repeat the previous visit's patient
+    and day (same-day follow-ups)
+  - charges depend on the insurer, and mobility falls as pain rises
+  - metrics are taken on, or a day either side of, a visit
+
+Headers use the mixed spellings users upload ("Patient_ID", "Visit
+Date"), so normalize_col has real work to do. --parquet also writes the
+typed copies the upload path stores next to each CSV. --wide adds the
+free-text columns exports carry but no analysis reads (addresses,
+providers, notes), for measuring what loading only the planned columns
+saves.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+BLOCK_ROWS = 1_000_000
+PATIENT_RATIO = 20
+METRICS_PER_VISIT = 0.5
+DUPLICATE_VISIT_SHARE = 0.1
+
+FIRST_VISIT = np.datetime64("2023-01-01")
+VISIT_DAYS = 730
+
+# insurer -> (weight, charge multiplier)
+INSURERS = {
+    "BlueCross": (0.34, 1.15),
+    "Aetna": (0.22, 1.05),
+    "Medicare": (0.18, 0.80),
+    "Cigna": (0.11, 1.10),
+    "Medicaid": (0.08, 0.65),
+    "UnitedHealth": (0.05, 1.00),
+    "Self Pay": (0.02, 1.40),
+}
+
+STATES = ["CA", "NY", "TX", "FL", "WA", "IL", "PA", "OH", "GA", "NC"]
+N_CITIES = 300
+
+# --wide only
+N_PROVIDERS = 500
+NOTES = ["follow up visit", "new patient intake", "imaging review", ""]
+
+
+def _zipf_weights(n, s=1.1):
+    w = 1.0 / np.arange(1, n + 1) ** s
+    return w / w.sum()
+
+
+def _dates(start, days):
+    return (start + days.astype("timedelta64[D]")).astype(str)
+
+
+def _write(df, name, out_dir, state, parquet):
+    df.to_csv(os.path.join(out_dir, f"{name}.csv"), mode="a", header=name not in state, index=False)
+
+    writer = state.get(name)
+    if parquet:
+        from columnar_store import coerce_types
+
+        table = pa.Table.from_pandas(coerce_types(df.copy()), preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(os.path.join(out_dir, f"{name}.parquet"), table.schema)
+        writer.write_table(table)
+
+    state[name] = writer
+
+
+def generate(rows, out_dir, seed=0, parquet=False, wide=False):
+    """Write the three inputs for rows visits into out_dir. Returns their row counts."""
+    os.makedirs(out_dir, exist_ok=True)
+    for name in ("patients", "visits", "metrics"):
+        for ext in (".csv", ".parquet"):
+            path = os.path.join(out_dir, name + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+    rng = np.random.default_rng(seed)
+    n_patients = max(rows // PATIENT_RATIO, 1)
+
+    insurers = list(INSURERS)
+    ins_weights = np.array([w for w, _ in INSURERS.values()])
+    ins_weights /= ins_weights.sum()
+    multipliers = np.array([m for _, m in INSURERS.values()])
+
+    cities = np.array([f"City {k}" for k in range(N_CITIES)])
+    city_state = rng.choice(STATES, N_CITIES)
+    city_weights = _zipf_weights(N_CITIES)
+
+    # kept for the visits: each patient's insurer drives their charges
+    patient_ins = rng.choice(len(insurers), n_patients, p=ins_weights).astype(np.int8)
+    # how often each patient visits, exponentially distributed
+    activity = np.cumsum(rng.exponential(1.0, n_patients))
+    activity /= activity[-1]
+
+    state = {}
+    counts = {"patients": 0, "visits": 0, "metrics": 0}
+
+    for i in range(0, n_patients, BLOCK_ROWS):
+        n = min(BLOCK_ROWS, n_patients - i)
+        city = rng.choice(N_CITIES, n, p=city_weights)
+        patients = pd.DataFrame({
+            "Patient_ID": np.arange(i, i + n) + 100_000,
+            "Insurance": np.array(insurers)[patient_ins[i:i + n]],
+            "DOB": _dates(np.datetime64("1935-01-01"), rng.integers(0, 30_000, n)),
+            "City": cities[city],
+            "State": city_state[city],
+        })
+        if wide:
+            patients["Address"] = [f"{k} Main Street, Apt {k % 97}" for k in range(i, i + n)]
+        _write(patients, "patients", out_dir, state, parquet)
+        counts["patients"] += n
+
+    for i in range(0, rows, BLOCK_ROWS):
+        n = min(BLOCK_ROWS, rows - i)
+
+        patient = np.searchsorted(activity, rng.random(n))
+        day = rng.integers(0, VISIT_DAYS, n)
+
+        # point each duplicate at the last non-duplicate row before it
+        dup = rng.random(n) < DUPLICATE_VISIT_SHARE
+        dup[0] = False
+        src = np.maximum.accumulate(np.where(dup, 0, np.arange(n)))
+        patient, day = patient[src], day[src]
+
+        charge = rng.lognormal(5.0, 0.55, n) * multipliers[patient_ins[patient]]
+
+        visits = pd.DataFrame({
+            "Patient_ID": patient + 100_000,
+            "Visit Date": _dates(FIRST_VISIT, day),
+            "Service_Charge": charge.round(2),
+        })
+        if wide:
+            visits["Provider"] = np.array([f"dr_{k}" for k in range(N_PROVIDERS)])[
+                rng.integers(0, N_PROVIDERS, n)
+            ]
+            visits["Notes"] = np.array(NOTES)[rng.integers(0, len(NOTES), n)]
+        _write(visits, "visits", out_dir, state, parquet)
+        counts["visits"] += n
+
+        taken = rng.random(n) < METRICS_PER_VISIT
+        m = int(taken.sum())
+        pain = rng.integers(0, 11, m)
+        mobility = np.clip(95 - 6 * pain + rng.normal(0, 10, m), 0, 100).round(1)
+
+        _write(pd.DataFrame({
+            "PatientID": patient[taken] + 100_000,
+            "Metric-Date": _dates(FIRST_VISIT, day[taken] + rng.integers(-1, 2, m)),
+            "Pain Score": pain,
+            "Mobility_Score": mobility,
+        }), "metrics", out_dir, state, parquet)
+        counts["metrics"] += m
+
+    for writer in state.values():
+        if writer is not None:
+            writer.close()
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, required=True)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--parquet", action="store_true")
+    parser.add_argument("--wide", action="store_true")
+    args = parser.parse_args()
+
+    counts = generate(args.rows, args.out, args.seed, args.parquet, args.wide)
+    print(json.dumps({"seed": args.seed, **counts}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import os
+import uuid
+import hashlib
+
+from columnar_store import columnar_path
+from metrics import STAGE_SECONDS
+from rollups import rollup_path
+from schema_check import satisfies
+
+
+# Uploads are stored once per distinct content. A file_blobs row
+# (user_id, sha256, variant) owns the stored objects and counts the
+# user_files rows that point at it; re-uploading the same bytes adds a
+# reference instead of another copy, and the objects are only deleted
+# when the last reference goes.
+#
+# Blobs are scoped to one user, so an upload can never reveal whether
+# someone else holds the same file, and a client-supplied hash can only
+# ever match the caller's own data.
+#
+# variant says how the stored objects were derived from the upload:
+#   analysis  /upload: cleaned CSV with lowercased headers + Parquet + rollup
+#   files     /upload_file: cleaned CSV with snake_case headers + Parquet + rollup
+#   raw       direct uploads: the CSV exactly as the client sent it
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# compare-and-set retries when concurrent requests move ref_count
+BLOB_CAS_ATTEMPTS = int(os.environ.get("BLOB_CAS_ATTEMPTS", "5"))
+
+
+def content_hash(fileobj, chunk_bytes=HASH_CHUNK_BYTES):
+    """sha256 hex digest of a seekable file; leaves it at the start."""
+    h = hashlib.sha256()
+
+    with STAGE_SECONDS.time(stage="content_hash"):
+        fileobj.seek(0)
+        for block in iter(lambda: fileobj.read(chunk_bytes), b""):
+            h.update(block)
+        fileobj.seek(0)
+
+    return h.hexdigest()
+
+
+def is_digest(value):
+    return (
+        isinstance(value, str)
+        and len(value) == 64
+        and all(c in "0123456789abcdef" for c in value.lower())
+    )
+
+
+def blob_path(user_id, digest, variant):
+    """
+    Where a new blob's objects go. The token keeps a blob that is being
+    deleted and a fresh upload of the same content from sharing keys.
+    """
+    return f"blobs/{user_id}/{digest}/{uuid.uuid4().hex[:12]}/{variant}.csv"
+
+
+def blob_objects(path):
+    """Every object stored for an upload: the CSV, its Parquet copy and rollup."""
+    return [path, columnar_path(path), rollup_path(path)]
+
+
+def _get(db, blob_id):
+    res = db.table("file_blobs").select("*").eq("id", blob_id).limit(1).execute()
+    return res.data[0] if res.data else None
+
+
+def find(db, user_id, digest, variant):
+    res = (
+        db
+        .table("file_blobs")
+        .select("*")
+        .eq("user_id", user_id)
+        .eq("sha256", digest)
+        .eq("variant", variant)
+        .limit(1)
+        .execute()
+    )
+    return res.data[0] if res.data else None
+
+
+def acquire(db, blob, attempts=BLOB_CAS_ATTEMPTS):
+    """Add a reference to blob. False if it is gone (or going)."""
+    count = blob["ref_count"]
+
+    for _ in range(attempts):
+        if count <= 0:
+            return False
+
+        res = (
+            db.table("file_blobs")
+            .update({"ref_count": count + 1})
+            .eq("id", blob["id"])
+            .eq("ref_count", count)
+            .execute()
+        )
+        if res.data:
+            blob["ref_count"] = count + 1
+            return True
+
+        current = _get(db, blob["id"])
+        if not current:
+            return False
+        count = current["ref_count"]
+
+    return False
+
+
+def reuse(db, user_id, digest, variant, required_columns=()):
+    """
+    The caller's existing blob for this content, with a reference taken,
+    or None if the upload has to be stored. The blob's schema stands in
+    for a fresh check_schema, so it must cover required_columns.
+    """
+    blob = find(db, user_id, digest, variant)
+    if not blob or not satisfies(blob.get("inferred_schema"), required_columns):
+        return None
+
+    return blob if acquire(db, blob) else None
+
+
+def register(db, storage, user_id, digest, variant, path, columns, schema):
+    """
+    Record objects just stored at path as the blob for digest, holding
+    one reference. If an identical upload registered first, that blob is
+    shared instead and the new objects are deleted. If neither works the
+    upload is kept on its own, unshared (id None).
+    """
+    res = db.table("file_blobs").upsert({
+        "user_id": user_id,
+        "sha256": digest,
+        "variant": variant,
+        "storage_path": path,
+        "detected_columns": columns,
+        "inferred_schema": schema,
+        "ref_count": 1,
+    }, on_conflict="user_id,sha256,variant", ignore_duplicates=True).execute()
+
+    if res.data:
+        return res.data[0]
+
+    existing = find(db, user_id, digest, variant)
+    if existing and acquire(db, existing):
+        for key in blob_objects(path):
+            storage.delete_file(key)
+        return existing
+
+    return {
+        "id": None,
+        "storage_path": path,
+        "detected_columns": columns,
+        "inferred_schema": schema,
+    }
+
+
+def release(db, blob_id, attempts=BLOB_CAS_ATTEMPTS):
+    """
+    Drop one reference. Returns the blob's storage_path when that was
+    the last one and its row is gone, so the caller deletes the objects.
+    """
+    for _ in range(attempts):
+        blob = _get(db, blob_id)
+        if not blob:
+            return None
+
+        count = blob["ref_count"]
+        q = db.table("file_blobs")
+
+        if count > 1:
+            res = q.update({"ref_count": count - 1}).eq("id", blob_id).eq("ref_count", count).execute()
+            if res.data:
+                return None
+        else:
+            res = q.delete().eq("id", blob_id).eq("ref_count", count).execute()
+            if res.data:
+                return blob["storage_path"]
+
+    print("BLOB RELEASE ERROR:", blob_id)
+    return None
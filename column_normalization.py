@@ -1,4 +1,5 @@
 # column_normalization.py
+from metrics import STAGE_SECONDS
 
 def normalize_col(col: str) -> str:
     return (
@@ -11,7 +12,8 @@ def normalize_col(col: str) -> str:
 
 
 def normalize_columns(df):
-    df.columns = [normalize_col(c) for c in df.columns]
+    with STAGE_SECONDS.time(stage="normalize_columns"):
+        df.columns = [normalize_col(c) for c in df.columns]
     return df
 
 
@@ -0,0 +1,144 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from column_normalization import normalize_col, normalize_columns
+
+
+# normalized column name -> type every loader should see
+DATE_COLUMNS = ["visitdate", "metricdate", "dob"]
+NUMERIC_COLUMNS = ["servicecharge", "painscore", "mobilityscore"]
+
+# low-cardinality labels, loaded as pandas categoricals
+CATEGORICAL_COLUMNS = ["insurance", "city", "state"]
+ID_COLUMNS = ["patientid"]
+
+# rough raw CSV bytes per row, only used to size work before parsing
+CSV_BYTES_PER_ROW = 40
+
+
+def columnar_path(path):
+    """Location of the Parquet copy that sits next to a raw CSV."""
+    return os.path.splitext(path)[0] + ".parquet"
+
+
+def coerce_types(df):
+    """Normalize column names and fix dtypes of the known clinic columns."""
+    df = normalize_columns(df)
+
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    return df
+
+
+def write_columnar(df, path):
+    coerce_types(df.copy()).to_parquet(path, index=False)
+
+
+def compact_dtypes(df):
+    """
+    Shrink an analysis frame: categoricals for repeated labels and the
+    smallest integer type that holds numeric IDs.
+    """
+    for col in CATEGORICAL_COLUMNS:
+        if col not in df.columns:
+            continue
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+        # groupby orders by category, so keep categories sorted like the
+        # plain string column would be
+        cats = df[col].cat.categories
+        if not cats.is_monotonic_increasing:
+            df[col] = df[col].cat.reorder_categories(cats.sort_values())
+
+    for col in ID_COLUMNS:
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+
+    return df
+
+
+def read_columnar(path, columns=None):
+    # label columns come straight out of the Parquet dictionary pages as
+    # categoricals, never materializing one Python string per row
+    names = columnar_columns(path)
+    dictionary = [
+        c for c in CATEGORICAL_COLUMNS
+        if c in names and (columns is None or c in columns)
+    ]
+
+    table = pq.read_table(
+        path,
+        columns=columns,
+        memory_map=True,
+        read_dictionary=dictionary,
+    )
+    return compact_dtypes(table.to_pandas(split_blocks=True, self_destruct=True))
+
+
+def columnar_columns(path):
+    """Column names from the Parquet footer, without reading any data."""
+    return pq.read_schema(path).names
+
+
+def load_table(data_dir, role, columns=None):
+    """
+    Load one input role, preferring its Parquet copy and falling back to
+    the raw CSV so older uploads keep working. columns are normalized
+    names; only those are read.
+    """
+    parquet = os.path.join(data_dir, f"{role}.parquet")
+    if os.path.exists(parquet):
+        return read_columnar(parquet, columns)
+
+    usecols = None
+    if columns is not None:
+        wanted = set(columns)
+        usecols = lambda c: normalize_col(c) in wanted
+
+    df = pd.read_csv(os.path.join(data_dir, f"{role}.csv"), usecols=usecols)
+    return compact_dtypes(coerce_types(df))
+
+
+def table_rows(data_dir, role):
+    """Row count from the Parquet footer, or a size-based guess for CSV."""
+    parquet = os.path.join(data_dir, f"{role}.parquet")
+    if os.path.exists(parquet):
+        return pq.ParquetFile(parquet).metadata.num_rows
+
+    return os.path.getsize(os.path.join(data_dir, f"{role}.csv")) // CSV_BYTES_PER_ROW
+
+
+def iter_table(data_dir, role, columns, chunk_rows):
+    """load_table in chunks of at most chunk_rows rows."""
+    parquet = os.path.join(data_dir, f"{role}.parquet")
+    if os.path.exists(parquet):
+        # plain buffered reads: a memory map (or pre-buffered row groups)
+        # keeps every page read so far resident, so the whole file
+        # would end up counted against a chunked run
+        pf = pq.ParquetFile(parquet, memory_map=False, pre_buffer=False)
+        dictionary = [c for c in CATEGORICAL_COLUMNS if c in columns]
+
+        for batch in pf.iter_batches(batch_size=chunk_rows, columns=columns):
+            table = pa.Table.from_batches([batch])
+            for col in dictionary:
+                i = table.schema.get_field_index(col)
+                if not pa.types.is_dictionary(table.schema.field(i).type):
+                    table = table.set_column(i, col, table.column(col).dictionary_encode())
+            yield compact_dtypes(table.to_pandas(split_blocks=True, self_destruct=True))
+        return
+
+    wanted = set(columns)
+    for chunk in pd.read_csv(
+        os.path.join(data_dir, f"{role}.csv"),
+        usecols=lambda c: normalize_col(c) in wanted,
+        chunksize=chunk_rows,
+    ):
+        yield compact_dtypes(coerce_types(chunk))
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import take
+
+
+# A joined table kept as its inputs plus, per input, the row each output
+# row comes from, instead of one wide frame with every patient attribute
+# copied onto every visit. Dimension columns stay dictionary-encoded in
+# their own (small) frame; a group-by gathers int codes through the row
+# index and reduces them with np.bincount. Columns are only materialized
+# when an aggregate has no kernel here.
+
+
+def _index_dtype(n):
+    return np.int32 if n < 2**31 else np.int64
+
+
+class CompactTable:
+    """
+    Rows of a join over frames: index[role] holds, for every row, the
+    row of frames[role] it came from (-1 where a left join found no
+    match; None for the base role before any filter = every row in
+    order). A column belongs to the first role that has it, as in the
+    merged frame, where same-named right-side join keys are dropped.
+    encoded (role -> {column: (codes, labels)}) keeps the group codes of
+    those roles' frames for the next table over the same frames.
+    """
+
+    def __init__(self, frames, base, encoded=None):
+        self.frames = frames
+        self.encoded = encoded or {}
+        self.index = {base: None}
+        self.owner = {c: base for c in frames[base].columns}
+        self.rows = len(frames[base])
+        self._dtype = _index_dtype(max(len(df) for df in frames.values()) + 1)
+        # gathered columns, reused by every aggregate until the rows change
+        self._columns = {}
+
+    def __len__(self):
+        return self.rows
+
+    def _compact(self, idx):
+        return idx if idx.dtype == self._dtype else idx.astype(self._dtype)
+
+    def join(self, role, left_idx, right_idx):
+        """Add role's rows; left_idx (None = all, in order) picks the current rows."""
+        if left_idx is not None:
+            left_idx = self._compact(left_idx)
+            self.index = {
+                r: left_idx if idx is None else idx[left_idx]
+                for r, idx in self.index.items()
+            }
+            self.rows = len(left_idx)
+
+        self.index[role] = self._compact(right_idx)
+        self._columns.clear()
+        for c in self.frames[role].columns:
+            self.owner.setdefault(c, role)
+
+    def select(self, mask):
+        """Keep the rows where mask is True."""
+        self.index = {
+            r: self._compact(np.flatnonzero(mask)) if idx is None else idx[mask]
+            for r, idx in self.index.items()
+        }
+        self.rows = len(next(iter(self.index.values())))
+        self._columns.clear()
+
+    def column(self, name):
+        """One column for every row, gathered through its role's index."""
+        if name in self._columns:
+            return self._columns[name]
+
+        role = self.owner[name]
+        values = self.frames[role][name]
+        idx = self.index[role]
+
+        if idx is None:
+            column = values.reset_index(drop=True)
+        else:
+            column = pd.Series(take(values.array, idx, allow_fill=bool((idx < 0).any())), name=name)
+
+        self._columns[name] = column
+        return column
+
+    def dtype(self, name):
+        return self.frames[self.owner[name]][name].dtype
+
+    def frame(self, columns):
+        # copy=False: base-role columns stay views of the loaded frame
+        return pd.DataFrame({c: self.column(c) for c in dict.fromkeys(columns)}, copy=False)
+
+    def codes(self, name):
+        """
+        Group codes of a column (-1 = null or no match) and its labels in
+        code order. Codes are computed on the source frame and then
+        gathered, so a patient attribute is encoded once per patient.
+        """
+        role = self.owner[name]
+        values = self.frames[role][name]
+        cache = self.encoded.get(role)
+
+        if cache is not None and name in cache:
+            codes, labels = cache[name]
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.to_numpy()
+            labels = values.cat.categories
+        else:
+            codes, labels = pd.factorize(values, sort=True)
+        if cache is not None:
+            cache[name] = codes, labels
+
+        idx = self.index[role]
+        if idx is not None:
+            missing = idx < 0
+            codes = codes.take(idx)
+            if missing.any():
+                codes[missing] = -1
+
+        return codes, labels, values.dtype
+
+
+def _labels(present, labels, dtype):
+    if isinstance(dtype, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(present, dtype=dtype)
+    return labels.take(present)
+
+
+def group_state(table, op, by, column=None, **_):
+    """
+    group_reduce before the division: (labels, dtype, state), where state
+    holds per code of by the rows ("rows") and, unless op is count, the
+    sum and count of the non-null values. States over the same labels
+    add up array by array.
+    """
+    codes, labels, dtype = table.codes(by)
+    keep = codes >= 0
+    partial = not keep.all()
+    if partial:
+        codes = codes[keep]
+
+    state = {"rows": np.bincount(codes, minlength=len(labels))}
+    if op == "count":
+        return labels, dtype, state
+
+    values = table.column(column).to_numpy(dtype="float64", na_value=np.nan)
+    if partial:
+        values = values[keep]
+
+    ok = ~np.isnan(values)
+    state["sum"] = np.bincount(codes, weights=np.where(ok, values, 0.0), minlength=len(labels))
+    state["count"] = np.bincount(codes[ok], minlength=len(labels))
+    return labels, dtype, state
+
+
+def group_frame(labels, dtype, state, op, by, column=None, name="count", **_):
+    """The group_reduce output of a group_state."""
+    present = np.flatnonzero(state["rows"])
+    keys = _labels(present, labels, dtype)
+
+    if op == "count":
+        return pd.DataFrame({by: keys, name: state["rows"][present]})
+
+    values = state["sum"][present]
+    if op == "mean":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = values / state["count"][present]
+
+    return pd.DataFrame({by: keys, column: values})
+
+
+def group_reduce(table, **r):
+    """
+    mean, sum or count of column per value of by, as
+    df.groupby(by, observed=True) gives them: groups sorted, null keys
+    dropped, null values skipped (a group of only nulls has mean NaN
+    and sum 0).
+    """
+    return group_frame(*group_state(table, **r), **r)
@@ -0,0 +1,239 @@
+import io
+import os
+import math
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import blob_store
+from analysis_registry import ANALYSES
+from metadata import list_cache
+from metrics import STAGE_SECONDS
+from schema_check import (
+    SCHEMA_SAMPLE_ROWS,
+    check_schema,
+    schema_error_message,
+    stored_schema,
+)
+
+
+# Two-phase uploads: the API hands out presigned URLs, the client sends
+# the file straight to B2, and a background validator checks the stored
+# object and records the user_files row. File bodies never pass through
+# the API process.
+
+DIRECT_UPLOAD_WORKERS = int(os.environ.get("DIRECT_UPLOAD_WORKERS", "2"))
+DIRECT_UPLOAD_MAX_MB = int(os.environ.get("DIRECT_UPLOAD_MAX_MB", "2048"))
+DIRECT_UPLOAD_URL_SECONDS = int(os.environ.get("DIRECT_UPLOAD_URL_SECONDS", "3600"))
+
+# files at least this large get a multipart upload, in parts of this size
+DIRECT_UPLOAD_PART_MB = int(os.environ.get("DIRECT_UPLOAD_PART_MB", "64"))
+
+# sessions still pending this long after they were opened are expired and
+# their parts or object deleted; checked every DIRECT_UPLOAD_SWEEP_SECONDS
+DIRECT_UPLOAD_EXPIRE_SECONDS = int(
+    os.environ.get("DIRECT_UPLOAD_EXPIRE_SECONDS", str(2 * DIRECT_UPLOAD_URL_SECONDS))
+)
+DIRECT_UPLOAD_SWEEP_SECONDS = float(os.environ.get("DIRECT_UPLOAD_SWEEP_SECONDS", "600"))
+
+# enough of the object for the header and the schema sample rows
+HEADER_READ_BYTES = 512 * (SCHEMA_SAMPLE_ROWS + 1)
+
+
+def storage_path(user_id, filename, analysis_key=None, file_role=None):
+    """
+    A fresh key per upload, so a file that fails validation never
+    replaces (or sits next to the Parquet copy of) an earlier one.
+    """
+    token = uuid.uuid4().hex
+
+    if analysis_key:
+        return f"raw/{user_id}/{analysis_key}/{token}/{file_role}.csv"
+    return f"raw/{user_id}/files/{token}/{os.path.basename(filename)}"
+
+
+def part_count(size, part_bytes=DIRECT_UPLOAD_PART_MB * 1024 * 1024):
+    """Number of multipart parts for a file of size bytes; 0 means a single PUT."""
+    if not size or size < part_bytes:
+        return 0
+    return math.ceil(size / part_bytes)
+
+
+def required_columns(session):
+    if not session.get("analysis_key"):
+        return ()
+    return ANALYSES[session["analysis_key"]]["files"][session["file_role"]]["required_columns"]
+
+
+def discard(storage, session):
+    """
+    Free what an unfinished session holds in storage: the parts of its
+    multipart upload, which are billed until aborted, and the object, in
+    case it was completed or PUT without the session being told.
+    """
+    if session.get("multipart_id"):
+        try:
+            storage.abort_multipart_upload(session["storage_path"], session["multipart_id"])
+        except Exception as e:
+            # completed or aborted already
+            print("UPLOAD DISCARD ERROR:", session["id"], repr(e))
+
+    try:
+        storage.delete_file(session["storage_path"])
+    except Exception as e:
+        print("UPLOAD DISCARD ERROR:", session["id"], repr(e))
+
+
+def expire_sessions(db, storage, max_age_seconds=DIRECT_UPLOAD_EXPIRE_SECONDS):
+    """Fail sessions that were never completed and discard them. Returns the count."""
+    now = datetime.utcnow()
+    cutoff = (now - timedelta(seconds=max_age_seconds)).isoformat()
+
+    # the status change is the claim: a session is discarded once
+    res = (
+        db.table("upload_sessions")
+        .update({"status": "failed", "error": "Upload expired", "finished_at": now.isoformat()})
+        .eq("status", "pending")
+        .lt("created_at", cutoff)
+        .execute()
+    )
+
+    for session in res.data or []:
+        discard(storage, session)
+
+    return len(res.data or [])
+
+
+# ---------- VALIDATION ----------
+def validate(db, storage, session, max_bytes=DIRECT_UPLOAD_MAX_MB * 1024 * 1024):
+    """
+    Check an uploaded object from a ranged read of its first bytes and,
+    if it passes, record it in user_files. Rejected objects are deleted.
+    Sessions that gave a sha256 register the object as a blob, so later
+    uploads of the same content can reference it; the object is hashed
+    first, and one that does not match the given sha256 is rejected.
+    Returns the upload_sessions fields to write.
+    """
+    path = session["storage_path"]
+
+    try:
+        size = storage.object_size(path)
+    except FileNotFoundError:
+        return {"status": "failed", "error": "File was not uploaded"}
+
+    if size > max_bytes:
+        storage.delete_file(path)
+        return {
+            "status": "failed",
+            "error": f"File is larger than {max_bytes // (1024 * 1024)} MB",
+        }
+
+    raw = storage.read_range(path, 0, HEADER_READ_BYTES)
+    schema = check_schema(io.BytesIO(raw), required_columns(session))
+
+    if not schema["ok"]:
+        storage.delete_file(path)
+        return {"status": "failed", "error": schema_error_message(schema)}
+
+    blob = {"id": None, "storage_path": path}
+    if session.get("sha256"):
+        # a blob is found again by its hash alone, so it must be the right one
+        with STAGE_SECONDS.time(stage="content_hash"):
+            digest = storage.object_sha256(path)
+
+        if digest != session["sha256"]:
+            storage.delete_file(path)
+            return {"status": "failed", "error": "File does not match its sha256"}
+
+        blob = blob_store.register(
+            db, storage, session["user_id"], session["sha256"], "raw",
+            path, schema["columns"], stored_schema(schema),
+        )
+
+    try:
+        row = db.table("user_files").insert({
+            "user_id": session["user_id"],
+            "filename": session["filename"],
+            "storage_path": blob["storage_path"],
+            "detected_columns": schema["columns"],
+            "inferred_schema": stored_schema(schema),
+            "blob_id": blob["id"],
+        }).execute()
+    except Exception:
+        if blob["id"] and blob_store.release(db, blob["id"]):
+            for key in blob_store.blob_objects(blob["storage_path"]):
+                storage.delete_file(key)
+        raise
+
+    list_cache.invalidate("files", session["user_id"])
+    return {"status": "completed", "file_id": row.data[0]["id"]}
+
+
+class UploadValidator:
+    """
+    Runs validate() for completed uploads on a small thread pool, and
+    expires abandoned sessions every sweep_seconds (0 = never).
+    """
+
+    def __init__(self, db, storage, workers=DIRECT_UPLOAD_WORKERS,
+                 sweep_seconds=DIRECT_UPLOAD_SWEEP_SECONDS):
+        self.db = db
+        self.storage = storage
+        self.workers = workers
+        self.sweep_seconds = sweep_seconds
+        self._pool = None
+        self._sweeper = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if not self._pool:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="upload-validator")
+
+        if self.sweep_seconds > 0 and not self._sweeper:
+            self._stopping.clear()
+            self._sweeper = threading.Thread(
+                target=self._sweep, name="upload-expiry", daemon=True
+            )
+            self._sweeper.start()
+
+    def stop(self):
+        if self._sweeper:
+            self._stopping.set()
+            self._sweeper.join()
+            self._sweeper = None
+
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _sweep(self):
+        while True:
+            try:
+                expire_sessions(self.db, self.storage)
+            except Exception as e:
+                print("UPLOAD EXPIRE ERROR:", repr(e))
+
+            if self._stopping.wait(self.sweep_seconds):
+                return
+
+    def submit(self, session):
+        if not self._pool:
+            self.start()
+        return self._pool.submit(self._run, session)
+
+    def _run(self, session):
+        try:
+            fields = validate(self.db, self.storage, session)
+        except Exception as e:
+            print("UPLOAD VALIDATE ERROR:", session["id"], repr(e))
+            fields = {"status": "failed", "error": "Could not validate upload"}
+
+        fields["finished_at"] = datetime.utcnow().isoformat()
+
+        try:
+            self.db.table("upload_sessions").update(fields).eq("id", session["id"]).execute()
+        except Exception as e:
+            print("UPLOAD VALIDATE ERROR:", session["id"], repr(e))
+
+        return fields
@@ -0,0 +1,193 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from columnar_store import coerce_types, NUMERIC_COLUMNS
+
+
+INGEST_MEMORY_LIMIT_MB = int(os.environ.get("INGEST_MEMORY_LIMIT_MB", "64"))
+
+# parsed DataFrame bytes per raw CSV byte (object columns dominate)
+PARSE_EXPANSION = 8
+SAMPLE_BYTES = 64 * 1024
+MIN_CHUNK_ROWS = 1_000
+DEFAULT_CHUNK_ROWS = 50_000
+
+
+class MissingColumns(Exception):
+    def __init__(self, missing):
+        super().__init__(f"Missing required columns: {missing}")
+        self.missing = missing
+
+
+class InconsistentColumn(Exception):
+    pass
+
+
+def chunk_rows_for(fileobj, memory_limit_bytes):
+    """
+    Size chunks so one parsed chunk plus its typed copy stays under the
+    memory limit, estimating bytes per row from the start of the file.
+    """
+    if not fileobj.seekable():
+        return DEFAULT_CHUNK_ROWS
+
+    pos = fileobj.tell()
+    sample = fileobj.read(SAMPLE_BYTES)
+    fileobj.seek(pos)
+
+    if isinstance(sample, str):
+        sample = sample.encode()
+
+    lines = sample.count(b"\n")
+    if not lines:
+        return MIN_CHUNK_ROWS
+
+    bytes_per_row = len(sample) / lines
+    rows = int(memory_limit_bytes / (2 * PARSE_EXPANSION * bytes_per_row))
+    return max(MIN_CHUNK_ROWS, rows)
+
+
+def _arrow_schema(table):
+    # widen types inferred from the first chunk so later chunks fit;
+    # known numeric columns are float64 whatever the first chunk holds
+    fields = []
+    for field in table.schema:
+        if field.name in NUMERIC_COLUMNS:
+            fields.append(pa.field(field.name, pa.float64()))
+        elif pa.types.is_null(field.type):
+            fields.append(pa.field(field.name, pa.string()))
+        elif pa.types.is_integer(field.type):
+            fields.append(pa.field(field.name, pa.int64()))
+        else:
+            fields.append(field)
+    return pa.schema(fields)
+
+
+def _is_number(t):
+    return pa.types.is_integer(t) or pa.types.is_floating(t)
+
+
+def _is_text(t):
+    return pa.types.is_string(t) or pa.types.is_large_string(t)
+
+
+def _wider(current, new):
+    """A type that holds values of both: int -> float64, anything else -> string."""
+    if current == new or pa.types.is_null(new) or _is_text(current):
+        return current
+    if pa.types.is_integer(current) and pa.types.is_integer(new):
+        return current
+    if _is_number(current) and _is_number(new):
+        return pa.float64()
+    if pa.types.is_timestamp(current) and pa.types.is_timestamp(new):
+        return current
+    # pandas text columns arrive as large_string
+    return pa.large_string()
+
+
+def _widen_schema(schema, chunk_schema):
+    return pa.schema([
+        pa.field(f.name, _wider(f.type, chunk_schema.field(f.name).type))
+        for f in schema
+    ])
+
+
+def _rewrite_wider(parquet_path, schema):
+    """
+    Parquet can't be appended to, so copy what was written so far into a
+    new writer with the wider schema, one row group at a time. Returns
+    the new writer, left open for the remaining chunks.
+    """
+    narrow = parquet_path + ".narrow"
+    os.replace(parquet_path, narrow)
+
+    writer = pq.ParquetWriter(parquet_path, schema)
+    try:
+        with pq.ParquetFile(narrow) as pf:
+            for batch in pf.iter_batches():
+                writer.write_table(_cast(pa.Table.from_batches([batch]), schema))
+    except BaseException:
+        writer.close()
+        raise
+    finally:
+        os.remove(narrow)
+
+    return writer
+
+
+def _cast(table, schema):
+    try:
+        return table.cast(schema)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        raise InconsistentColumn(f"Column types change partway through the file: {e}")
+
+
+def ingest_csv(
+    fileobj,
+    csv_path,
+    parquet_path,
+    required_columns=(),
+    rename=str.lower,
+    memory_limit_bytes=INGEST_MEMORY_LIMIT_MB * 1024 * 1024,
+    on_chunk=None,
+):
+    """
+    Stream a CSV upload in one pass: check the header against
+    required_columns on the first chunk, rename columns, and append each
+    chunk to a cleaned CSV and a typed Parquet file. Peak memory is one
+    chunk regardless of file size. Returns (columns, row_count).
+
+    Parquet types come from the first chunk. A later chunk that doesn't
+    fit widens its column (int to float64, anything else to string), and
+    the rows already written are rewritten with the wider type.
+    """
+    chunk_rows = chunk_rows_for(fileobj, memory_limit_bytes)
+
+    columns = None
+    rows = 0
+    writer = None
+    schema = None
+
+    try:
+        with open(csv_path, "w", newline="") as out:
+            for chunk in pd.read_csv(fileobj, chunksize=chunk_rows):
+                chunk.columns = [rename(c) for c in chunk.columns]
+
+                if columns is None:
+                    columns = list(chunk.columns)
+                    missing = [c for c in required_columns if c not in columns]
+                    if missing:
+                        raise MissingColumns(missing)
+
+                chunk.to_csv(out, header=(rows == 0), index=False)
+
+                table = pa.Table.from_pandas(
+                    coerce_types(chunk), preserve_index=False
+                )
+
+                if writer is None:
+                    schema = _arrow_schema(table)
+                    writer = pq.ParquetWriter(parquet_path, schema)
+                else:
+                    wider = _widen_schema(schema, table.schema)
+                    if wider != schema:
+                        writer.close()
+                        writer = None
+                        schema = wider
+                        writer = _rewrite_wider(parquet_path, schema)
+
+                writer.write_table(_cast(table, schema))
+                rows += len(chunk)
+
+                if on_chunk:
+                    on_chunk(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if columns is None:
+        raise MissingColumns(list(required_columns))
+
+    return columns, rows
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+try:
+    import redis
+    import redis.asyncio as aredis
+except ImportError:
+    redis = None
+
+
+# local: subscribers only see jobs run by this process (single worker).
+# redis: events go through Redis pub/sub, so any API worker can stream
+# any job.
+JOB_EVENTS_BACKEND = os.environ.get("JOB_EVENTS_BACKEND", "local").lower()
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+# last event kept per job, so a late subscriber still sees where it is
+JOB_EVENTS_HISTORY = int(os.environ.get("JOB_EVENTS_HISTORY", "1000"))
+JOB_EVENTS_HISTORY_SECONDS = int(os.environ.get("JOB_EVENTS_HISTORY_SECONDS", "3600"))
+
+# SSE comment sent when a stream is idle, so proxies keep it open
+JOB_EVENTS_KEEPALIVE_SECONDS = float(os.environ.get("JOB_EVENTS_KEEPALIVE_SECONDS", "15"))
+
+# an idle stream re-reads the job row this often, in case its events went
+# to another worker (local backend) and never arrive
+JOB_EVENTS_RECHECK_SECONDS = float(os.environ.get("JOB_EVENTS_RECHECK_SECONDS", "60"))
+
+TERMINAL_STAGES = ("completed", "failed", "cancelled")
+
+
+class LocalBus:
+    """
+    In-process pub/sub. publish() may be called from any thread; each
+    subscriber gets events on its own event loop.
+    """
+
+    def __init__(self, history=JOB_EVENTS_HISTORY):
+        self.history = history
+        self._subscribers = {}
+        self._last = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publish(self, job_id, event):
+        job_id = str(job_id)
+
+        with self._lock:
+            self._last[job_id] = event
+            self._last.move_to_end(job_id)
+            while len(self._last) > self.history:
+                self._last.popitem(last=False)
+
+            subscribers = list(self._subscribers.get(job_id, ()))
+
+        for loop, q in subscribers:
+            try:
+                loop.call_soon_threadsafe(q.put_nowait, event)
+            except RuntimeError:
+                # subscriber's loop already closed
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, job_id):
+        """Yields an asyncio.Queue of events, starting with the latest one."""
+        job_id = str(job_id)
+        sub = (asyncio.get_running_loop(), asyncio.Queue())
+
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(sub)
+            last = self._last.get(job_id)
+
+        if last:
+            sub[1].put_nowait(last)
+
+        try:
+            yield sub[1]
+        finally:
+            with self._lock:
+                subs = self._subscribers.get(job_id)
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[job_id]
+
+    async def close(self):
+        pass
+
+
+class RedisBus:
+    """Same interface as LocalBus over Redis pub/sub."""
+
+    def __init__(self, url=REDIS_URL, history_seconds=JOB_EVENTS_HISTORY_SECONDS):
+        if redis is None:
+            raise RuntimeError("JOB_EVENTS_BACKEND=redis needs the redis package")
+
+        self.history_seconds = history_seconds
+        self._sync = redis.Redis.from_url(url)
+        self._async = aredis.Redis.from_url(url)
+
+    @staticmethod
+    def _channel(job_id):
+        return f"job-events:{job_id}"
+
+    def publish(self, job_id, event):
+        channel = self._channel(job_id)
+        data = json.dumps(event)
+
+        pipe = self._sync.pipeline()
+        pipe.set(f"{channel}:last", data, ex=self.history_seconds)
+        pipe.publish(channel, data)
+        pipe.execute()
+
+    @asynccontextmanager
+    async def subscribe(self, job_id):
+        channel = self._channel(job_id)
+        q = asyncio.Queue()
+
+        pubsub = self._async.pubsub()
+        await pubsub.subscribe(channel)
+
+        last = await self._async.get(f"{channel}:last")
+        if last:
+            q.put_nowait(json.loads(last))
+
+        async def pump():
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    q.put_nowait(json.loads(message["data"]))
+
+        task = asyncio.create_task(pump())
+
+        try:
+            yield q
+        finally:
+            task.cancel()
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+
+    async def close(self):
+        await self._async.aclose()
+        self._sync.close()
+
+
+def make_bus(backend=JOB_EVENTS_BACKEND):
+    if backend == "redis":
+        return RedisBus()
+    if backend == "local":
+        return LocalBus()
+    raise ValueError(f"Unknown JOB_EVENTS_BACKEND: {backend}")
+
+
+def format_sse(event):
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def final_event(job_id, job):
+    return {
+        "job_id": job_id,
+        "stage": job["status"],
+        "error": job.get("error"),
+        "result_files": job.get("result_files"),
+    }
+
+
+async def stream_events(bus, job_id, job, load_state, is_disconnected):
+    """
+    SSE frames for one job, given its current row: every event published
+    for it until a final one, then the stream ends. While idle, sends a
+    keepalive comment every JOB_EVENTS_KEEPALIVE_SECONDS, stops once
+    is_disconnected(), and re-reads the row with load_state() every
+    JOB_EVENTS_RECHECK_SECONDS.
+    """
+    if job["status"] in TERMINAL_STAGES:
+        yield format_sse(final_event(job_id, job))
+        return
+
+    # the bus replays the latest event, so a job that finished since
+    # the row was read still ends the stream
+    async with bus.subscribe(job_id) as events:
+        rechecked = time.monotonic()
+
+        while True:
+            try:
+                event = await asyncio.wait_for(events.get(), JOB_EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+
+                if time.monotonic() - rechecked >= JOB_EVENTS_RECHECK_SECONDS:
+                    rechecked = time.monotonic()
+                    state = await load_state()
+                    if state and state["status"] in TERMINAL_STAGES:
+                        yield format_sse(final_event(job_id, state))
+                        return
+
+                yield ": keepalive\n\n"
+                continue
+
+            yield format_sse(event)
+
+            if event["stage"] in TERMINAL_STAGES:
+                return
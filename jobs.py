@@ -0,0 +1,951 @@
+import os
+import queue
+import socket
+import signal
+import threading
+import time
+import uuid
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from datetime import datetime, timedelta, timezone
+
+import metrics
+import result_cache
+from analysis_engine import run_analysis, plan
+from analysis_registry import ANALYSES
+from column_normalization import normalize_list
+from columnar_store import columnar_path, columnar_columns
+from schema_check import read_header, satisfies
+from rollups import rollup_path
+from workspace import workspaces as default_workspaces
+from metadata import resolve_files, list_cache
+from result_publisher import publish
+from metrics import STAGE_SECONDS, JOBS
+from profiling import JobProfiler, NO_PROFILER, PROFILE_FILES, profile_call
+
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "100"))
+JOB_TIMEOUT_SECONDS = float(os.environ.get("JOB_TIMEOUT_SECONDS", "900"))
+JOB_START_METHOD = os.environ.get("JOB_START_METHOD") or None
+JOB_DOWNLOAD_THREADS = int(os.environ.get("JOB_DOWNLOAD_THREADS", "4"))
+
+# status changes within this window are merged into one write (0 = write
+# each change immediately)
+JOB_STATUS_FLUSH_SECONDS = float(os.environ.get("JOB_STATUS_FLUSH_SECONDS", "0.5"))
+# failed status writes are kept and retried, backing off up to this long
+JOB_STATUS_RETRY_MAX_SECONDS = float(os.environ.get("JOB_STATUS_RETRY_MAX_SECONDS", "30"))
+# tries at a job's final status before it is left to the background retries
+JOB_STATUS_FINAL_ATTEMPTS = int(os.environ.get("JOB_STATUS_FINAL_ATTEMPTS", "4"))
+
+# each process heartbeats the jobs it holds; queued or running jobs with
+# no heartbeat for JOB_STALE_SECONDS were lost with their process
+# (restart, deploy, crash) and are re-queued by the next recovery sweep,
+# which runs at startup and every JOB_STALE_SECONDS after
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", "60"))
+# a job interrupted this many times is failed instead of re-queued
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
+# what a job needs to run, stored on its analysis_jobs row ("payload") so
+# that any process can pick it up
+JOB_PAYLOAD_FIELDS = (
+    "analysis_key",
+    "files",
+    "start_date",
+    "end_date",
+    "fingerprint",
+    "profile",
+)
+
+POLL_INTERVAL = 0.2
+
+
+class JobFailed(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobTimedOut(Exception):
+    pass
+
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+
+def _parse_time(value):
+    """A timestamp read back from the database, as naive UTC like _now()."""
+    if not value:
+        return None
+    t = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if t.tzinfo:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return t
+
+
+def job_payload(job):
+    return {k: job.get(k) for k in JOB_PAYLOAD_FIELDS}
+
+
+def _check(cancel_event, deadline):
+    if cancel_event.is_set():
+        raise JobCancelled()
+    if time.monotonic() > deadline:
+        raise JobTimedOut()
+
+
+# ---------- COMPUTE (child process) ----------
+def _compute(conn, analysis_key, data_dir, out_dir, start_date, end_date, profile_dir=None):
+    # own process group, so stopping the job also stops the analysis
+    # worker processes it starts
+    os.setpgrp()
+
+    # messages: ("output", name, done, total) while running, ("metric",
+    # name, value, labels) for each observation, then ("done", error)
+    metrics.forward_to(lambda *a: conn.send(("metric", *a)))
+
+    run = partial(
+        run_analysis,
+        analysis_key,
+        data_dir,
+        out_dir,
+        start_date=start_date,
+        end_date=end_date,
+        progress=lambda *a: conn.send(("output", *a)),
+    )
+
+    try:
+        if profile_dir:
+            profile_call(profile_dir, run)
+        else:
+            run()
+        conn.send(("done", None))
+    except Exception as e:
+        conn.send(("done", str(e) or repr(e)))
+    finally:
+        conn.close()
+
+
+def _stop(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        # exited already, or has not made its group yet
+        if proc.is_alive():
+            proc.terminate()
+    proc.join()
+
+
+def run_compute(job, data_dir, out_dir, cancel_event, deadline, use_processes=True,
+                on_output=None, profile_dir=None):
+    args = (
+        job["analysis_key"],
+        data_dir,
+        out_dir,
+        job.get("start_date"),
+        job.get("end_date"),
+    )
+
+    if not use_processes:
+        run = partial(
+            run_analysis, *args[:3], start_date=args[3], end_date=args[4], progress=on_output
+        )
+        try:
+            if profile_dir:
+                profile_call(profile_dir, run)
+            else:
+                run()
+        except Exception as e:
+            raise JobFailed(str(e))
+        return
+
+    ctx = multiprocessing.get_context(JOB_START_METHOD)
+    recv, send = ctx.Pipe(duplex=False)
+    # not a daemon: daemonic processes may not start the analysis pool
+    proc = ctx.Process(target=_compute, args=(send, *args, profile_dir))
+    proc.start()
+    send.close()
+
+    try:
+        while True:
+            while not recv.poll(POLL_INTERVAL):
+                _check(cancel_event, deadline)
+
+            try:
+                kind, *msg = recv.recv()
+            except EOFError:
+                proc.join()
+                raise JobFailed(
+                    f"Analysis process exited unexpectedly (exit code {proc.exitcode})"
+                )
+
+            if kind == "done":
+                error = msg[0]
+                break
+            if kind == "metric":
+                metrics.apply(*msg)
+            elif on_output:
+                on_output(*msg)
+    finally:
+        _stop(proc)
+        recv.close()
+
+    if error:
+        raise JobFailed(error)
+
+
+# ---------- PIPELINE ----------
+def _download_role(storage, ws, analysis, role, storage_path):
+    with STAGE_SECONDS.time(stage="download"):
+        _fetch_role(storage, ws, analysis, role, storage_path)
+
+
+def _fetch_role(storage, ws, analysis, role, storage_path):
+    # answer from the pre-aggregated rollup when the analysis can
+    if role in analysis.get("rollup_roles", []):
+        try:
+            storage.download_file_cached(
+                rollup_path(storage_path),
+                os.path.join(ws.data_dir, f"{role}.rollup.parquet"),
+            )
+            return
+        except FileNotFoundError:
+            pass
+
+    # prefer the typed Parquet copy written at upload time
+    try:
+        storage.download_file_cached(
+            columnar_path(storage_path),
+            os.path.join(ws.data_dir, f"{role}.parquet"),
+        )
+    except FileNotFoundError:
+        storage.download_file_cached(
+            storage_path,
+            os.path.join(ws.data_dir, f"{role}.csv"),
+        )
+
+
+def _wait(futures, cancel_event, deadline):
+    """Wait for futures, checking for cancellation; re-raises the first error."""
+    try:
+        for f in futures:
+            while True:
+                _check(cancel_event, deadline)
+                try:
+                    f.result(timeout=POLL_INTERVAL)
+                    break
+                except TimeoutError:
+                    continue
+    except BaseException:
+        for f in futures:
+            f.cancel()
+        raise
+
+
+def execute_job(
+    job,
+    db,
+    storage,
+    cancel_event,
+    deadline,
+    use_processes=True,
+    workspaces=default_workspaces,
+    progress=None,
+):
+    """
+    Download inputs, validate them, run the analysis and upload
+    the outputs for one queued job. Returns the uploaded file names and
+    the result manifest (see result_publisher.publish). progress(stage,
+    **data) is called as the job moves through its stages.
+    """
+    report = progress or (lambda stage, **data: None)
+    profiler = JobProfiler() if job.get("profile") else NO_PROFILER
+    job_id = job["job_id"]
+    analysis = ANALYSES[job["analysis_key"]]
+
+    # 1. look up inputs the analysis actually reads
+    needed = plan(job["analysis_key"])["roles"]
+
+    _check(cancel_event, deadline)
+    with STAGE_SECONDS.time(stage="metadata_lookup"), profiler.section("metadata_lookup"):
+        rows = resolve_files(
+            db,
+            job["user_id"],
+            {role: f for role, f in job["files"].items() if role in needed},
+        )
+
+    # 2. validate columns from the schema recorded at upload, so a bad
+    #    file fails before anything is downloaded
+    report("validating")
+    unverified = []
+    for role in needed:
+        cfg = analysis["files"][role]
+
+        if not rows.get(role):
+            raise JobFailed(f"Missing file for role: {role}")
+
+        schema = rows[role].get("inferred_schema")
+        if not schema:
+            unverified.append(role)
+            continue
+
+        if not satisfies(schema, cfg["required_columns"]):
+            required = normalize_list(cfg["required_columns"])
+            missing = [c for c in required if c not in schema["columns"]]
+            raise JobFailed(f"{role} missing columns: {missing}")
+
+    with workspaces.workspace(f"job-{job_id}") as ws:
+        profile_dir = ws.path("profile") if job.get("profile") else None
+
+        try:
+            # 3. download inputs, all roles at once
+            report("downloading")
+            # the job thread only waits here; the pool threads are traced
+            with profiler.section("download", trace=False):
+                download = profiler.traced("download", _download_role)
+                with ThreadPoolExecutor(JOB_DOWNLOAD_THREADS) as pool:
+                    futures = [
+                        pool.submit(download, storage, ws, analysis, role, row["storage_path"])
+                        for role, row in rows.items()
+                    ]
+                    _wait(futures, cancel_event, deadline)
+
+            ws.check_quota()
+
+            # 4. header-only validation for files uploaded before schemas
+            #    were recorded
+            for role in unverified:
+                parquet = os.path.join(ws.data_dir, f"{role}.parquet")
+                path = os.path.join(ws.data_dir, f"{role}.csv")
+
+                if os.path.exists(parquet):
+                    columns = columnar_columns(parquet)
+                elif os.path.exists(path):
+                    columns = normalize_list(read_header(path))
+                else:
+                    # rollups are only built for validated uploads
+                    continue
+
+                required = normalize_list(analysis["files"][role]["required_columns"])
+                missing = [c for c in required if c not in columns]
+
+                if missing:
+                    raise JobFailed(f"{role} missing columns: {missing}")
+
+            # 5. run analysis
+            report("running")
+            # traced by profile_call wherever the analysis runs
+            with STAGE_SECONDS.time(stage="analysis"), profiler.section(
+                "analysis", trace=False, scope="analysis process"
+            ):
+                run_compute(
+                    job,
+                    ws.data_dir,
+                    ws.out_dir,
+                    cancel_event,
+                    deadline,
+                    use_processes,
+                    on_output=lambda name, done, total: report(
+                        "running", output=name, done=done, total=total
+                    ),
+                    profile_dir=profile_dir,
+                )
+            ws.check_quota()
+
+            # 6. encode and upload results, all at once
+            report("uploading")
+            # encodes and uploads run on publish's own pool threads
+            with STAGE_SECONDS.time(stage="upload"), profiler.section("upload", trace=False):
+                names, manifest = publish(
+                    storage,
+                    ws.out_dir,
+                    ws.path("publish"),
+                    f"results/{job_id}",
+                    check=lambda: _check(cancel_event, deadline),
+                )
+
+        finally:
+            # slow jobs that time out are the ones worth profiling, so
+            # the profile is uploaded whatever the outcome
+            profile_files = []
+            if profile_dir:
+                profile_files = _upload_profile(storage, profiler, profile_dir, job_id)
+
+        return names + profile_files, manifest
+
+
+def _upload_profile(storage, profiler, profile_dir, job_id):
+    """Store the job profile next to its outputs; returns the file names."""
+    try:
+        paths = profiler.write(profile_dir)
+        for path in paths:
+            storage.upload_file(path, f"results/{job_id}/{os.path.basename(path)}")
+        return [os.path.basename(p) for p in paths]
+    except Exception as e:
+        print("JOB PROFILE ERROR:", job_id, repr(e))
+        return []
+
+
+# ---------- STATUS WRITES ----------
+class StatusWriter:
+    """
+    Coalesces analysis_jobs status updates. Fields set for a job are
+    merged and written once per flush, so a job that starts and finishes
+    between flushes costs one update instead of two. Writes skip rows
+    that are cancelled: a cancel is final, whichever process made it.
+
+    A failed write is kept and retried with exponential backoff, with
+    fields set since then taking precedence. Final statuses (set with
+    final=True) are written at once and retried in place a few times
+    before being left to the background retries; they are never dropped.
+    on_write(job_id, user_id, fields) runs after each write.
+    """
+
+    def __init__(
+        self,
+        db,
+        interval=JOB_STATUS_FLUSH_SECONDS,
+        on_write=None,
+        retry_max_seconds=JOB_STATUS_RETRY_MAX_SECONDS,
+        final_attempts=JOB_STATUS_FINAL_ATTEMPTS,
+    ):
+        self.db = db
+        self.interval = interval
+        self.on_write = on_write
+        self.retry_max_seconds = retry_max_seconds
+        self.final_attempts = final_attempts
+        self.writes = 0
+
+        self._pending = {}
+        # job_id -> (failed writes in a row, monotonic time of next try)
+        self._retry = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval > 0 and not self._thread:
+            self._wake.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name="job-status-writer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        if self._thread:
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+
+        for attempt in range(1, self.final_attempts + 1):
+            self.flush(force=True)
+            if not self.pending():
+                return
+            if attempt < self.final_attempts:
+                time.sleep(self._backoff(attempt))
+
+        print("JOB STATUS ERROR: unwritten at shutdown:", sorted(self._pending))
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def set(self, job_id, fields, user_id=None, final=False):
+        with self._lock:
+            self._merge(job_id, user_id, fields)
+
+        if final:
+            self._write_final(job_id)
+        elif not self._thread:
+            self.flush()
+
+    def flush(self, force=False):
+        """Write pending updates; ones backing off are skipped unless force."""
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                job_id for job_id in self._pending
+                if force or self._retry.get(job_id, (0, 0))[1] <= now
+            ]
+            batch = {job_id: self._pending.pop(job_id) for job_id in due}
+
+        for job_id, (user_id, fields) in batch.items():
+            self._write(job_id, user_id, fields)
+
+    def _merge(self, job_id, user_id, fields, older=False):
+        owner, pending = self._pending.get(job_id, (user_id, {}))
+        pending = {**fields, **pending} if older else {**pending, **fields}
+        self._pending[job_id] = (owner or user_id, pending)
+
+    def _backoff(self, failures):
+        return min(self.retry_max_seconds, 0.5 * 2 ** (failures - 1))
+
+    def _write(self, job_id, user_id, fields):
+        """One attempt; on failure the fields go back to pending. Returns success."""
+        try:
+            with STAGE_SECONDS.time(stage="job_update"):
+                (
+                    self.db.table("analysis_jobs")
+                    .update(fields)
+                    .eq("id", job_id)
+                    .neq("status", "cancelled")
+                    .execute()
+                )
+        except Exception as e:
+            print("JOB STATUS ERROR:", job_id, repr(e))
+            with self._lock:
+                failures = self._retry.get(job_id, (0, 0))[0] + 1
+                self._retry[job_id] = (failures, time.monotonic() + self._backoff(failures))
+                self._merge(job_id, user_id, fields, older=True)
+            return False
+
+        self.writes += 1
+        with self._lock:
+            self._retry.pop(job_id, None)
+
+        if self.on_write:
+            self.on_write(job_id, user_id, fields)
+        return True
+
+    def _write_final(self, job_id):
+        for attempt in range(1, self.final_attempts + 1):
+            with self._lock:
+                entry = self._pending.pop(job_id, None)
+            if entry is None:
+                # taken by a flush running at the same time
+                return
+            if self._write(job_id, *entry):
+                return
+            if attempt < self.final_attempts:
+                time.sleep(self._backoff(attempt))
+
+    def _loop(self):
+        while not self._wake.wait(self.interval):
+            self.flush()
+
+
+def _invalidate_jobs(job_id, user_id, fields):
+    if user_id:
+        list_cache.invalidate("jobs", user_id)
+
+
+# ---------- QUEUE ----------
+class JobQueue:
+    """
+    Bounded queue of analysis jobs drained by a fixed number of worker
+    threads. I/O runs on the worker thread; run_analysis runs in a
+    child process so it can be terminated on timeout or cancellation.
+
+    Jobs live on their analysis_jobs rows as well as in memory: each row
+    holds the job payload and the id of the process running it, which
+    heartbeats the row. A maintenance thread keeps those heartbeats up,
+    stops jobs whose row another process cancelled, and re-queues jobs
+    whose process stopped heartbeating (see recover()). On stop(), jobs
+    still queued or running are handed back rather than cancelled.
+    """
+
+    def __init__(
+        self,
+        db,
+        storage,
+        workers=JOB_WORKERS,
+        max_queued=JOB_QUEUE_SIZE,
+        timeout=JOB_TIMEOUT_SECONDS,
+        use_processes=True,
+        workspaces=default_workspaces,
+        status_flush_seconds=JOB_STATUS_FLUSH_SECONDS,
+        events=None,
+        heartbeat_seconds=JOB_HEARTBEAT_SECONDS,
+        stale_seconds=JOB_STALE_SECONDS,
+        max_attempts=JOB_MAX_ATTEMPTS,
+    ):
+        self.db = db
+        self.events = events
+        self.status = StatusWriter(db, status_flush_seconds, on_write=_invalidate_jobs)
+        self.storage = storage
+        self.workspaces = workspaces
+        self.workers = workers
+        self.timeout = timeout
+        self.use_processes = use_processes
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._cancel_events = {}
+        self._owners = {}
+        self._running = set()
+        # cancelled on request, as opposed to interrupted by stop()
+        self._cancelled = set()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._maintainer = None
+
+    def start(self):
+        if self._threads:
+            return
+
+        self._stopping.clear()
+        self.status.start()
+
+        for i in range(self.workers):
+            t = threading.Thread(
+                target=self._worker,
+                name=f"job-worker-{i}",
+                daemon=True,
+            )
+            t.start()
+            self._threads.append(t)
+
+        self._maintainer = threading.Thread(
+            target=self._maintain, name="job-maintenance", daemon=True
+        )
+        self._maintainer.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+
+        with self._lock:
+            for event in self._cancel_events.values():
+                event.set()
+
+        for _ in self._threads:
+            self._queue.put(None)
+
+        for t in self._threads:
+            t.join(timeout)
+
+        if self._maintainer:
+            self._maintainer.join(timeout)
+            self._maintainer = None
+
+        self._threads = []
+        self.status.stop()
+
+    def new_row(self, job):
+        """analysis_jobs columns for a new queued job owned by this queue."""
+        return {
+            "user_id": job["user_id"],
+            "status": "queued",
+            "analysis_key": job["analysis_key"],
+            "start_date": job.get("start_date"),
+            "end_date": job.get("end_date"),
+            "payload": job_payload(job),
+            "worker_id": self.worker_id,
+            "heartbeat_at": _now(),
+            "attempts": 1,
+        }
+
+    def submit(self, job):
+        """Queue a job. Raises queue.Full when the queue is at capacity."""
+        job_id = str(job["job_id"])
+
+        with self._lock:
+            self._cancel_events[job_id] = threading.Event()
+            self._owners[job_id] = job.get("user_id")
+
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+                self._owners.pop(job_id, None)
+            raise
+
+        self._emit(job_id, "queued")
+
+    def cancel(self, job_id):
+        """
+        Request cancellation of a job owned by this queue.
+        Returns False if the job is unknown here.
+        """
+        job_id = str(job_id)
+
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+            if event is None:
+                return False
+
+            event.set()
+            self._cancelled.add(job_id)
+            started = job_id in self._running
+
+        if not started:
+            self._finish(job_id, "cancelled", error="Cancelled")
+
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def running(self):
+        with self._lock:
+            return len(self._running)
+
+    def heartbeat(self):
+        """
+        Mark the jobs this queue holds as alive, and stop those whose row
+        was cancelled (or removed) by another process in the meantime.
+        """
+        with self._lock:
+            held = list(self._cancel_events)
+        if not held:
+            return
+
+        res = (
+            self.db.table("analysis_jobs")
+            .update({"heartbeat_at": _now()})
+            .in_("id", held)
+            .neq("status", "cancelled")
+            .execute()
+        )
+        alive = {str(row["id"]) for row in res.data or []}
+
+        for job_id in held:
+            if job_id not in alive:
+                self.cancel(job_id)
+
+    def recover(self):
+        """
+        Re-queue jobs lost with their process: queued or running rows
+        whose heartbeat is older than stale_seconds. Each row is claimed
+        by a compare-and-set on its heartbeat, so when several processes
+        sweep at once only one of them takes it. Rows without a payload
+        (queued before payloads were stored) and jobs already interrupted
+        max_attempts times are failed instead. Returns the number of jobs
+        re-queued.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        res = (
+            self.db.table("analysis_jobs")
+            .select("id,user_id,status,heartbeat_at,attempts,payload")
+            .in_("status", ["queued", "running"])
+            .execute()
+        )
+
+        recovered = 0
+        for row in res.data or []:
+            job_id = str(row["id"])
+            beat = _parse_time(row.get("heartbeat_at"))
+
+            with self._lock:
+                held = job_id in self._cancel_events
+            if held or (beat and beat > cutoff):
+                continue
+            if self._queue.full():
+                # leave the rest for a later sweep, or another process
+                break
+
+            attempts = (row.get("attempts") or 1) + 1
+            if not self._claim(row, attempts):
+                continue
+
+            payload = row.get("payload")
+            if not payload:
+                self._finish(job_id, "failed", error="Interrupted by a server restart",
+                             user_id=row["user_id"])
+            elif attempts > self.max_attempts:
+                self._finish(job_id, "failed", error=f"Interrupted {attempts - 1} times",
+                             user_id=row["user_id"])
+            else:
+                try:
+                    self.submit({"job_id": job_id, "user_id": row["user_id"], **payload})
+                    recovered += 1
+                except queue.Full:
+                    self._finish(job_id, "failed", error="Job queue is full",
+                                 user_id=row["user_id"])
+
+        return recovered
+
+    # ---------- internals ----------
+    def _claim(self, row, attempts):
+        q = (
+            self.db.table("analysis_jobs")
+            .update({
+                "status": "queued",
+                "worker_id": self.worker_id,
+                "heartbeat_at": _now(),
+                "attempts": attempts,
+            })
+            .eq("id", row["id"])
+            .in_("status", ["queued", "running"])
+        )
+        if row.get("heartbeat_at") is None:
+            q = q.is_("heartbeat_at", "null")
+        else:
+            q = q.eq("heartbeat_at", row["heartbeat_at"])
+
+        return bool(q.execute().data)
+
+    def _maintain(self):
+        next_sweep = 0.0
+
+        while True:
+            if time.monotonic() >= next_sweep:
+                try:
+                    self.recover()
+                except Exception as e:
+                    print("JOB RECOVERY ERROR:", repr(e))
+                next_sweep = time.monotonic() + self.stale_seconds
+
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print("JOB HEARTBEAT ERROR:", repr(e))
+
+            if self._stopping.wait(self.heartbeat_seconds):
+                return
+
+    def _row_status(self, job_id):
+        try:
+            res = (
+                self.db.table("analysis_jobs")
+                .select("status")
+                .eq("id", job_id)
+                .execute()
+            )
+        except Exception as e:
+            print("JOB STATUS ERROR:", job_id, repr(e))
+            return None
+        return res.data[0]["status"] if res.data else None
+
+    def _interrupted(self, job_id):
+        # stopped by stop(), not cancelled by anyone
+        return self._stopping.is_set() and job_id not in self._cancelled
+
+    def _release(self, job_id):
+        # hand the job back for the next recovery sweep, in this process
+        # after a restart or in another one
+        self._update(
+            job_id, {"status": "queued", "worker_id": None, "heartbeat_at": None}, final=True
+        )
+        self._emit(job_id, "queued")
+
+    def _update(self, job_id, fields, user_id=None, final=False):
+        self.status.set(job_id, fields, user_id or self._owners.get(job_id), final)
+
+    def _emit(self, job_id, stage, **data):
+        if not self.events:
+            return
+        try:
+            self.events.publish(job_id, {"job_id": job_id, "stage": stage, **data})
+        except Exception as e:
+            print("JOB EVENTS ERROR:", job_id, repr(e))
+
+    def _finish(self, job_id, status, error=None, result_files=None, result_manifest=None,
+                user_id=None):
+        fields = {
+            "status": status,
+            "finished_at": _now(),
+        }
+        if error is not None:
+            fields["error"] = error
+        if result_files is not None:
+            fields["result_files"] = result_files
+        if result_manifest is not None:
+            fields["result_manifest"] = result_manifest
+
+        self._update(job_id, fields, user_id, final=True)
+        self._emit(job_id, status, error=error, result_files=result_files)
+        JOBS.inc(status=status)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+
+            if job is None:
+                self._queue.task_done()
+                return
+
+            job_id = str(job["job_id"])
+
+            try:
+                self._run(job_id, job)
+            except Exception as e:
+                print("JOB WORKER ERROR:", job_id, repr(e))
+            finally:
+                with self._lock:
+                    self._cancel_events.pop(job_id, None)
+                    self._owners.pop(job_id, None)
+                    self._running.discard(job_id)
+                    self._cancelled.discard(job_id)
+                self._queue.task_done()
+
+    def _run(self, job_id, job):
+        # cancelled through another process while it sat in the queue
+        if self._row_status(job_id) == "cancelled":
+            self._emit(job_id, "cancelled", error="Cancelled")
+            return
+
+        with self._lock:
+            cancel_event = self._cancel_events[job_id]
+            stopped = cancel_event.is_set()
+            if not stopped:
+                self._running.add(job_id)
+
+        if stopped:
+            # cancel() has already marked it cancelled, unless stop() did it
+            if self._interrupted(job_id):
+                self._release(job_id)
+            return
+
+        self._update(job_id, {"status": "running"})
+        deadline = time.monotonic() + self.timeout
+
+        try:
+            uploaded_files, manifest = execute_job(
+                job,
+                self.db,
+                self.storage,
+                cancel_event,
+                deadline,
+                use_processes=self.use_processes,
+                workspaces=self.workspaces,
+                progress=lambda stage, **data: self._emit(job_id, stage, **data),
+            )
+
+        except JobCancelled:
+            if self._interrupted(job_id):
+                self._release(job_id)
+            else:
+                self._finish(job_id, "cancelled", error="Cancelled")
+
+        except JobTimedOut:
+            self._finish(
+                job_id,
+                "failed",
+                error=f"Job exceeded timeout of {self.timeout:g} seconds",
+            )
+
+        except Exception as e:
+            self._finish(job_id, "failed", error=str(e))
+
+        else:
+            self._finish(
+                job_id,
+                "completed",
+                result_files=uploaded_files,
+                result_manifest=manifest,
+            )
+
+            if job.get("fingerprint"):
+                try:
+                    result_cache.store(
+                        self.db,
+                        job["fingerprint"],
+                        job["user_id"],
+                        job["analysis_key"],
+                        job["files"],
+                        f"results/{job_id}",
+                        [f for f in uploaded_files if f not in PROFILE_FILES],
+                        manifest,
+                    )
+                except Exception as e:
+                    print("RESULT CACHE ERROR:", repr(e))
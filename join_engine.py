@@ -0,0 +1,396 @@
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import take
+
+
+# Sort-based joins on integer-encoded keys.
+#
+# Every key column is turned into order-preserving int64 codes shared by
+# both sides (dense ids and whole-day dates are used as offsets directly,
+# anything else is factorized), and the codes are packed into one int64
+# per row. Both sides are sorted on that key (skipped when already
+# sorted), and binary searches of the sorted left keys walk the right
+# side in order instead of jumping around it.
+
+DAY_NS = 86_400 * 10**9
+
+# packed keys must stay below this
+MAX_KEY_SPACE = 2**62
+
+# key spaces up to this size are joined through a per-key match table
+DIRECT_MAX_KEYS = 1 << 24
+
+
+class KeySpaceTooLarge(Exception):
+    pass
+
+
+def _as_int(values):
+    """int64 view of integer or datetime64 keys, plus a null mask; None otherwise."""
+    if values.dtype.kind == "M":
+        ints = values.astype("datetime64[ns]").view("int64")
+        return ints, np.isnat(values)
+    if values.dtype.kind in "iu":
+        return values.astype("int64"), np.zeros(len(values), dtype=bool)
+    return None
+
+
+def _key_codes(left, right, max_codes=MAX_KEY_SPACE):
+    """
+    Order-preserving codes for one key column on both sides. Nulls get
+    code 0 so they match each other, like DataFrame.merge. Integer and
+    date values are used as offsets while their span stays within
+    max_codes and ranked otherwise (timestamps with a time of day span
+    ~10^16 ns a year). Returns (left_codes, right_codes, cardinality).
+    """
+    lv, rv = left.to_numpy(), right.to_numpy()
+    li, ri = _as_int(lv), _as_int(rv)
+
+    if li is not None and ri is not None:
+        values = np.concatenate([li[0], ri[0]])
+        nulls = np.concatenate([li[1], ri[1]])
+        del li, ri
+        any_null = nulls.any()
+        valid = values[~nulls] if any_null else values
+
+        if len(valid):
+            step = DAY_NS if lv.dtype.kind == "M" and not (valid % DAY_NS).any() else 1
+            low, high = valid.min(), valid.max()
+            span = (int(high) - int(low)) // step + 2
+            del valid
+
+            if span <= max_codes:
+                # in place: at 10M+ rows every temporary here is 100+ MB
+                codes = values
+                codes -= low
+                codes //= step
+                codes += 1
+                if any_null:
+                    codes[nulls] = 0
+                return codes[:len(lv)], codes[len(lv):], span
+
+            # too wide for offsets: rank the distinct values instead (a
+            # null is the smallest int64, so it ranks first)
+            uniques, codes = np.unique(values, return_inverse=True)
+            codes = codes.astype("int64", copy=False)
+            return codes[:len(lv)], codes[len(lv):], len(uniques)
+
+    codes, uniques = pd.factorize(
+        pd.concat([left, right], ignore_index=True), sort=True, use_na_sentinel=False
+    )
+    codes = codes.astype("int64")
+    return codes[:len(lv)], codes[len(lv):], len(uniques)
+
+
+def pack_keys(left, right, left_on, right_on):
+    """
+    One int64 per row whose order follows the key columns in turn, and
+    the number of codes of each key (its radix in the packed key).
+    """
+    lk = np.zeros(len(left), dtype="int64")
+    rk = np.zeros(len(right), dtype="int64")
+    sizes = []
+
+    for lcol, rcol in zip(left_on, right_on):
+        room = MAX_KEY_SPACE // int(np.prod(sizes, dtype="float64"))
+        lc, rc, n = _key_codes(left[lcol], right[rcol], room)
+
+        sizes.append(n)
+        if np.prod(sizes, dtype="float64") > MAX_KEY_SPACE:
+            raise KeySpaceTooLarge(f"{left_on} keys do not fit in 64 bits")
+
+        lk *= n
+        lk += lc
+        rk *= n
+        rk += rc
+
+    return lk, rk, sizes
+
+
+def _sorted(keys):
+    """
+    The order that sorts keys and the sorted keys. Stable, so equal keys
+    keep their row order and tie-breaking never depends on the sort.
+    """
+    if len(keys) < 2 or (keys[1:] >= keys[:-1]).all():
+        return np.arange(len(keys)), keys
+    order = np.argsort(keys, kind="stable")
+    return order, keys[order]
+
+
+def _search(sorted_keys, keys, side):
+    """np.searchsorted for unsorted keys, searching them in sorted order."""
+    order, keys = _sorted(keys)
+    out = np.empty(len(keys), dtype="int64")
+    out[order] = np.searchsorted(sorted_keys, keys, side=side)
+    return out
+
+
+def lookup_index(left, right, left_on, right_on):
+    """
+    The right row matching each left row (-1 = none) through a lookup
+    table, when the join is on one integer key that is unique on the
+    right over a span of at most DIRECT_MAX_KEYS values (patient ids).
+    None when that does not hold.
+    """
+    if len(left_on) != 1:
+        return None
+
+    lv = left[left_on[0]].to_numpy()
+    rv = right[right_on[0]].to_numpy()
+    if lv.dtype.kind not in "iu" or rv.dtype.kind not in "iu" or not len(rv):
+        return None
+
+    low, high = int(rv.min()), int(rv.max())
+    if high - low >= DIRECT_MAX_KEYS:
+        return None
+
+    dtype = np.int32 if len(rv) < 2**31 else np.int64
+    table = np.full(high - low + 1, -1, dtype=dtype)
+    table[rv - low] = np.arange(len(rv), dtype=dtype)
+    if np.count_nonzero(table >= 0) != len(rv):
+        # duplicate keys on the right
+        return None
+
+    inside = (lv >= low) & (lv <= high)
+    out = np.full(len(lv), -1, dtype=dtype)
+    out[inside] = table[lv[inside] - low]
+    return out
+
+
+def _assemble(left, right, left_idx, right_idx, drop_right):
+    """
+    Left rows at left_idx (None = all, in order) beside right rows at
+    right_idx (-1 = no match), naming overlapping columns the way
+    DataFrame.merge does.
+    """
+    right = right.drop(columns=drop_right)
+    overlap = set(left.columns) & set(right.columns)
+
+    out = left if left_idx is None else left.take(left_idx)
+    out = out.reset_index(drop=True)
+    out.columns = [f"{c}_x" if c in overlap else c for c in out.columns]
+
+    fill = (right_idx < 0).any()
+    matched = pd.DataFrame({
+        f"{c}_y" if c in overlap else c: take(right[c].array, right_idx, allow_fill=fill)
+        for c in right.columns
+    })
+
+    return pd.concat([out, matched], axis=1)
+
+
+def sorted_join(left, right, left_on, right_on, how="inner"):
+    """
+    Equality join on the key columns, same rows as DataFrame.merge with
+    how "inner" or "left". Left row order is kept; the matches of one
+    left row come in no particular order.
+    """
+    left_idx, right_idx = sorted_join_index(left, right, left_on, right_on, how)
+
+    same = [r for l, r in zip(left_on, right_on) if l == r]
+    return _assemble(left, right, left_idx, right_idx, same)
+
+
+def sorted_join_index(left, right, left_on, right_on, how="inner"):
+    """
+    The rows of sorted_join as (left_idx, right_idx): positions in left
+    (None = every left row, in order) and in right (-1 = no match).
+    """
+    if how not in ("inner", "left"):
+        raise ValueError(f"sorted join does not support how={how!r}")
+
+    right_idx = lookup_index(left, right, left_on, right_on)
+    if right_idx is not None:
+        if how == "left":
+            return None, right_idx
+        left_idx = np.flatnonzero(right_idx >= 0)
+        return left_idx, right_idx[left_idx]
+
+    lk, rk, sizes = pack_keys(left, right, left_on, right_on)
+    space = int(np.prod(sizes))
+
+    if space <= DIRECT_MAX_KEYS:
+        # small key space: a match table indexed by key replaces sorting
+        # and searching the left side
+        order = np.argsort(rk, kind="stable")
+        per_key = np.bincount(rk, minlength=space)
+        counts = per_key[lk]
+        lo = (np.cumsum(per_key) - per_key)[lk]
+    else:
+        order, rk = _sorted(rk)
+        lo = _search(rk, lk, "left")
+        counts = _search(rk, lk, "right") - lo
+
+    missing = counts == 0
+    if how == "left":
+        counts = np.where(missing, 1, counts)
+
+    left_idx = np.repeat(np.arange(len(left)), counts)
+
+    # i-th output row of a left row takes its i-th match
+    offset = np.arange(len(left_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+    pos = np.repeat(lo, counts) + offset
+
+    right_idx = np.full(len(left_idx), -1)
+    hit = ~np.repeat(missing, counts)
+    right_idx[hit] = order[pos[hit]]
+
+    return left_idx, right_idx
+
+
+def asof_join(left, right, left_on, right_on, how="left", direction="nearest",
+              tolerance=None):
+    """
+    For each left row, the right row with equal leading keys whose last
+    key is closest (nearest), at or before (backward) or at or after
+    (forward) the left value, within tolerance. Ties go backward. At most
+    one match per left row; how="inner" drops unmatched left rows.
+
+    Right rows with equal keys are picked as pd.merge_asof picks them:
+    a backward match is the last of them in right's row order, a forward
+    match the first.
+    """
+    left_idx, right_idx = asof_join_index(
+        left, right, left_on, right_on, how, direction, tolerance
+    )
+
+    same = [r for l, r in zip(left_on, right_on) if l == r]
+    return _assemble(left, right, left_idx, right_idx, same)
+
+
+def asof_join_index(left, right, left_on, right_on, how="left", direction="nearest",
+                    tolerance=None):
+    """The rows of asof_join as (left_idx, right_idx), like sorted_join_index."""
+    if direction not in ("nearest", "backward", "forward"):
+        raise ValueError(f"unknown as-of direction {direction!r}")
+    if how not in ("inner", "left"):
+        raise ValueError(f"as-of join does not support how={how!r}")
+
+    # null times never match
+    valid = right[right_on[-1]].notna().to_numpy()
+    positions = None
+    if not valid.all():
+        positions = np.flatnonzero(valid)
+        right = right[valid]
+
+    try:
+        right_idx = _packed_asof(left, right, left_on, right_on, direction, tolerance)
+    except KeySpaceTooLarge:
+        right_idx = _merge_asof(left, right, left_on, right_on, direction, tolerance)
+
+    if positions is not None:
+        matched = right_idx >= 0
+        right_idx[matched] = positions[right_idx[matched]]
+
+    if how == "inner":
+        left_idx = np.flatnonzero(right_idx >= 0)
+        return left_idx, right_idx[left_idx]
+
+    return None, right_idx
+
+
+def _packed_asof(left, right, left_on, right_on, direction, tolerance):
+    """Right row per left row (-1 = none), searching the packed keys."""
+    on_l, on_r = left_on[-1], right_on[-1]
+
+    # the as-of key is the lowest digit of the packed key
+    lk, rk, sizes = pack_keys(left, right, left_on, right_on)
+    n_times = sizes[-1]
+    order, rk = _sorted(rk)
+
+    right_idx = np.full(len(left), -1)
+
+    if len(rk):
+        last = len(rk) - 1
+
+        # one sort of the left keys serves both searches
+        l_order, l_sorted = _sorted(lk)
+        back = np.empty(len(lk), dtype="int64")
+        back[l_order] = np.searchsorted(rk, l_sorted, "right")
+        back -= 1
+        fwd = np.empty(len(lk), dtype="int64")
+        fwd[l_order] = np.searchsorted(rk, l_sorted, "left")
+        del l_order, l_sorted
+
+        # temporaries are reused in place below: at 10M rows each one
+        # is 80 MB
+        back_ok = back >= 0
+        fwd_ok = fwd <= last
+        np.clip(back, 0, last, out=back)
+        np.clip(fwd, 0, last, out=fwd)
+
+        group_l = lk // n_times
+        del lk
+        back_ok &= rk[back] // n_times == group_l
+        fwd_ok &= rk[fwd] // n_times == group_l
+        del group_l
+
+        # times are only read once the candidates are known
+        lt, l_null = _times(left[on_l])
+        rt, _ = _times(right[on_r])
+        rt = rt[order]
+
+        if direction == "forward":
+            back_ok[:] = False
+        elif direction == "backward":
+            fwd_ok[:] = False
+
+        back_dist = lt - rt[back]
+        dist = rt[fwd] - lt
+
+        use_back = back_ok & (~fwd_ok | (back_dist <= dist))
+        pos = fwd
+        pos[use_back] = back[use_back]
+        dist[use_back] = back_dist[use_back]
+        del back, back_dist
+
+        matched = (back_ok | fwd_ok) & ~l_null
+        tol = _tolerance(tolerance)
+        if tol is not None:
+            matched &= dist <= tol
+
+        right_idx[matched] = order[pos[matched]]
+
+    return right_idx
+
+
+def _merge_asof(left, right, left_on, right_on, direction, tolerance):
+    """_packed_asof through pd.merge_asof, for keys that do not pack into 64 bits."""
+    on_l, on_r = left_on[-1], right_on[-1]
+    lf = left[left_on].assign(_left=np.arange(len(left)))
+    rf = right[right_on].assign(_right=np.arange(len(right)))
+    lf = lf[lf[on_l].notna()].sort_values(on_l, kind="stable")
+    rf = rf.sort_values(on_r, kind="stable")
+
+    if tolerance is not None and not isinstance(tolerance, (int, float)):
+        tolerance = pd.Timedelta(tolerance)
+
+    out = pd.merge_asof(
+        lf, rf,
+        left_on=on_l, right_on=on_r,
+        left_by=left_on[:-1] or None, right_by=right_on[:-1] or None,
+        direction=direction, tolerance=tolerance,
+        suffixes=("", "_r"),
+    )
+
+    right_idx = np.full(len(left), -1)
+    right_idx[out["_left"].to_numpy()] = out["_right"].fillna(-1).to_numpy("int64")
+    return right_idx
+
+
+def _times(values):
+    """As-of key as int64 nanoseconds (datetimes) or float64, with a null mask."""
+    values = values.to_numpy()
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]").view("int64"), np.isnat(values)
+    values = values.astype("float64")
+    return values, np.isnan(values)
+
+
+def _tolerance(tolerance):
+    if tolerance is None:
+        return None
+    if isinstance(tolerance, (int, float)):
+        return tolerance
+    return pd.Timedelta(tolerance).value
@@ -0,0 +1,187 @@
+import os
+import json
+import threading
+import time
+import copy
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+METADATA_CACHE_TTL_SECONDS = float(os.environ.get("METADATA_CACHE_TTL_SECONDS", "15"))
+METADATA_CACHE_MAX_USERS = int(os.environ.get("METADATA_CACHE_MAX_USERS", "10000"))
+
+# local: an invalidation only reaches this process's cache, so with more
+# than one API worker the others serve stale lists for up to the TTL.
+# redis: invalidations are broadcast to every worker over pub/sub.
+METADATA_CACHE_BACKEND = os.environ.get("METADATA_CACHE_BACKEND", "local").lower()
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+INVALIDATION_CHANNEL = "list-cache:invalidate"
+
+
+# ---------- BATCHED LOOKUPS ----------
+def resolve_files(db, user_id, files, columns="storage_path,inferred_schema"):
+    """
+    user_files rows for a {role: file_id} selection in one query. Only
+    rows owned by user_id come back; roles whose file is missing or owned
+    by someone else are left out of the result.
+    """
+    ids = list(dict.fromkeys(str(f) for f in files.values() if f))
+    if not ids:
+        return {}
+
+    res = (
+        db
+        .table("user_files")
+        .select(f"id,{columns}")
+        .in_("id", ids)
+        .eq("user_id", user_id)
+        .execute()
+    )
+    by_id = {str(row["id"]): row for row in res.data or []}
+
+    return {
+        role: by_id[str(file_id)]
+        for role, file_id in files.items()
+        if str(file_id) in by_id
+    }
+
+
+# ---------- RESPONSE CACHE ----------
+class UserCache:
+    """
+    Short-lived per-user cache of list responses (files, jobs). Entries
+    expire after ttl seconds and are dropped as soon as something that
+    changes them happens (upload, delete, job created or finished), in
+    every process sharing broadcast, if set.
+    """
+
+    def __init__(self, ttl=METADATA_CACHE_TTL_SECONDS, max_users=METADATA_CACHE_MAX_USERS,
+                 broadcast=None):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.broadcast = broadcast
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind, user_id):
+        with self._lock:
+            entry = self._entries.get((kind, user_id))
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            self.misses += 1
+            return None
+
+    def put(self, kind, user_id, data):
+        if self.ttl <= 0:
+            return
+
+        with self._lock:
+            if len(self._entries) >= self.max_users:
+                self._expire()
+            self._entries[(kind, user_id)] = (time.monotonic() + self.ttl, copy.deepcopy(data))
+
+    def invalidate(self, kind, user_id):
+        self.drop(kind, user_id)
+        if self.broadcast:
+            self.broadcast.publish(kind, user_id)
+
+    def drop(self, kind, user_id):
+        """invalidate() in this process only."""
+        with self._lock:
+            self._entries.pop((kind, user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [k for k, (exp, _) in self._entries.items() if exp <= now]:
+            del self._entries[key]
+
+        # still full: drop the entries closest to expiring
+        overflow = len(self._entries) - self.max_users + 1
+        if overflow > 0:
+            for key in sorted(self._entries, key=lambda k: self._entries[k][0])[:overflow]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class RedisInvalidations:
+    """
+    Broadcasts list cache invalidations over Redis pub/sub and applies
+    the ones every other worker sends. Whatever is published while the
+    listener is disconnected is lost, so the cache is cleared each time
+    it (re)subscribes.
+    """
+
+    def __init__(self, cache, url=REDIS_URL, client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("METADATA_CACHE_BACKEND=redis needs the redis package")
+            client = redis.Redis.from_url(url)
+
+        self.cache = cache
+        self._redis = client
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self, kind, user_id):
+        try:
+            self._redis.publish(INVALIDATION_CHANNEL, json.dumps([kind, str(user_id)]))
+        except Exception as e:
+            # the other workers catch up when their entries expire
+            print("LIST CACHE ERROR:", repr(e))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._listen, name="list-cache-invalidations", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                self.cache.clear()
+
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        kind, user_id = json.loads(message["data"])
+                        self.cache.drop(kind, user_id)
+
+                pubsub.close()
+            except Exception as e:
+                print("LIST CACHE ERROR:", repr(e))
+                self._stop.wait(1.0)
+
+
+def make_list_cache(backend=METADATA_CACHE_BACKEND):
+    cache = UserCache()
+    if backend == "redis":
+        cache.broadcast = RedisInvalidations(cache).start()
+    elif backend != "local":
+        raise ValueError(f"Unknown METADATA_CACHE_BACKEND: {backend}")
+    return cache
+
+
+list_cache = make_list_cache()
@@ -0,0 +1,267 @@
+import os
+import hmac
+import time
+import threading
+import ipaddress
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+
+# Minimal Prometheus text-format metrics. Each process has its own
+# registry; analysis child processes forward what they record to the job
+# worker that started them (see forward_to / apply), and analysis pool
+# workers hand theirs back with their results (see captured).
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+
+# /metrics is served to these client networks, or to any client sending
+# "Authorization: Bearer METRICS_TOKEN" when a token is set
+METRICS_ALLOWED_IPS = os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1/32,::1/128")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60, 120, 300,
+)
+
+REGISTRY = {}
+COLLECTORS = []
+
+_forward = None
+
+
+def forward_to(fn):
+    """Send every observation to fn(name, value, labels) instead of recording it."""
+    global _forward
+    _forward = fn
+
+
+def apply(name, value, labels):
+    """
+    Record an observation made in another process, or pass it on when
+    this process forwards its own too.
+    """
+    metric = REGISTRY.get(name)
+    if metric is not None:
+        metric._send(value, labels)
+
+
+@contextmanager
+def captured():
+    """
+    Collect the observations made in the block into a list of (name,
+    value, labels) instead of recording them. For pool worker processes,
+    which return the list for the parent to apply().
+    """
+    global _forward
+    previous, out = _forward, []
+    _forward = lambda *a: out.append(a)
+    try:
+        yield out
+    finally:
+        _forward = previous
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY[name] = self
+
+    def _send(self, value, labels):
+        if not METRICS_ENABLED:
+            return
+        if _forward is not None:
+            _forward(self.name, value, labels)
+            return
+        self._record(value, labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        self._send(amount, labels)
+
+    def _record(self, value, labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            return [f"{self.name}{_labels(k)} {v:g}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self._send(value, labels)
+
+    def _record(self, value, labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def samples(self):
+        with self._lock:
+            return [f"{self.name}{_labels(k)} {v:g}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        self._send(value, labels)
+
+    def time(self, **labels):
+        """Context manager observing the seconds its block takes."""
+        if not METRICS_ENABLED:
+            return _NO_TIMER
+        return _Timer(self, labels)
+
+    def _record(self, value, labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, n) in self._values.items():
+                running = 0
+                for bound, c in zip(self.buckets + (float("inf"),), counts):
+                    running += c
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    out.append(f"{self.name}_bucket{_labels(key + (('le', le),))} {running}")
+                out.append(f"{self.name}_sum{_labels(key)} {total:g}")
+                out.append(f"{self.name}_count{_labels(key)} {n}")
+        return out
+
+
+class _Timer:
+    __slots__ = ("metric", "labels", "t0")
+
+    def __init__(self, metric, labels):
+        self.metric = metric
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metric._send(time.perf_counter() - self.t0, self.labels)
+
+
+_NO_TIMER = nullcontext()
+
+
+def register_collector(fn):
+    """fn() is called at scrape time to set gauges from live state."""
+    COLLECTORS.append(fn)
+    return fn
+
+
+def render():
+    for fn in COLLECTORS:
+        try:
+            fn()
+        except Exception as e:
+            print("METRICS ERROR:", repr(e))
+
+    lines = []
+    for metric in REGISTRY.values():
+        samples = metric.samples()
+        if samples:
+            lines.extend(metric.header())
+            lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def _networks(spec):
+    return [ipaddress.ip_network(n.strip()) for n in spec.split(",") if n.strip()]
+
+
+ALLOWED_NETWORKS = _networks(METRICS_ALLOWED_IPS)
+
+
+def scrape_allowed(client_host, authorization=None, networks=None, token=None):
+    """True if a /metrics request comes from an allowed network or has the token."""
+    networks = ALLOWED_NETWORKS if networks is None else networks
+    token = METRICS_TOKEN if token is None else token
+
+    if token and authorization and hmac.compare_digest(
+        authorization.encode(), f"Bearer {token}".encode()
+    ):
+        return True
+
+    try:
+        ip = ipaddress.ip_address(client_host or "")
+    except ValueError:
+        return False
+    return any(ip in n for n in networks)
+
+
+# ---------- PIPELINE METRICS ----------
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Seconds spent per stage of uploads and analysis jobs.",
+)
+AGGREGATE_SECONDS = Histogram(
+    "analysis_aggregate_seconds",
+    "Seconds spent computing each analysis output.",
+)
+HTTP_SECONDS = Histogram(
+    "http_request_seconds",
+    "HTTP request latency by route.",
+)
+BYTES = Counter(
+    "storage_bytes_total",
+    "Bytes moved to and from object storage.",
+)
+ROWS = Counter(
+    "analysis_rows_total",
+    "Rows read into analyses, by analysis and role.",
+)
+JOBS = Counter(
+    "jobs_finished_total",
+    "Finished analysis jobs by final status.",
+)
+JOBS_RUNNING = Gauge("jobs_running", "Analysis jobs currently running.")
+JOBS_QUEUED = Gauge("jobs_queued", "Analysis jobs waiting for a worker.")
+CACHE_HITS = Gauge("cache_hits", "Lookups answered by each cache since start.")
+CACHE_MISSES = Gauge("cache_misses", "Lookups each cache could not answer since start.")
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Hit ratio of each cache since start.")
+
+
+def cache_stats(name, stats):
+    CACHE_HITS.set(stats["hits"], cache=name)
+    CACHE_MISSES.set(stats["misses"], cache=name)
+    CACHE_HIT_RATIO.set(stats["hit_ratio"], cache=name)
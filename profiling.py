@@ -0,0 +1,164 @@
+import io
+import os
+import json
+import time
+import random
+import pstats
+import cProfile
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+# Opt-in per-job profiling. A job is profiled when the request asks for
+# it or when it falls in the JOB_PROFILE_SAMPLE_RATE sample; other jobs
+# only pay for a no-op context manager per step.
+
+JOB_PROFILE_SAMPLE_RATE = float(os.environ.get("JOB_PROFILE_SAMPLE_RATE", "0"))
+JOB_PROFILE_TOP = int(os.environ.get("JOB_PROFILE_TOP", "40"))
+
+# uploaded next to the outputs, under results/{job_id}/
+PROFILE_FILES = ("_profile.txt", "_profile.prof")
+
+ANALYSIS_PROFILE = "analysis.prof"
+ANALYSIS_MEMORY = "analysis_memory.json"
+
+
+def should_profile(requested=False, rate=JOB_PROFILE_SAMPLE_RATE):
+    return bool(requested) or (rate > 0 and random.random() < rate)
+
+
+def profile_call(profile_dir, fn, *args, **kwargs):
+    """
+    Run fn under cProfile and tracemalloc, leaving the stats and the
+    peak traced memory in profile_dir. Meant for the analysis child
+    process, where tracemalloc sees nothing but this job. Worker
+    processes the analysis starts itself (parallel mode) are not traced.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(fn, *args, **kwargs)
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+        if started:
+            tracemalloc.stop()
+
+        prof.dump_stats(os.path.join(profile_dir, ANALYSIS_PROFILE))
+        with open(os.path.join(profile_dir, ANALYSIS_MEMORY), "w") as f:
+            json.dump({
+                "traced_peak_bytes": peak,
+                "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                "top_allocations": [str(s) for s in top],
+            }, f)
+
+
+class JobProfiler:
+    """
+    Wall time and cProfile stats for the steps of one job, merged at the
+    end with the analysis child's profile_call output. cProfile only sees
+    the thread that enables it: section() traces the job worker thread,
+    and work a section hands to a thread pool is traced by wrapping it
+    in traced(). Sections traced neither way are reported as wall clock
+    only.
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self.scopes = {}
+        self._profile = cProfile.Profile()
+        self._thread_profiles = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def section(self, name, trace=True, scope=None):
+        """
+        Time a step; trace=False skips cProfile (e.g. while only waiting
+        on the child). scope labels where an untraced step was profiled
+        instead, if anywhere.
+        """
+        self.scopes[name] = "job thread" if trace else scope or "wall clock only"
+        t0 = time.perf_counter()
+        if trace:
+            self._profile.enable()
+        try:
+            yield
+        finally:
+            if trace:
+                self._profile.disable()
+            self.sections[name] = self.sections.get(name, 0.0) + time.perf_counter() - t0
+
+    def traced(self, name, fn):
+        """fn, profiled in whichever pool thread runs it, as part of section name."""
+        self.scopes[name] = "pool threads"
+
+        def run(*args, **kwargs):
+            prof = cProfile.Profile()
+            try:
+                return prof.runcall(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._thread_profiles.append(prof)
+
+        return run
+
+    def write(self, profile_dir, top=JOB_PROFILE_TOP):
+        """Write PROFILE_FILES into profile_dir; returns their paths."""
+        os.makedirs(profile_dir, exist_ok=True)
+
+        # pstats refuses a profile that recorded nothing
+        stats = pstats.Stats()
+        for prof in [self._profile, *self._thread_profiles]:
+            if prof.getstats():
+                stats.add(prof)
+        analysis_prof = os.path.join(profile_dir, ANALYSIS_PROFILE)
+        if os.path.exists(analysis_prof):
+            stats.add(analysis_prof)
+
+        memory = {}
+        memory_path = os.path.join(profile_dir, ANALYSIS_MEMORY)
+        if os.path.exists(memory_path):
+            with open(memory_path) as f:
+                memory = json.load(f)
+
+        text = io.StringIO()
+        text.write("# steps (wall seconds, what cProfile saw)\n")
+        for name, seconds in self.sections.items():
+            text.write(f"{name:<20} {seconds:10.3f}  {self.scopes[name]}\n")
+
+        if memory:
+            text.write("\n# analysis memory\n")
+            text.write(f"traced peak       {memory['traced_peak_bytes'] / 2**20:10.1f} MB\n")
+            text.write(f"max rss           {memory['max_rss_kb'] / 1024:10.1f} MB\n")
+            for line in memory["top_allocations"]:
+                text.write(f"{line}\n")
+
+        text.write(f"\n# top {top} functions by cumulative time\n")
+        stats.stream = text
+        stats.sort_stats("cumulative").print_stats(top)
+
+        txt_path, prof_path = (os.path.join(profile_dir, f) for f in PROFILE_FILES)
+        with open(txt_path, "w") as f:
+            f.write(text.getvalue())
+        stats.dump_stats(prof_path)
+
+        return [txt_path, prof_path]
+
+
+class _NoProfiler:
+    def section(self, name, trace=True, scope=None):
+        return nullcontext()
+
+    def traced(self, name, fn):
+        return fn
+
+
+NO_PROFILER = _NoProfiler()
@@ -0,0 +1,84 @@
+import os
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from analysis_engine import ENGINE_VERSION
+from analysis_registry import ANALYSES
+from metadata import resolve_files
+
+
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+
+def spec_version(analysis_key):
+    """Hash of the analysis' registry entry, so editing a spec misses the cache."""
+    spec = json.dumps(ANALYSES.get(analysis_key), sort_keys=True, default=str)
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+
+def fingerprint(user_id, analysis_key, input_versions, start_date, end_date):
+    """
+    Stable hash of everything that determines an analysis' outputs:
+    the analysis and its spec, the engine version, the content version
+    (ETag) of each input role and the date range.
+    """
+    key = json.dumps(
+        {
+            "user_id": user_id,
+            "analysis_key": analysis_key,
+            "spec": spec_version(analysis_key),
+            "engine": ENGINE_VERSION,
+            "inputs": input_versions,
+            "start_date": start_date,
+            "end_date": end_date,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def input_versions(db, storage, user_id, files):
+    """ETag of every selected input, keyed by role."""
+    rows = resolve_files(db, user_id, files, "storage_path")
+    if len(rows) < len(files):
+        return None
+
+    return {
+        role: storage.object_etag(row["storage_path"])
+        for role, row in rows.items()
+    }
+
+
+def lookup(db, fp, ttl_seconds=RESULT_CACHE_TTL_SECONDS):
+    cutoff = (datetime.utcnow() - timedelta(seconds=ttl_seconds)).isoformat()
+
+    res = (
+        db
+        .table("result_cache")
+        .select("fingerprint,result_prefix,result_files,result_manifest")
+        .eq("fingerprint", fp)
+        .gte("created_at", cutoff)
+        .limit(1)
+        .execute()
+    )
+
+    return res.data[0] if res.data else None
+
+
+def store(db, fp, user_id, analysis_key, files, result_prefix, result_files, result_manifest=None):
+    db.table("result_cache").upsert({
+        "fingerprint": fp,
+        "user_id": user_id,
+        "analysis_key": analysis_key,
+        "file_ids": [str(f) for f in files.values()],
+        "result_prefix": result_prefix,
+        "result_files": result_files,
+        "result_manifest": result_manifest,
+        "created_at": datetime.utcnow().isoformat(),
+    }).execute()
+
+
+def invalidate_file(db, file_id):
+    """Drop every cached result that was computed from file_id."""
+    db.table("result_cache").delete().contains("file_ids", [str(file_id)]).execute()
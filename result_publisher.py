@@ -0,0 +1,211 @@
+import os
+import gzip
+import hmac
+import time
+import shutil
+import hashlib
+import tarfile
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# gzip | zstd | none. Objects keep their plain names and are served with
+# Content-Encoding, so HTTP clients decompress them transparently.
+RESULT_ENCODING = os.environ.get("RESULT_ENCODING", "gzip").lower()
+# low levels: encoding must not take longer than the bytes it saves
+RESULT_COMPRESS_LEVEL = int(os.environ.get("RESULT_COMPRESS_LEVEL", "1"))
+RESULT_UPLOAD_THREADS = int(os.environ.get("RESULT_UPLOAD_THREADS", "8"))
+
+# outputs at most this size share one bundle object when
+# there are at least RESULT_BUNDLE_MIN_FILES of them (0 = never bundle).
+# Bundled files are served by the API from one ranged read of the bundle,
+# so a bundle of n files saves n - 1 uploads and costs nothing extra to
+# download
+RESULT_BUNDLE_MAX_KB = int(os.environ.get("RESULT_BUNDLE_MAX_KB", "256"))
+RESULT_BUNDLE_MIN_FILES = int(os.environ.get("RESULT_BUNDLE_MIN_FILES", "3"))
+
+# HMAC key for bundled-file download links; its own key, never the auth
+# token secret. Unset, nothing is bundled and no link verifies
+RESULT_URL_SECRET = os.environ.get("RESULT_URL_SECRET", "")
+
+BUNDLE_NAME = "_bundle.tar"
+
+# keep the plain file when encoding saves less than this fraction
+MIN_SAVING = 0.1
+
+
+def resolve_encoding(name=RESULT_ENCODING):
+    if name in ("", "none", "identity"):
+        return None
+    if name == "zstd" and zstandard is None:
+        print("RESULT PUBLISH ERROR:", "zstandard is not installed, using gzip")
+        return "gzip"
+    if name not in ("gzip", "zstd"):
+        raise ValueError(f"Unknown RESULT_ENCODING: {name}")
+    return name
+
+
+def content_type(filename):
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+# ---------- ENCODING ----------
+def encode_file(src, dst, encoding, level=RESULT_COMPRESS_LEVEL):
+    """
+    Write src to dst in the given Content-Encoding. Returns the encoding
+    actually used: None when compressing would not pay off, in which
+    case dst is a plain copy.
+    """
+    if encoding == "gzip":
+        # mtime=0 keeps the bytes identical across runs
+        with open(src, "rb") as fin, open(dst, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=level, mtime=0) as out:
+                shutil.copyfileobj(fin, out, 1024 * 1024)
+    elif encoding == "zstd":
+        with open(src, "rb") as fin, open(dst, "wb") as out:
+            zstandard.ZstdCompressor(level=level).copy_stream(fin, out)
+    else:
+        shutil.copyfile(src, dst)
+        return None
+
+    if os.path.getsize(dst) > os.path.getsize(src) * (1 - MIN_SAVING):
+        shutil.copyfile(src, dst)
+        return None
+
+    return encoding
+
+
+# ---------- PUBLISH ----------
+def publish(
+    storage,
+    out_dir,
+    staging_dir,
+    prefix,
+    check=None,
+    encoding=RESULT_ENCODING,
+    threads=RESULT_UPLOAD_THREADS,
+    bundle_max_kb=RESULT_BUNDLE_MAX_KB,
+    bundle_min_files=RESULT_BUNDLE_MIN_FILES,
+):
+    """
+    Encode every output in out_dir and upload them concurrently under
+    prefix. Small outputs are packed into one tar object instead of one
+    request each. Returns (file names, manifest); the manifest records
+    each file's encoding and where bundled files sit inside the bundle,
+    and is what download_result needs to serve them.
+    """
+    encoding = resolve_encoding(encoding)
+    os.makedirs(staging_dir, exist_ok=True)
+
+    names = sorted(os.listdir(out_dir))
+    sizes = {f: os.path.getsize(os.path.join(out_dir, f)) for f in names}
+
+    small = [f for f in names if 0 < sizes[f] <= bundle_max_kb * 1024]
+    # bundled files can only be served through signed links
+    if bundle_max_kb <= 0 or len(small) < bundle_min_files or not RESULT_URL_SECRET:
+        small = []
+
+    encodings = {}
+
+    def stage(fname):
+        if check:
+            check()
+        path = os.path.join(staging_dir, fname)
+        encodings[fname] = encode_file(os.path.join(out_dir, fname), path, encoding)
+        return path
+
+    def upload(fname):
+        path = stage(fname)
+        storage.upload_file(path, f"{prefix}/{fname}", content_type(fname), encodings[fname])
+
+    manifest = {}
+    large = [f for f in names if f not in small]
+
+    # largest first, so big encodes overlap the rest of the work
+    large.sort(key=lambda f: -sizes[f])
+
+    with ThreadPoolExecutor(max(1, min(threads, len(large) + 1))) as pool:
+        futures = [pool.submit(upload, f) for f in large]
+
+        if small:
+            bundle = os.path.join(staging_dir, BUNDLE_NAME)
+            staged = {f: stage(f) for f in small}
+            manifest["bundle"] = {
+                "name": BUNDLE_NAME,
+                "members": write_bundle(bundle, staged, small),
+            }
+            futures.append(pool.submit(
+                storage.upload_file, bundle, f"{prefix}/{BUNDLE_NAME}", "application/x-tar", None
+            ))
+
+        for f in futures:
+            f.result()
+
+    manifest["encoding"] = dict(sorted(encodings.items()))
+    return names, manifest
+
+
+def write_bundle(path, staged, names):
+    """Tar the staged files; returns {name: [offset, size]} of each member's data."""
+    with tarfile.open(path, "w", format=tarfile.PAX_FORMAT) as tar:
+        for fname in names:
+            info = tar.gettarinfo(staged[fname], arcname=fname)
+            info.mtime = 0
+            with open(staged[fname], "rb") as fh:
+                tar.addfile(info, fh)
+
+    # data offsets are only known once the headers are written
+    with tarfile.open(path, "r") as tar:
+        return {m.name: [m.offset_data, m.size] for m in tar.getmembers()}
+
+
+# ---------- SERVE ----------
+# download links for bundled files point at the API rather than storage;
+# like presigned storage URLs they are signed and expire, so they work
+# without the caller's bearer token
+RESULT_URL_SECONDS = int(os.environ.get("RESULT_URL_SECONDS", "3600"))
+
+
+def bundle_member(manifest, filename):
+    """(bundle name, offset, size) of a bundled file; None if it is its own object."""
+    bundle = (manifest or {}).get("bundle") or {}
+    member = bundle.get("members", {}).get(filename)
+    if member is None:
+        return None
+    return bundle["name"], *member
+
+
+def read_member(storage, prefix, filename, manifest):
+    """A bundled file's stored bytes, in one ranged read of the bundle."""
+    name, offset, size = bundle_member(manifest, filename)
+    return storage.read_range(f"{prefix}/{name}", offset, size)
+
+
+class LinkSigningDisabled(Exception):
+    pass
+
+
+def _signature(job_id, filename, expires):
+    if not RESULT_URL_SECRET:
+        raise LinkSigningDisabled("RESULT_URL_SECRET is not set")
+    message = f"{job_id}/{filename}/{expires}".encode()
+    return hmac.new(RESULT_URL_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+def sign_member(job_id, filename, expires_seconds=RESULT_URL_SECONDS):
+    """Query parameters of a download link for a bundled file."""
+    expires = int(time.time() + expires_seconds)
+    return {"expires": expires, "signature": _signature(job_id, filename, expires)}
+
+
+def verify_member(job_id, filename, expires, signature):
+    if not RESULT_URL_SECRET:
+        return False
+    return expires >= time.time() and hmac.compare_digest(
+        signature, _signature(job_id, filename, expires)
+    )
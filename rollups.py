@@ -0,0 +1,151 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+ROLLUP_DATE = "visitdate"
+ROLLUP_VALUE = "servicecharge"
+
+ROLLUP_KEYS = ["patientid", ROLLUP_DATE]
+ROLLUP_SOURCE = ROLLUP_KEYS + [ROLLUP_VALUE]
+ROLLUP_MEASURES = ["visits", "charge_count", "charge_sum", "charge_sumsq"]
+
+BATCH_ROWS = 1_000_000
+
+
+def rollup_path(path):
+    """Location of the visit rollup that sits next to a raw upload."""
+    return os.path.splitext(path)[0] + ".rollup.parquet"
+
+
+# ---------- BUILD (upload time) ----------
+def _partial(df):
+    charge = df["servicecharge"]
+    filled = charge.fillna(0.0)
+
+    return (
+        df[ROLLUP_KEYS]
+        .assign(
+            visits=1,
+            charge_count=charge.notna().astype("int64"),
+            charge_sum=filled,
+            charge_sumsq=filled * filled,
+        )
+        .groupby(ROLLUP_KEYS, dropna=False, sort=False)
+        .sum()
+    )
+
+
+def build_rollup(parquet_path, out_path, batch_rows=BATCH_ROWS):
+    """
+    Pre-aggregate a typed visits file into one row per (patient, visit
+    date) with visit count, charge count, sum and sum of squares.
+    Returns False if the file is not a visits file.
+    """
+    pf = pq.ParquetFile(parquet_path)
+    if not all(c in pf.schema_arrow.names for c in ROLLUP_SOURCE):
+        return False
+
+    parts = [
+        _partial(batch.to_pandas())
+        for batch in pf.iter_batches(batch_size=batch_rows, columns=ROLLUP_SOURCE)
+    ]
+
+    if parts:
+        rollup = pd.concat(parts).groupby(level=ROLLUP_KEYS, dropna=False).sum()
+    else:
+        rollup = pd.DataFrame(columns=ROLLUP_KEYS + ROLLUP_MEASURES).set_index(ROLLUP_KEYS)
+
+    rollup.reset_index().to_parquet(out_path, index=False)
+    return True
+
+
+# ---------- QUERY (analysis time) ----------
+class VisitRollup:
+    """
+    Per-patient prefix sums over a visit rollup. Totals for any date
+    window are two binary searches and a subtraction per patient, so a
+    query costs O(patients * log(rows)) instead of a scan of every visit.
+    """
+
+    def __init__(self, df):
+        codes, self.patient_ids = pd.factorize(df["patientid"], use_na_sentinel=False)
+        n_patients = len(self.patient_ids)
+
+        measures = {m: df[m].to_numpy() for m in ROLLUP_MEASURES}
+
+        # whole-file totals, including rows with an unparseable date
+        self.totals = {
+            m: np.bincount(codes, weights=v, minlength=n_patients)
+            for m, v in measures.items()
+        }
+
+        dated = df["visitdate"].notna().to_numpy()
+        codes = codes[dated]
+        days = df["visitdate"].to_numpy()[dated]
+
+        self.days = np.unique(days)
+        ranks = np.searchsorted(self.days, days)
+
+        order = np.lexsort((ranks, codes))
+        self.stride = len(self.days) + 1
+        self.keys = codes[order].astype("int64") * self.stride + ranks[order]
+
+        codes = codes[order]
+        self.seg_start = np.searchsorted(codes, np.arange(n_patients), side="left")
+
+        # cumulative sums restart at every patient so window sums only
+        # lose precision relative to that patient's own total
+        self.cum = {}
+        for m, v in measures.items():
+            v = v[dated][order].astype("float64")
+            self.cum[m] = (
+                pd.Series(v).groupby(codes).cumsum().to_numpy()
+                if len(v) else v
+            )
+
+    @classmethod
+    def load(cls, path):
+        return cls(pd.read_parquet(path))
+
+    def _window_sums(self, lo, hi):
+        out = {}
+        for m, cum in self.cum.items():
+            upper = np.where(hi > lo, cum[np.maximum(hi - 1, 0)] if len(cum) else 0.0, 0.0)
+            lower = np.where(
+                (hi > lo) & (lo > self.seg_start),
+                cum[np.maximum(lo - 1, 0)] if len(cum) else 0.0,
+                0.0,
+            )
+            out[m] = upper - lower
+        return out
+
+    def per_patient(self, start_date=None, end_date=None):
+        """
+        Visit and charge totals per patient for visitdate within
+        [start_date, end_date], matching analysis_engine.filter_by_date.
+        Patients with no visits in the window are omitted.
+        """
+        if not start_date and not end_date:
+            sums = self.totals
+        else:
+            first = 0
+            last = len(self.days)
+
+            if start_date:
+                first = np.searchsorted(self.days, pd.to_datetime(start_date).to_datetime64(), side="left")
+            if end_date:
+                last = np.searchsorted(self.days, pd.to_datetime(end_date).to_datetime64(), side="right")
+
+            base = np.arange(len(self.patient_ids), dtype="int64") * self.stride
+            lo = np.searchsorted(self.keys, base + first, side="left")
+            hi = np.searchsorted(self.keys, base + max(first, last), side="left")
+
+            sums = self._window_sums(lo, hi)
+
+        out = pd.DataFrame({"patientid": self.patient_ids, **sums})
+        out["visits"] = out["visits"].round().astype("int64")
+        out["charge_count"] = out["charge_count"].round().astype("int64")
+
+        return out[out["visits"] > 0].reset_index(drop=True)
@@ -0,0 +1,153 @@
+import csv
+import io
+import os
+import pandas as pd
+
+from column_normalization import normalize_col, normalize_list
+from columnar_store import DATE_COLUMNS, NUMERIC_COLUMNS
+
+
+SCHEMA_SAMPLE_ROWS = int(os.environ.get("SCHEMA_SAMPLE_ROWS", "1000"))
+
+MAX_BAD_VALUES = 3
+
+
+def _peek(source, nbytes=None):
+    """
+    Read from the start of a path or seekable binary file object without
+    moving its position. nbytes=None reads a single line.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.readline() if nbytes is None else f.read(nbytes)
+
+    pos = source.tell()
+    try:
+        return source.readline() if nbytes is None else source.read(nbytes)
+    finally:
+        source.seek(pos)
+
+
+def _text(raw):
+    return raw.decode("utf-8-sig", errors="replace") if isinstance(raw, bytes) else raw
+
+
+def read_header(source):
+    """Column names from the first line only, as written in the file."""
+    line = _text(_peek(source)).strip("\r\n")
+    if not line:
+        return []
+    return [c.strip() for c in next(csv.reader([line]))]
+
+
+def _sample(source, sample_rows):
+    # enough bytes for sample_rows of a wide export
+    nbytes = 512 * (sample_rows + 1)
+    raw = _peek(source, nbytes)
+    lines = _text(raw).splitlines()
+
+    if len(raw) == nbytes:
+        # last line may be cut mid-row
+        lines = lines[:-1]
+
+    lines = lines[: sample_rows + 1]
+    if len(lines) < 2:
+        return pd.DataFrame()
+    return pd.read_csv(io.StringIO("\n".join(lines)), dtype=str, keep_default_na=True)
+
+
+def infer_type(values):
+    values = values.dropna()
+    if values.empty:
+        return "empty"
+    if pd.to_numeric(values, errors="coerce").notna().all():
+        as_num = pd.to_numeric(values)
+        return "integer" if (as_num % 1 == 0).all() else "number"
+    if pd.to_datetime(values, errors="coerce", format="mixed").notna().all():
+        return "date"
+    return "string"
+
+
+def _bad_values(values, parse):
+    values = values.dropna()
+    bad = values[parse(values).isna()]
+    return bad.head(MAX_BAD_VALUES).tolist()
+
+
+def check_schema(source, required_columns=(), sample_rows=SCHEMA_SAMPLE_ROWS):
+    """
+    Validate a CSV from its header and first sample_rows rows.
+
+    Columns are compared after normalize_col, so "Patient ID" satisfies
+    "patient_id". Returns a dict with ok, columns (normalized),
+    missing_columns, type_errors and inferred types.
+    """
+    header = read_header(source)
+    columns = [normalize_col(c) for c in header]
+
+    missing = [c for c in required_columns if normalize_col(c) not in columns]
+
+    result = {
+        "ok": False,
+        "columns": columns,
+        "missing_columns": missing,
+        "type_errors": [],
+        "types": {},
+    }
+
+    if not header or missing:
+        return result
+
+    sample = _sample(source, sample_rows)
+    sample.columns = [normalize_col(c) for c in sample.columns]
+
+    for col in sample.columns:
+        result["types"][col] = infer_type(sample[col])
+
+    checks = [
+        (DATE_COLUMNS, "date", lambda v: pd.to_datetime(v, errors="coerce", format="mixed")),
+        (NUMERIC_COLUMNS, "number", lambda v: pd.to_numeric(v, errors="coerce")),
+    ]
+
+    for names, expected, parse in checks:
+        for col in names:
+            if col not in sample.columns:
+                continue
+            bad = _bad_values(sample[col], parse)
+            if bad:
+                result["type_errors"].append({
+                    "column": col,
+                    "expected": expected,
+                    "examples": bad,
+                })
+
+    result["ok"] = not result["type_errors"]
+    return result
+
+
+def schema_error_message(result):
+    if result["missing_columns"]:
+        return f"Missing required columns: {result['missing_columns']}"
+
+    if not result["columns"]:
+        return "File has no header row"
+
+    return "; ".join(
+        f"{e['column']} should be a {e['expected']} (got {e['examples']})"
+        for e in result["type_errors"]
+    )
+
+
+def stored_schema(result):
+    """The part of a check_schema result persisted on user_files."""
+    return {
+        "columns": result["columns"],
+        "types": result["types"],
+    }
+
+
+def satisfies(schema, required_columns):
+    """True if a stored schema already covers required_columns."""
+    if not schema or not schema.get("columns"):
+        return False
+    return all(c in schema["columns"] for c in normalize_list(required_columns))
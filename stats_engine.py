@@ -0,0 +1,275 @@
+import os
+import numpy as np
+import pandas as pd
+from scipy.stats import t as t_dist
+
+
+# Group-wise statistics computed with NumPy over integer group codes:
+# one bincount per moment instead of a Python loop per group.
+
+BOOTSTRAP_RESAMPLES = int(os.environ.get("BOOTSTRAP_RESAMPLES", "1000"))
+
+# resampled values drawn per batch of the bootstrap kernel (memory bound)
+BOOTSTRAP_BATCH_CELLS = int(os.environ.get("BOOTSTRAP_BATCH_CELLS", str(8_000_000)))
+
+
+def group_codes(keys):
+    """Integer code per row and the sorted group labels, dropping null keys."""
+    codes, labels = pd.factorize(keys, sort=True)
+    return codes, labels
+
+
+# ---------- MOMENTS ----------
+class GroupMoments:
+    """
+    Count, mean and sum of squared deviations per group. Partial moments
+    over disjoint rows merge exactly (Chan et al.), so they can be built
+    chunk by chunk or per partition.
+    """
+
+    def __init__(self, labels, n, mean, m2):
+        self.labels = pd.Index(labels)
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def from_values(cls, keys, values):
+        values = np.asarray(values, dtype="float64")
+        ok = ~np.isnan(values)
+
+        codes, labels = group_codes(keys)
+        ok &= codes >= 0
+        codes, values = codes[ok], values[ok]
+
+        k = len(labels)
+        n = np.bincount(codes, minlength=k).astype("float64")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(codes, weights=values, minlength=k) / n
+        dev = values - mean[codes]
+        m2 = np.bincount(codes, weights=dev * dev, minlength=k)
+
+        keep = n > 0
+        return cls(labels[keep], n[keep], mean[keep], m2[keep])
+
+    def merge(self, other):
+        labels = self.labels.union(other.labels)
+        a = self._align(labels)
+        b = other._align(labels)
+
+        n = a.n + b.n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = np.where(b.n > 0, b.mean - a.mean, 0.0)
+            w = np.where(n > 0, b.n / n, 0.0)
+            mean = np.where(a.n > 0, a.mean + delta * w, b.mean)
+            m2 = a.m2 + b.m2 + np.where(n > 0, delta * delta * a.n * b.n / n, 0.0)
+
+        return GroupMoments(labels, n, mean, m2)
+
+    def _align(self, labels):
+        def take(a):
+            return pd.Series(a, index=self.labels).reindex(labels, fill_value=0.0).to_numpy()
+
+        return GroupMoments(labels, take(self.n), take(self.mean), take(self.m2))
+
+    def variance(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n > 1, self.m2 / (self.n - 1), np.nan)
+
+
+# ---------- WELCH T-TESTS ----------
+def welch_pairs(moments, by, column):
+    """
+    Welch's unequal-variance t-test for every pair of groups, the same
+    statistic and two-sided p-value as scipy.stats.ttest_ind(equal_var=False).
+    Pairs where either group has fewer than two values get NaN.
+    """
+    i, j = np.triu_indices(len(moments.labels), k=1)
+
+    n, mean, var = moments.n, moments.mean, moments.variance()
+    se_i = var[i] / n[i]
+    se_j = var[j] / n[j]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_stat = (mean[i] - mean[j]) / np.sqrt(se_i + se_j)
+        dof = (se_i + se_j) ** 2 / (
+            se_i ** 2 / (n[i] - 1) + se_j ** 2 / (n[j] - 1)
+        )
+        p_value = 2 * t_dist.sf(np.abs(t_stat), dof)
+
+    return pd.DataFrame({
+        f"{by}_a": moments.labels[i],
+        f"{by}_b": moments.labels[j],
+        "n_a": n[i].astype("int64"),
+        "n_b": n[j].astype("int64"),
+        f"mean_{column}_a": mean[i],
+        f"mean_{column}_b": mean[j],
+        "t_stat": t_stat,
+        "df": dof,
+        "p_value": p_value,
+    })
+
+
+# ---------- CORRELATION ----------
+class GroupCoMoments:
+    """
+    Per-group count, means, squared deviations and co-moment of two
+    columns over rows where both are present. Merges like GroupMoments.
+    """
+
+    FIELDS = ("n", "mean_x", "mean_y", "m2x", "m2y", "cxy")
+
+    def __init__(self, labels, **fields):
+        self.labels = pd.Index(labels)
+        for f in self.FIELDS:
+            setattr(self, f, fields[f])
+
+    @classmethod
+    def from_values(cls, keys, x, y):
+        x = np.asarray(x, dtype="float64")
+        y = np.asarray(y, dtype="float64")
+
+        codes, labels = group_codes(keys)
+        ok = (codes >= 0) & ~(np.isnan(x) | np.isnan(y))
+        c, x, y = codes[ok], x[ok], y[ok]
+
+        k = len(labels)
+        n = np.bincount(c, minlength=k).astype("float64")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_x = np.bincount(c, weights=x, minlength=k) / n
+            mean_y = np.bincount(c, weights=y, minlength=k) / n
+        dx = x - mean_x[c]
+        dy = y - mean_y[c]
+
+        keep = n > 0
+        return cls(
+            labels[keep],
+            n=n[keep],
+            mean_x=mean_x[keep],
+            mean_y=mean_y[keep],
+            m2x=np.bincount(c, weights=dx * dx, minlength=k)[keep],
+            m2y=np.bincount(c, weights=dy * dy, minlength=k)[keep],
+            cxy=np.bincount(c, weights=dx * dy, minlength=k)[keep],
+        )
+
+    def merge(self, other):
+        labels = self.labels.union(other.labels)
+        a = self.align(labels)
+        b = other.align(labels)
+
+        n = a.n + b.n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dx = np.where(b.n > 0, b.mean_x - a.mean_x, 0.0)
+            dy = np.where(b.n > 0, b.mean_y - a.mean_y, 0.0)
+            w = np.where(n > 0, a.n * b.n / n, 0.0)
+            share = np.where(n > 0, b.n / n, 0.0)
+
+            return GroupCoMoments(
+                labels,
+                n=n,
+                mean_x=np.where(a.n > 0, a.mean_x + dx * share, b.mean_x),
+                mean_y=np.where(a.n > 0, a.mean_y + dy * share, b.mean_y),
+                m2x=a.m2x + b.m2x + dx * dx * w,
+                m2y=a.m2y + b.m2y + dy * dy * w,
+                cxy=a.cxy + b.cxy + dx * dy * w,
+            )
+
+    def align(self, labels):
+        def take(a):
+            return pd.Series(a, index=self.labels).reindex(labels, fill_value=0.0).to_numpy()
+
+        return GroupCoMoments(labels, **{f: take(getattr(self, f)) for f in self.FIELDS})
+
+    def corr(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.cxy / np.sqrt(self.m2x * self.m2y)
+
+
+def group_comoments(df, by, columns):
+    """Co-moments of every pair of columns (lower triangle), keyed (a, b)."""
+    return {
+        (a, b): GroupCoMoments.from_values(df[by], df[columns[a]], df[columns[b]])
+        for a in range(len(columns))
+        for b in range(a + 1)
+    }
+
+
+def merge_comoments(left, right):
+    return {pair: left[pair].merge(right[pair]) for pair in left}
+
+
+def corr_frame(comoments, by, columns):
+    """
+    Pearson correlation matrix of columns within each group, over
+    pairwise-complete rows like DataFrame.corr. Long format: one row per
+    (group, column).
+    """
+    labels = pd.Index([])
+    for m in comoments.values():
+        labels = labels.union(m.labels)
+
+    k, g = len(columns), len(labels)
+    out = np.full((g, k, k), np.nan)
+
+    for (a, b), m in comoments.items():
+        out[:, a, b] = out[:, b, a] = m.align(labels).corr()
+
+    frame = pd.DataFrame(out.reshape(g * k, k), columns=columns)
+    frame.insert(0, "index", np.tile(columns, g))
+    frame.insert(0, by, np.repeat(labels, k))
+    return frame
+
+
+def group_corr(df, by, columns):
+    return corr_frame(group_comoments(df, by, columns), by, columns)
+
+
+# ---------- BOOTSTRAP ----------
+def bootstrap_mean_ci(df, by, column, resamples=BOOTSTRAP_RESAMPLES, confidence=0.95,
+                      seed=0, batch_cells=BOOTSTRAP_BATCH_CELLS):
+    """
+    Percentile bootstrap confidence interval of the mean per group.
+    Every group is resampled at once: rows are sorted by group, each
+    resample draws a random row from the same group for every slot, and
+    group sums are one reduceat over the batch. Batches hold about
+    batch_cells draws.
+    """
+    values = df[column].to_numpy(dtype="float64")
+    codes, labels = group_codes(df[by])
+
+    ok = (codes >= 0) & ~np.isnan(values)
+    codes, values = codes[ok], values[ok]
+
+    order = np.argsort(codes, kind="stable")
+    codes, values = codes[order], values[order]
+
+    sizes = np.bincount(codes, minlength=len(labels))
+    present = sizes > 0
+    labels, sizes = labels[present], sizes[present]
+    starts = np.cumsum(sizes) - sizes
+
+    if not len(values):
+        return pd.DataFrame({by: labels, "n": sizes, column: [], "ci_low": [], "ci_high": []})
+
+    slot_start = np.repeat(starts, sizes)
+    slot_size = np.repeat(sizes, sizes)
+
+    rng = np.random.default_rng(seed)
+    batch = max(1, batch_cells // max(len(values), 1))
+    means = []
+
+    for done in range(0, resamples, batch):
+        b = min(batch, resamples - done)
+        draws = slot_start + (rng.random((b, len(values))) * slot_size).astype("int64")
+        means.append(np.add.reduceat(values[draws], starts, axis=1) / sizes)
+
+    means = np.concatenate(means)
+    tail = (1 - confidence) / 2 * 100
+
+    return pd.DataFrame({
+        by: labels,
+        "n": sizes,
+        column: np.add.reduceat(values, starts) / sizes,
+        "ci_low": np.percentile(means, tail, axis=0),
+        "ci_high": np.percentile(means, 100 - tail, axis=0),
+    })
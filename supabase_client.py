@@ -1,7 +1,41 @@
-from supabase import create_client
+from supabase import create_client, AsyncClient, AsyncClientOptions, ClientOptions
 import os
+import httpx
+
+# one keep-alive connection pool per client, shared by every request
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get("SUPABASE_MAX_CONNECTIONS", "50"))
+SUPABASE_MAX_KEEPALIVE = int(os.environ.get("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_SECONDS = float(os.environ.get("SUPABASE_KEEPALIVE_SECONDS", "30"))
+SUPABASE_TIMEOUT_SECONDS = float(os.environ.get("SUPABASE_TIMEOUT_SECONDS", "30"))
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=SUPABASE_MAX_CONNECTIONS,
+        max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+        keepalive_expiry=SUPABASE_KEEPALIVE_SECONDS,
+    )
+
+
+# blocking client, for job worker threads and other sync callers
+http_client = httpx.Client(limits=_limits(), timeout=SUPABASE_TIMEOUT_SECONDS)
 
 supabase = create_client(
     os.environ["SUPABASE_URL"],
     os.environ["SUPABASE_SERVICE_ROLE_KEY"],
+    options=ClientOptions(httpx_client=http_client),
+)
+
+# non-blocking client, for async endpoints
+async_http_client = httpx.AsyncClient(limits=_limits(), timeout=SUPABASE_TIMEOUT_SECONDS)
+
+async_supabase = AsyncClient(
+    os.environ["SUPABASE_URL"],
+    os.environ["SUPABASE_SERVICE_ROLE_KEY"],
+    options=AsyncClientOptions(httpx_client=async_http_client),
 )
+
+
+async def close():
+    await async_http_client.aclose()
+    http_client.close()
@@ -0,0 +1,186 @@
+"""In-process stand-ins for the Supabase client and object storage."""
+import copy
+import hashlib
+import itertools
+import os
+import shutil
+import threading
+
+
+class Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class Query:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.op = "select"
+        self.payload = None
+        self.filters = []
+        self.conflict = []
+        self.ignore_duplicates = False
+        self.max_rows = None
+
+    def select(self, columns="*"):
+        self.op = "select"
+        return self
+
+    def insert(self, payload):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def update(self, payload):
+        self.op, self.payload = "update", payload
+        return self
+
+    def upsert(self, payload, on_conflict=None, ignore_duplicates=False):
+        self.op, self.payload = "insert", payload
+        self.conflict = on_conflict.split(",") if on_conflict else []
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    def eq(self, key, value):
+        self.filters.append(lambda row: str(row.get(key)) == str(value))
+        return self
+
+    def neq(self, key, value):
+        self.filters.append(lambda row: str(row.get(key)) != str(value))
+        return self
+
+    def in_(self, key, values):
+        values = {str(v) for v in values}
+        self.filters.append(lambda row: str(row.get(key)) in values)
+        return self
+
+    def is_(self, key, value):
+        assert value == "null"
+        self.filters.append(lambda row: row.get(key) is None)
+        return self
+
+    def lt(self, key, value):
+        self.filters.append(lambda row: row.get(key) is not None and row.get(key) < value)
+        return self
+
+    def limit(self, n):
+        self.max_rows = n
+        return self
+
+    def contains(self, key, values):
+        self.filters.append(lambda row: all(v in (row.get(key) or []) for v in values))
+        return self
+
+    def execute(self):
+        if self.db.fail_writes and self.op != "select":
+            self.db.fail_writes -= 1
+            raise ConnectionError("database unavailable")
+
+        with self.db.lock:
+            self.db.calls.append((self.table, self.op))
+            rows = self.db.tables.setdefault(self.table, [])
+
+            if self.op == "insert":
+                payloads = self.payload if isinstance(self.payload, list) else [self.payload]
+                out = []
+                for payload in payloads:
+                    same = [
+                        r for r in rows
+                        if self.conflict and all(r.get(k) == payload.get(k) for k in self.conflict)
+                    ]
+                    if same:
+                        if not self.ignore_duplicates:
+                            same[0].update(copy.deepcopy(payload))
+                            out.append(copy.deepcopy(same[0]))
+                        continue
+                    row = {"id": str(next(self.db.ids)), **payload}
+                    rows.append(row)
+                    out.append(copy.deepcopy(row))
+                return Result(out)
+
+            matched = [row for row in rows if all(f(row) for f in self.filters)]
+            if self.op == "update":
+                for row in matched:
+                    row.update(copy.deepcopy(self.payload))
+            elif self.op == "delete":
+                for row in matched:
+                    rows.remove(row)
+            return Result(copy.deepcopy(matched[:self.max_rows]))
+
+
+class FakeDB:
+    """Enough of the supabase-py query builder for the job queue."""
+
+    def __init__(self):
+        self.tables = {}
+        self.calls = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        # the next n writes raise
+        self.fail_writes = 0
+
+    def table(self, name):
+        return Query(self, name)
+
+    def row(self, table, row_id):
+        with self.lock:
+            return next(r for r in self.tables[table] if r["id"] == str(row_id))
+
+
+class FakeStorage:
+    """
+    Object storage backed by local files. While gate is cleared, downloads
+    wait for it, so a job can be held in its download stage.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.gate = threading.Event()
+        self.gate.set()
+        # upload id -> key of multipart uploads not yet completed or aborted
+        self.multipart = {}
+
+    def _path(self, remote):
+        return os.path.join(self.root, remote)
+
+    def put(self, src, remote):
+        os.makedirs(os.path.dirname(self._path(remote)), exist_ok=True)
+        shutil.copyfile(src, self._path(remote))
+
+    def download_file_cached(self, remote, local):
+        self.gate.wait()
+        if not os.path.exists(self._path(remote)):
+            raise FileNotFoundError(remote)
+        shutil.copyfile(self._path(remote), local)
+
+    def upload_file(self, local, remote, content_type=None, content_encoding=None):
+        self.put(local, remote)
+
+    def read_range(self, remote, start, length):
+        with open(self._path(remote), "rb") as fh:
+            fh.seek(start)
+            return fh.read(length)
+
+    def object_sha256(self, remote):
+        with open(self._path(remote), "rb") as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
+
+    def object_size(self, remote):
+        if not os.path.exists(self._path(remote)):
+            raise FileNotFoundError(remote)
+        return os.path.getsize(self._path(remote))
+
+    def delete_file(self, remote):
+        if os.path.exists(self._path(remote)):
+            os.remove(self._path(remote))
+
+    def abort_multipart_upload(self, remote, upload_id):
+        if self.multipart.pop(upload_id, None) != remote:
+            raise KeyError(upload_id)
+
+    def exists(self, remote):
+        return os.path.exists(self._path(remote))
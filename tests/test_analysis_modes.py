@@ -0,0 +1,126 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis_engine
+from analysis_registry import ANALYSES
+from benchmarks.synthetic import generate
+
+WINDOWS = [(None, None), ("2023-03-01", "2024-10-01")]
+
+
+@pytest.fixture(scope="module", params=["parquet", "csv"])
+def data_dir(request, tmp_path_factory):
+    out = tmp_path_factory.mktemp(request.param)
+    generate(20_000, str(out), seed=1, parquet=request.param == "parquet")
+    if request.param == "csv":
+        for f in out.glob("*.parquet"):
+            f.unlink()
+    return str(out)
+
+
+def _assert_same(expected, got):
+    assert set(got) == set(expected)
+    for name, df in expected.items():
+        key = list(df.columns[:1])
+        pd.testing.assert_frame_equal(
+            got[name].sort_values(key).reset_index(drop=True),
+            df.sort_values(key).reset_index(drop=True),
+            check_dtype=False,
+            check_categorical=False,
+            rtol=1e-9,
+            obj=name,
+        )
+
+
+@pytest.mark.parametrize("analysis_key", sorted(ANALYSES))
+@pytest.mark.parametrize("start_date, end_date", WINDOWS)
+def test_parallel_matches_in_memory(data_dir, analysis_key, start_date, end_date):
+    p = analysis_engine.plan(analysis_key)
+    assert analysis_engine.parallel_ready(p)
+
+    expected = analysis_engine.execute(p, data_dir, start_date, end_date)
+    got = analysis_engine.execute_parallel(p, data_dir, 3, start_date, end_date)
+
+    _assert_same(expected, got)
+
+
+@pytest.mark.parametrize("analysis_key", sorted(ANALYSES))
+@pytest.mark.parametrize("start_date, end_date", WINDOWS)
+def test_streaming_matches_in_memory(data_dir, analysis_key, start_date, end_date):
+    p = analysis_engine.plan(analysis_key)
+    expected = analysis_engine.execute(p, data_dir, start_date, end_date)
+
+    for role in p["roles"]:
+        if not analysis_engine.streamable(p, role):
+            continue
+        # a budget this small gives MIN_CHUNK_ROWS-row chunks
+        got = analysis_engine.execute_streaming(p, data_dir, role, start_date, end_date, 1)
+        _assert_same(expected, got)
+
+
+@pytest.mark.parametrize("analysis_key", sorted(ANALYSES))
+@pytest.mark.parametrize("start_date, end_date", WINDOWS)
+@pytest.mark.parametrize("chunk_rows", [0, 3_000])
+def test_compact_matches_in_memory(data_dir, analysis_key, start_date, end_date, chunk_rows):
+    p = analysis_engine.plan(analysis_key)
+    assert analysis_engine.compact_ready(p)
+
+    expected = analysis_engine.execute(p, data_dir, start_date, end_date)
+    got = analysis_engine.execute_compact(p, data_dir, start_date, end_date, chunk_rows)
+
+    _assert_same(expected, got)
+
+
+def test_compact_chunks_grouped_by_a_streamed_column(data_dir):
+    p = copy.deepcopy(analysis_engine.plan("basic_clinic"))
+    # visit dates come from the streamed visits, so every chunk has its own labels
+    p["results"]["revenue_by_day"] = {"op": "sum", "by": "visitdate", "column": "servicecharge"}
+    p["results"]["visits_by_day"] = {"op": "count", "by": "visitdate", "name": "visits"}
+
+    expected = analysis_engine.execute(p, data_dir)
+    got = analysis_engine.execute_compact(p, data_dir, chunk_rows=3_000)
+
+    _assert_same(expected, got)
+
+
+def test_streaming_role_skips_roles_that_cannot_stream(data_dir, monkeypatch):
+    p = analysis_engine.plan("clinic_outcomes")
+    # metrics is only ever an as-of right side, and patients a left-join right
+    assert not analysis_engine.streamable(p, "metrics")
+    assert not analysis_engine.streamable(p, "patients")
+
+    rows = {"metrics": 3_000_000, "visits": 2_000_000, "patients": 100_000}
+    monkeypatch.setattr(analysis_engine, "table_rows", lambda d, role: rows[role])
+
+    assert analysis_engine.streaming_role(p, data_dir) == "visits"
+
+
+def test_streaming_role_of_an_inner_join(data_dir):
+    p = analysis_engine.plan("basic_clinic")
+    assert analysis_engine.streamable(p, "patients")
+    assert analysis_engine.streamable(p, "visits")
+    assert analysis_engine.streaming_role(p, data_dir) == "visits"
+
+
+def test_clinic_outcomes_on_timestamped_dates(tmp_path):
+    generate(5_000, str(tmp_path), seed=2, parquet=False)
+    rng = np.random.default_rng(0)
+    for name, column in (("visits", "Visit Date"), ("metrics", "Metric-Date")):
+        path = tmp_path / f"{name}.csv"
+        df = pd.read_csv(path)
+        # a time of day on every date
+        seconds = pd.to_timedelta(rng.integers(0, 86_400, len(df)), unit="s")
+        df[column] = (pd.to_datetime(df[column]) + seconds).dt.strftime("%Y-%m-%d %H:%M:%S")
+        df.to_csv(path, index=False)
+
+    p = analysis_engine.plan("clinic_outcomes")
+    expected = analysis_engine.execute(p, str(tmp_path))
+    assert expected["avg_pain_by_insurance"]["painscore"].notna().all()
+    _assert_same(expected, analysis_engine.execute_compact(p, str(tmp_path), chunk_rows=1_000))
+
+    out = tmp_path / "out"
+    analysis_engine.run_analysis("clinic_outcomes", str(tmp_path), str(out), memory_budget_mb=0, workers=1)
+    assert {f.stem for f in out.glob("*.csv")} == set(p["results"])
@@ -0,0 +1,126 @@
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+
+os.environ.setdefault("SUPABASE_JWT_SECRET", "test-secret")
+
+import auth  # noqa: E402
+from auth import TokenCache  # noqa: E402
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(auth.time, "time", c)
+    return c
+
+
+def test_cache_hit(clock):
+    cache = TokenCache(max_size=10, ttl=300)
+    assert cache.get("t") is None
+
+    cache.put("t", "user-1", clock.now + 3600)
+
+    assert cache.get("t") == "user-1"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_entry_expires_at_exp(clock):
+    cache = TokenCache(max_size=10, ttl=300)
+    cache.put("t", "user-1", clock.now + 60)
+
+    clock.now += 59
+    assert cache.get("t") == "user-1"
+    clock.now += 1
+    assert cache.get("t") is None
+    assert cache.stats()["expired"] == 1 and cache.stats()["entries"] == 0
+
+
+def test_ttl_caps_a_long_lived_token(clock):
+    cache = TokenCache(max_size=10, ttl=300)
+    cache.put("t", "user-1", clock.now + 86_400)
+
+    clock.now += 299
+    assert cache.get("t") == "user-1"
+    clock.now += 1
+    assert cache.get("t") is None
+
+
+def test_tokens_without_exp_or_a_cache_are_not_kept(clock):
+    cache = TokenCache(max_size=10, ttl=300)
+    cache.put("t", "user-1", None)
+    assert cache.get("t") is None
+
+    off = TokenCache(max_size=0, ttl=300)
+    off.put("t", "user-1", clock.now + 60)
+    assert off.get("t") is None
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = TokenCache(max_size=2, ttl=300)
+    cache.put("a", "user-a", clock.now + 60)
+    cache.put("b", "user-b", clock.now + 60)
+    cache.get("a")
+    cache.put("c", "user-c", clock.now + 60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "user-a" and cache.get("c") == "user-c"
+    assert cache.stats()["evictions"] == 1
+
+
+def _creds(secret=auth.SUPABASE_JWT_SECRET, **claims):
+    claims = {
+        "sub": "user-1",
+        "aud": "authenticated",
+        "iss": auth.SUPABASE_ISSUER,
+        "exp": int(time.time()) + 3600,
+        **claims,
+    }
+    return HTTPAuthorizationCredentials(
+        scheme="Bearer", credentials=jwt.encode(claims, secret, algorithm="HS256")
+    )
+
+
+@pytest.fixture
+def token_cache(monkeypatch):
+    cache = TokenCache(max_size=10, ttl=300)
+    monkeypatch.setattr(auth, "token_cache", cache)
+    return cache
+
+
+def test_verified_token_is_cached(token_cache, monkeypatch):
+    creds = _creds()
+    assert auth.get_user_id(creds) == "user-1"
+
+    # a hit skips verification entirely
+    monkeypatch.setattr(auth, "verify_token", lambda token: pytest.fail("verified twice"))
+    assert auth.get_user_id(creds) == "user-1"
+    assert token_cache.stats()["hits"] == 1
+
+
+@pytest.mark.parametrize("creds", [
+    _creds(secret="someone-else"),
+    _creds(exp=int(time.time()) - 10),
+    _creds(aud="anon"),
+    HTTPAuthorizationCredentials(scheme="Bearer", credentials="not-a-jwt"),
+], ids=["signature", "expired", "audience", "garbage"])
+def test_invalid_token_is_rejected_and_not_cached(token_cache, creds):
+    for _ in range(2):
+        with pytest.raises(HTTPException) as e:
+            auth.get_user_id(creds)
+        assert e.value.status_code == 401
+
+    stats = token_cache.stats()
+    assert stats["failures"] == 2 and stats["entries"] == 0 and stats["hits"] == 0
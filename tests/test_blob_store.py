@@ -0,0 +1,62 @@
+import blob_store
+from fakes import FakeDB
+
+
+def _blob(db, ref_count=1):
+    return db.table("file_blobs").insert({
+        "user_id": "user-1",
+        "sha256": "ab" * 32,
+        "variant": "raw",
+        "storage_path": "blobs/user-1/x/raw.csv",
+        "inferred_schema": {"columns": ["patientid", "visitdate"]},
+        "ref_count": ref_count,
+    }).execute().data[0]
+
+
+def test_acquire_and_release_count_references():
+    db = FakeDB()
+    blob = _blob(db)
+
+    assert blob_store.acquire(db, blob)
+    assert blob_store.acquire(db, blob)
+    assert db.row("file_blobs", blob["id"])["ref_count"] == 3
+
+    assert blob_store.release(db, blob["id"]) is None
+    assert blob_store.release(db, blob["id"]) is None
+    # the last reference deletes the row and hands back the objects
+    assert blob_store.release(db, blob["id"]) == "blobs/user-1/x/raw.csv"
+    assert not db.tables["file_blobs"]
+    assert blob_store.release(db, blob["id"]) is None
+
+
+def test_acquire_retries_after_a_concurrent_change():
+    db = FakeDB()
+    blob = _blob(db)
+    stale = dict(blob)
+
+    # someone else takes a reference after we read the row
+    assert blob_store.acquire(db, blob)
+    assert blob_store.acquire(db, stale)
+    assert db.row("file_blobs", blob["id"])["ref_count"] == 3
+
+
+def test_acquire_fails_once_the_blob_is_gone():
+    db = FakeDB()
+    blob = _blob(db)
+    stale = dict(blob)
+
+    assert blob_store.release(db, blob["id"])
+    assert not blob_store.acquire(db, stale)
+    assert not blob_store.acquire(db, {**stale, "ref_count": 0})
+
+
+def test_reuse_needs_the_required_columns():
+    db = FakeDB()
+    blob = _blob(db)
+
+    assert blob_store.reuse(db, "user-1", blob["sha256"], "raw", ["service_charge"]) is None
+    assert blob_store.reuse(db, "user-2", blob["sha256"], "raw") is None
+
+    reused = blob_store.reuse(db, "user-1", blob["sha256"], "raw", ["patient_id"])
+    assert reused["id"] == blob["id"]
+    assert db.row("file_blobs", blob["id"])["ref_count"] == 2
@@ -0,0 +1,99 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from columnar_store import (
+    coerce_types,
+    compact_dtypes,
+    iter_table,
+    load_table,
+    read_columnar,
+    write_columnar,
+)
+
+CSV = """Patient ID,Visit Date,Service-Charge,Insurance,City,Notes
+7,2024-01-03,120.5,Medicare,Zion,a
+3,2024-01-02,80,Aetna,Austin,b
+7,not a date,n/a,Cigna,Boston,c
+12,2024-02-29,300,Medicare,Austin,
+3,2024-03-01,95.25,,Zion,d
+"""
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    df = pd.read_csv(io.StringIO(CSV))
+    df.to_csv(tmp_path / "visits.csv", index=False)
+    write_columnar(df, str(tmp_path / "visits.parquet"))
+    return tmp_path
+
+
+def test_coerce_types_normalizes_names_and_types():
+    df = coerce_types(pd.read_csv(io.StringIO(CSV)))
+
+    assert list(df.columns) == ["patientid", "visitdate", "servicecharge", "insurance", "city", "notes"]
+    assert pd.api.types.is_datetime64_dtype(df["visitdate"])
+    assert df["visitdate"].isna().tolist() == [False, False, True, False, False]
+    assert df["servicecharge"].dtype == "float64"
+    assert np.isnan(df.loc[2, "servicecharge"])
+
+
+def test_compact_dtypes_sorts_categories():
+    df = pd.DataFrame({
+        "patientid": np.array([7, 3, 300], dtype="int64"),
+        "insurance": pd.Categorical(["Medicare", "Aetna", "Cigna"], categories=["Medicare", "Cigna", "Aetna"]),
+        "city": ["Zion", "Austin", None],
+    })
+    df = compact_dtypes(df)
+
+    assert list(df["insurance"].cat.categories) == ["Aetna", "Cigna", "Medicare"]
+    assert list(df["insurance"]) == ["Medicare", "Aetna", "Cigna"]
+    assert list(df["city"].cat.categories) == ["Austin", "Zion"]
+    assert df["patientid"].dtype == "int16"
+    # grouping on the categorical orders like the plain strings would
+    assert list(df.groupby("insurance", observed=True).size().index) == ["Aetna", "Cigna", "Medicare"]
+
+
+def test_parquet_round_trip(data_dir):
+    df = read_columnar(str(data_dir / "visits.parquet"))
+    expected = compact_dtypes(coerce_types(pd.read_csv(io.StringIO(CSV))))
+
+    pd.testing.assert_frame_equal(df, expected)
+    assert df["patientid"].dtype == "int8"
+    assert pd.api.types.is_datetime64_dtype(df["visitdate"])
+    assert df["servicecharge"].dtype == "float64"
+    for col in ("insurance", "city"):
+        assert isinstance(df[col].dtype, pd.CategoricalDtype)
+        assert df[col].cat.categories.is_monotonic_increasing
+    assert df["notes"].dtype != "category"
+
+
+def test_column_projection(data_dir):
+    df = read_columnar(str(data_dir / "visits.parquet"), ["patientid", "city"])
+
+    assert list(df.columns) == ["patientid", "city"]
+    assert list(df["city"].cat.categories) == ["Austin", "Boston", "Zion"]
+
+
+@pytest.mark.parametrize("source", ["parquet", "csv"])
+def test_load_and_iter_table_agree(data_dir, source):
+    if source == "csv":
+        (data_dir / "visits.parquet").unlink()
+    columns = ["patientid", "visitdate", "insurance"]
+
+    whole = load_table(str(data_dir), "visits", columns)
+    assert list(whole.columns) == columns
+
+    chunks = list(iter_table(str(data_dir), "visits", columns, 2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    for chunk in chunks:
+        assert list(chunk.columns) == columns
+        assert isinstance(chunk["insurance"].dtype, pd.CategoricalDtype)
+
+    joined = pd.concat(chunks, ignore_index=True)
+    joined["insurance"] = joined["insurance"].astype("object")
+    pd.testing.assert_frame_equal(
+        joined, whole.assign(insurance=whole["insurance"].astype("object")), check_dtype=False
+    )
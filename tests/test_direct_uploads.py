@@ -0,0 +1,101 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from direct_uploads import expire_sessions, validate
+from fakes import FakeDB, FakeStorage
+
+
+def _session(db, age_seconds, **fields):
+    created = datetime.utcnow() - timedelta(seconds=age_seconds)
+    row = {
+        "user_id": "user-1",
+        "filename": "visits.csv",
+        "storage_path": f"raw/user-1/files/{len(db.tables.get('upload_sessions', []))}/visits.csv",
+        "multipart_id": None,
+        "status": "pending",
+        "created_at": created.isoformat(),
+        **fields,
+    }
+    return db.table("upload_sessions").insert(row).execute().data[0]
+
+
+def test_expired_sessions_free_their_parts_and_objects(tmp_path):
+    db, storage = FakeDB(), FakeStorage(str(tmp_path))
+    multipart = _session(db, 7200, multipart_id="mp-1")
+    storage.multipart["mp-1"] = multipart["storage_path"]
+    single = _session(db, 7200)
+    (tmp_path / "stray.csv").write_text("a,b\n")
+    storage.put(str(tmp_path / "stray.csv"), single["storage_path"])
+    recent = _session(db, 60, multipart_id="mp-2")
+    storage.multipart["mp-2"] = recent["storage_path"]
+
+    assert expire_sessions(db, storage, max_age_seconds=3600) == 2
+
+    assert storage.multipart == {"mp-2": recent["storage_path"]}
+    assert not storage.exists(single["storage_path"])
+    for session in (multipart, single):
+        row = db.row("upload_sessions", session["id"])
+        assert (row["status"], row["error"]) == ("failed", "Upload expired")
+    assert db.row("upload_sessions", recent["id"])["status"] == "pending"
+
+    # already claimed
+    assert expire_sessions(db, storage, max_age_seconds=3600) == 0
+
+
+def test_expiry_survives_storage_errors(tmp_path):
+    db, storage = FakeDB(), FakeStorage(str(tmp_path))
+    # its multipart upload is gone already
+    _session(db, 7200, multipart_id="mp-gone")
+    other = _session(db, 7200, multipart_id="mp-3")
+    storage.multipart["mp-3"] = other["storage_path"]
+
+    assert expire_sessions(db, storage, max_age_seconds=3600) == 2
+    assert storage.multipart == {}
+
+
+CSV = b"patient_id,visit_date,service_charge\n1,2024-01-02,100\n2,2024-01-03,80\n"
+
+
+def _uploaded(db, storage, tmp_path, body, sha256):
+    session = _session(db, 0, sha256=sha256)
+    (tmp_path / "upload.csv").write_bytes(body)
+    storage.put(str(tmp_path / "upload.csv"), session["storage_path"])
+    return session
+
+
+def test_validate_registers_a_blob_under_a_matching_sha256(tmp_path):
+    db, storage = FakeDB(), FakeStorage(str(tmp_path / "bucket"))
+    digest = hashlib.sha256(CSV).hexdigest()
+    first = _uploaded(db, storage, tmp_path, CSV, digest)
+    second = _uploaded(db, storage, tmp_path, CSV, digest)
+
+    assert validate(db, storage, first)["status"] == "completed"
+    assert validate(db, storage, second)["status"] == "completed"
+
+    [blob] = db.tables["file_blobs"]
+    assert (blob["sha256"], blob["ref_count"]) == (digest, 2)
+    assert blob["storage_path"] == first["storage_path"]
+    # the second copy was dropped in favour of the shared one
+    assert not storage.exists(second["storage_path"])
+    assert {f["blob_id"] for f in db.tables["user_files"]} == {blob["id"]}
+
+
+def test_validate_rejects_a_wrong_sha256(tmp_path):
+    db, storage = FakeDB(), FakeStorage(str(tmp_path / "bucket"))
+    session = _uploaded(db, storage, tmp_path, CSV, hashlib.sha256(b"other").hexdigest())
+
+    fields = validate(db, storage, session)
+
+    assert fields == {"status": "failed", "error": "File does not match its sha256"}
+    assert not storage.exists(session["storage_path"])
+    assert not db.tables.get("file_blobs")
+    assert not db.tables.get("user_files")
+
+
+def test_validate_without_sha256_keeps_the_upload_unshared(tmp_path):
+    db, storage = FakeDB(), FakeStorage(str(tmp_path / "bucket"))
+    session = _uploaded(db, storage, tmp_path, CSV, None)
+
+    assert validate(db, storage, session)["status"] == "completed"
+    assert not db.tables.get("file_blobs")
+    assert db.tables["user_files"][0]["blob_id"] is None
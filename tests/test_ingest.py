@@ -0,0 +1,83 @@
+import io
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from ingest import MIN_CHUNK_ROWS, MissingColumns, ingest_csv
+
+ROWS = 3 * MIN_CHUNK_ROWS
+
+
+def _ingest(tmp_path, df, **kwargs):
+    csv, parquet = tmp_path / "out.csv", tmp_path / "out.parquet"
+    raw = io.BytesIO(df.to_csv(index=False).encode())
+    # the smallest limit gives MIN_CHUNK_ROWS-row chunks
+    columns, rows = ingest_csv(raw, str(csv), str(parquet), memory_limit_bytes=1, **kwargs)
+    return columns, rows, pq.read_table(parquet)
+
+
+def _visits():
+    return pd.DataFrame({
+        "Patient_ID": range(ROWS),
+        "Visit_Date": ["2024-01-02"] * ROWS,
+        "Service_Charge": [100] * ROWS,
+    })
+
+
+def test_numeric_columns_are_float_from_the_first_chunk(tmp_path):
+    df = _visits()
+    df["Service_Charge"] = df["Service_Charge"].astype(object)
+    df.loc[ROWS - 1, "Service_Charge"] = 99.5
+
+    _, rows, table = _ingest(tmp_path, df)
+
+    assert rows == ROWS
+    assert str(table.schema.field("servicecharge").type) == "double"
+    assert table.column("servicecharge").to_pylist()[-2:] == [100.0, 99.5]
+
+
+def test_int_column_widens_to_float_in_a_later_chunk(tmp_path):
+    df = _visits().assign(Room=[7] * ROWS)
+    df["Room"] = df["Room"].astype(object)
+    df.loc[ROWS - 1, "Room"] = 7.25
+
+    _, _, table = _ingest(tmp_path, df)
+
+    assert str(table.schema.field("room").type) == "double"
+    room = table.column("room").to_pylist()
+    assert room[0] == 7.0 and room[-1] == 7.25
+    assert len(room) == ROWS
+
+
+def test_numeric_column_widens_to_text_in_a_later_chunk(tmp_path):
+    df = _visits().assign(Notes=[12] * ROWS)
+    df["Notes"] = df["Notes"].astype(object)
+    df.loc[ROWS - 1, "Notes"] = "follow up"
+
+    columns, rows, table = _ingest(tmp_path, df)
+
+    assert rows == ROWS
+    assert "notes" in columns
+    notes = table.column("notes").to_pylist()
+    assert notes[0] == "12" and notes[-1] == "follow up"
+    assert table.column("patientid").to_pylist() == list(range(ROWS))
+    assert not list(tmp_path.glob("*.narrow"))
+
+
+def test_cleaned_csv_keeps_every_row(tmp_path):
+    df = _visits().assign(Notes=[1] * ROWS)
+    df["Notes"] = df["Notes"].astype(object)
+    df.loc[ROWS - 1, "Notes"] = "text"
+
+    _ingest(tmp_path, df)
+
+    out = pd.read_csv(tmp_path / "out.csv")
+    assert len(out) == ROWS
+    assert list(out.columns) == ["patient_id", "visit_date", "service_charge", "notes"]
+
+
+def test_missing_required_columns(tmp_path):
+    with pytest.raises(MissingColumns) as e:
+        _ingest(tmp_path, _visits(), required_columns=["patient_id", "insurance"])
+    assert e.value.missing == ["insurance"]
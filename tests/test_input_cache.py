@@ -0,0 +1,137 @@
+import fcntl
+import io
+import os
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+# the module builds its client at import; nothing here reaches the network
+for var in ("B2_ENDPOINT", "B2_KEY_ID", "B2_APP_KEY", "B2_BUCKET"):
+    os.environ.setdefault(var, "http://b2.invalid" if var == "B2_ENDPOINT" else "test")
+
+import b2_storage  # noqa: E402
+from b2_storage import InputCache  # noqa: E402
+
+
+class FakeS3:
+    """head_object / download_file over an in-memory bucket."""
+
+    def __init__(self):
+        self.objects = {}
+        self.downloads = []
+
+    def put(self, key, body, etag):
+        self.objects[key] = (body, etag)
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        body, etag = self.objects[Key]
+        return {"ETag": f'"{etag}"', "ContentLength": len(body)}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[Key][0])}
+
+    def download_file(self, bucket, key, path, Config=None):
+        self.downloads.append(key)
+        with open(path, "wb") as f:
+            f.write(self.objects[key][0])
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(b2_storage, "s3", fake)
+    return fake
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return InputCache(str(tmp_path / "cache"), max_bytes=250)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_hit_skips_the_download(s3, cache, tmp_path):
+    s3.put("u/visits.parquet", b"v1", "e1")
+
+    cache.fetch("u/visits.parquet", str(tmp_path / "a"))
+    cache.fetch("u/visits.parquet", str(tmp_path / "b"))
+
+    assert s3.downloads == ["u/visits.parquet"]
+    assert _read(tmp_path / "b") == b"v1"
+    # served as a hard link to the cached entry, not a copy
+    entry = cache._entry_path("u/visits.parquet", "e1")
+    assert os.stat(tmp_path / "b").st_ino == os.stat(entry).st_ino
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_changed_etag_refetches(s3, cache, tmp_path):
+    s3.put("u/visits.parquet", b"v1", "e1")
+    cache.fetch("u/visits.parquet", str(tmp_path / "a"))
+
+    s3.put("u/visits.parquet", b"v2", "e2")
+    cache.fetch("u/visits.parquet", str(tmp_path / "a"))
+
+    assert s3.downloads == ["u/visits.parquet"] * 2
+    assert _read(tmp_path / "a") == b"v2"
+    assert cache.stats()["hits"] == 0
+
+
+def test_missing_object_is_not_found(s3, cache, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        cache.fetch("u/missing.parquet", str(tmp_path / "a"))
+
+
+@pytest.mark.parametrize("fn", ["object_size", "object_etag", "object_sha256"])
+def test_missing_objects_raise_file_not_found(s3, fn):
+    s3.put("u/visits.parquet", b"v1", "e1")
+    getattr(b2_storage, fn)("u/visits.parquet")
+
+    with pytest.raises(FileNotFoundError):
+        getattr(b2_storage, fn)("u/missing.parquet")
+
+
+def test_eviction_drops_least_recently_used_down_to_the_cap(s3, cache, tmp_path):
+    for key in "abc":
+        s3.put(key, key.encode() * 100, "e")
+
+    cache.fetch("a", str(tmp_path / "a"))
+    cache.fetch("b", str(tmp_path / "b"))
+    entries = {key: cache._entry_path(key, "e") for key in "abc"}
+    os.utime(entries["a"], (1, 1))
+    os.utime(entries["b"], (2, 2))
+
+    # a hit moves a to the front, so b is the oldest when c goes over the cap
+    cache.fetch("a", str(tmp_path / "a"))
+    cache.fetch("c", str(tmp_path / "c"))
+
+    assert not os.path.exists(entries["b"])
+    assert os.path.exists(entries["a"]) and os.path.exists(entries["c"])
+    assert cache.stats()["evictions"] == 1
+
+    cached = [n for n in os.listdir(cache.cache_dir) if not n.startswith(".")]
+    assert sum(os.path.getsize(os.path.join(cache.cache_dir, n)) for n in cached) <= cache.max_bytes
+    # files already handed out survive their entry being evicted
+    assert _read(tmp_path / "b") == b"b" * 100
+
+
+def test_eviction_waits_for_the_file_lock(cache):
+    done = threading.Event()
+
+    with open(os.path.join(cache.cache_dir, ".lock"), "w") as fh:
+        # another worker process evicting
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        t = threading.Thread(target=lambda: (cache.evict(), done.set()))
+        t.start()
+        assert not done.wait(0.2)
+        fcntl.flock(fh, fcntl.LOCK_UN)
+
+    t.join(5)
+    assert done.is_set()
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import job_events
+from job_events import LocalBus, stream_events
+
+
+def _run(coro, timeout=10):
+    return asyncio.run(asyncio.wait_for(coro, timeout))
+
+
+async def _collect(frames):
+    return [f async for f in frames]
+
+
+def _events(frames):
+    return [json.loads(f[len("data: "):]) for f in frames if f.startswith("data: ")]
+
+
+async def _connected():
+    return False
+
+
+def test_publish_from_another_thread_reaches_subscribers():
+    bus = LocalBus()
+
+    async def main():
+        async with bus.subscribe(7) as a, bus.subscribe("7") as b:
+            t = threading.Thread(target=bus.publish, args=(7, {"stage": "running"}))
+            t.start()
+            t.join()
+            got = [await a.get(), await b.get()]
+
+        assert bus._subscribers == {}
+        return got
+
+    assert _run(main()) == [{"stage": "running"}] * 2
+
+
+def test_late_subscriber_sees_the_latest_event_only():
+    bus = LocalBus(history=1)
+    bus.publish(1, {"stage": "queued"})
+    bus.publish(1, {"stage": "running"})
+    bus.publish(2, {"stage": "queued"})
+
+    async def main():
+        async with bus.subscribe(2) as q:
+            first = q.get_nowait()
+        async with bus.subscribe(1) as q:
+            return first, q.empty()
+
+    # job 1's event fell out of the history
+    assert _run(main()) == ({"stage": "queued"}, True)
+
+
+def test_stream_ends_at_the_final_status():
+    bus = LocalBus()
+
+    async def load_state():
+        pytest.fail("an active stream does not re-read the row")
+
+    async def main():
+        frames = stream_events(bus, "9", {"status": "queued"}, load_state, _connected)
+        task = asyncio.create_task(_collect(frames))
+        while "9" not in bus._subscribers:
+            await asyncio.sleep(0.01)
+
+        for stage in ("downloading", "running", "completed", "running"):
+            bus.publish("9", {"job_id": "9", "stage": stage})
+        return await task
+
+    stages = [e["stage"] for e in _events(_run(main()))]
+    assert stages == ["downloading", "running", "completed"]
+
+
+def test_finished_job_gets_one_final_event():
+    frames = _run(_collect(stream_events(
+        LocalBus(), "9", {"status": "failed", "error": "boom"}, None, _connected
+    )))
+
+    assert _events(frames) == [{"job_id": "9", "stage": "failed", "error": "boom", "result_files": None}]
+
+
+def test_idle_stream_rechecks_the_row(monkeypatch):
+    monkeypatch.setattr(job_events, "JOB_EVENTS_KEEPALIVE_SECONDS", 0.01)
+    monkeypatch.setattr(job_events, "JOB_EVENTS_RECHECK_SECONDS", 0.05)
+    reads = []
+
+    async def load_state():
+        # finished on a worker whose events never reach this bus
+        reads.append(1)
+        return {"status": "completed", "result_files": ["a.csv"]}
+
+    frames = _run(_collect(stream_events(LocalBus(), "9", {"status": "running"}, load_state, _connected)))
+
+    assert ": keepalive\n\n" in frames
+    assert _events(frames) == [{"job_id": "9", "stage": "completed", "error": None, "result_files": ["a.csv"]}]
+    assert len(reads) == 1
+
+
+def test_stream_stops_when_the_client_goes(monkeypatch):
+    monkeypatch.setattr(job_events, "JOB_EVENTS_KEEPALIVE_SECONDS", 0.01)
+    bus = LocalBus()
+
+    async def gone():
+        return True
+
+    assert _run(_collect(stream_events(bus, "9", {"status": "running"}, None, gone))) == []
+    assert bus._subscribers == {}
@@ -0,0 +1,384 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate
+from fakes import FakeDB, FakeStorage
+from job_events import LocalBus, stream_events
+from jobs import JobQueue, StatusWriter, job_payload
+from workspace import WorkspaceManager
+
+USER = "user-1"
+
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory):
+    out = tmp_path_factory.mktemp("inputs")
+    generate(2_000, str(out), seed=3)
+    # visits without their charges, for a job that must fail
+    pd.read_csv(out / "visits.csv").drop(columns="Service_Charge").to_csv(
+        out / "nocharge.csv", index=False
+    )
+    return out
+
+
+@pytest.fixture
+def env(inputs, tmp_path):
+    db, storage = FakeDB(), FakeStorage(str(tmp_path / "bucket"))
+    files = {}
+    for name in ("patients", "visits", "metrics", "nocharge"):
+        storage.put(str(inputs / f"{name}.csv"), f"{USER}/{name}.csv")
+        files[name] = db.table("user_files").insert({
+            "user_id": USER,
+            "storage_path": f"{USER}/{name}.csv",
+            "inferred_schema": None,
+        }).execute().data[0]["id"]
+
+    queues = []
+
+    def make_queue(**kwargs):
+        kwargs = {
+            "workers": 1,
+            "use_processes": False,
+            "workspaces": WorkspaceManager(str(tmp_path / "ws")),
+            "status_flush_seconds": 0,
+            "heartbeat_seconds": 0.05,
+            **kwargs,
+        }
+        q = JobQueue(db, storage, **kwargs)
+        queues.append(q)
+        return q
+
+    yield db, storage, files, make_queue
+
+    storage.gate.set()
+    for q in queues:
+        q.stop()
+
+
+def _job(files, visits="visits"):
+    return {
+        "user_id": USER,
+        "analysis_key": "basic_clinic",
+        "files": {"patients": files["patients"], "visits": files[visits]},
+        "start_date": None,
+        "end_date": None,
+        "fingerprint": None,
+        "profile": False,
+    }
+
+
+def _submit(db, q, job):
+    job_id = db.table("analysis_jobs").insert(q.new_row(job)).execute().data[0]["id"]
+    q.submit({"job_id": job_id, **job})
+    return job_id
+
+
+def _wait_for(db, job_id, *statuses, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        row = db.row("analysis_jobs", job_id)
+        if row["status"] in statuses:
+            return row
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} is {row['status']}, expected {statuses}")
+
+
+def _stale_row(files, **fields):
+    old = (datetime.utcnow() - timedelta(minutes=10)).isoformat()
+    return {
+        "user_id": USER,
+        "status": "running",
+        "payload": job_payload(_job(files)),
+        "worker_id": "gone:1:dead",
+        "heartbeat_at": old,
+        "attempts": 1,
+        **fields,
+    }
+
+
+def test_job_runs_to_completion(env):
+    db, storage, files, make_queue = env
+    q = make_queue()
+    q.start()
+
+    job_id = _submit(db, q, _job(files))
+    row = _wait_for(db, job_id, "completed", "failed")
+
+    assert row["status"] == "completed", row.get("error")
+    assert row["result_files"]
+    bundled = set(row["result_manifest"].get("bundle", {}).get("members", {}))
+    for f in row["result_files"]:
+        assert storage.exists(f"results/{job_id}/{f}") or f in bundled
+    assert row["payload"]["files"] == _job(files)["files"]
+    assert row["worker_id"] == q.worker_id
+
+
+def test_status_changes_stream_to_subscribers(env):
+    db, _, files, make_queue = env
+    bus = LocalBus()
+    q = make_queue(events=bus)
+    q.start()
+
+    job = _job(files)
+    job_id = db.table("analysis_jobs").insert(q.new_row(job)).execute().data[0]["id"]
+
+    async def connected():
+        return False
+
+    async def main():
+        frames = stream_events(bus, job_id, {"status": "queued"}, None, connected)
+        first = asyncio.create_task(frames.__anext__())
+        while str(job_id) not in bus._subscribers:
+            await asyncio.sleep(0.01)
+
+        q.submit({"job_id": job_id, **job})
+        return [await first] + [f async for f in frames]
+
+    frames = asyncio.run(asyncio.wait_for(main(), 30))
+    events = [json.loads(f[len("data: "):]) for f in frames if f.startswith("data: ")]
+    stages = [e["stage"] for e in events]
+
+    assert stages[-1] == "completed"
+    assert {"downloading", "running", "uploading"} <= set(stages)
+    assert events[-1]["result_files"] == db.row("analysis_jobs", job_id)["result_files"]
+
+
+def test_job_fails_on_missing_columns(env):
+    db, _, files, make_queue = env
+    q = make_queue()
+    q.start()
+
+    job_id = _submit(db, q, _job(files, visits="nocharge"))
+    row = _wait_for(db, job_id, "completed", "failed")
+
+    assert row["status"] == "failed"
+    assert row["error"] == "visits missing columns: ['servicecharge']"
+
+
+def test_cancel_queued_and_running_jobs(env):
+    db, storage, files, make_queue = env
+    storage.gate.clear()
+    q = make_queue()
+    q.start()
+
+    running = _submit(db, q, _job(files))
+    _wait_for(db, running, "running")
+    queued = _submit(db, q, _job(files))
+
+    assert q.cancel(queued)
+    assert q.cancel(running)
+    storage.gate.set()
+
+    assert _wait_for(db, queued, "cancelled")["error"] == "Cancelled"
+    assert _wait_for(db, running, "cancelled")["error"] == "Cancelled"
+    assert not q.cancel("unknown")
+
+
+def test_timeout_fails_the_job(env):
+    db, storage, files, make_queue = env
+    storage.gate.clear()
+    q = make_queue(timeout=0.3)
+    q.start()
+
+    job_id = _submit(db, q, _job(files))
+    _wait_for(db, job_id, "running")
+    # downloads already under way finish before the job gives up
+    time.sleep(1)
+    storage.gate.set()
+
+    row = _wait_for(db, job_id, "failed", "completed")
+    assert row["status"] == "failed"
+    assert "timeout" in row["error"]
+
+
+def test_cancel_from_another_process_is_final(env):
+    db, storage, files, make_queue = env
+    storage.gate.clear()
+    q = make_queue(heartbeat_seconds=3600)
+    q.start()
+
+    job_id = _submit(db, q, _job(files))
+    _wait_for(db, job_id, "running")
+
+    # what cancel_job does when the job belongs to another process
+    db.table("analysis_jobs").update({"status": "cancelled", "error": "Cancelled"}).eq(
+        "id", job_id
+    ).execute()
+    q.heartbeat()
+    storage.gate.set()
+
+    deadline = time.monotonic() + 30
+    while q.running() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    q.status.flush()
+
+    assert q.running() == 0
+    assert db.row("analysis_jobs", job_id)["status"] == "cancelled"
+
+
+def test_queued_job_cancelled_elsewhere_does_not_run(env):
+    db, storage, files, make_queue = env
+    storage.gate.clear()
+    q = make_queue(heartbeat_seconds=3600)
+    q.start()
+
+    first = _submit(db, q, _job(files))
+    _wait_for(db, first, "running")
+    second = _submit(db, q, _job(files))
+    db.table("analysis_jobs").update({"status": "cancelled"}).eq("id", second).execute()
+    storage.gate.set()
+
+    _wait_for(db, first, "completed")
+    time.sleep(0.2)
+    row = db.row("analysis_jobs", second)
+    assert row["status"] == "cancelled"
+    assert not row.get("result_files")
+
+
+def test_status_writes_skip_cancelled_rows():
+    db = FakeDB()
+    job_id = db.table("analysis_jobs").insert({"status": "cancelled"}).execute().data[0]["id"]
+
+    StatusWriter(db, interval=0).set(job_id, {"status": "completed"})
+
+    assert db.row("analysis_jobs", job_id)["status"] == "cancelled"
+
+
+def _status_row(db, status="queued"):
+    return db.table("analysis_jobs").insert({"status": status}).execute().data[0]["id"]
+
+
+def test_failed_status_write_is_retried_with_newer_fields():
+    db = FakeDB()
+    job_id = _status_row(db)
+    writer = StatusWriter(db, interval=0, retry_max_seconds=0)
+
+    db.fail_writes = 1
+    writer.set(job_id, {"status": "running", "error": None})
+    assert writer.pending() == 1
+
+    writer.set(job_id, {"status": "completed"})
+
+    assert writer.pending() == 0
+    row = db.row("analysis_jobs", job_id)
+    assert row["status"] == "completed"
+    assert "error" in row
+
+
+def test_failed_status_write_backs_off():
+    db = FakeDB()
+    job_id = _status_row(db)
+    writer = StatusWriter(db, interval=0, retry_max_seconds=60)
+
+    db.fail_writes = 1
+    writer.set(job_id, {"status": "running"})
+    writer.flush()
+    assert writer.pending() == 1
+    assert db.row("analysis_jobs", job_id)["status"] == "queued"
+
+    writer.flush(force=True)
+    assert db.row("analysis_jobs", job_id)["status"] == "running"
+
+
+def test_final_status_is_retried_in_place():
+    db = FakeDB()
+    job_id = _status_row(db, "running")
+    writer = StatusWriter(db, interval=60, retry_max_seconds=0, final_attempts=3)
+
+    db.fail_writes = 2
+    writer.set(job_id, {"status": "completed"}, final=True)
+
+    assert db.row("analysis_jobs", job_id)["status"] == "completed"
+    assert writer.pending() == 0
+
+
+def test_final_status_outlives_its_retries():
+    db = FakeDB()
+    job_id = _status_row(db, "running")
+    writer = StatusWriter(db, interval=60, retry_max_seconds=0, final_attempts=2)
+
+    db.fail_writes = 2
+    writer.set(job_id, {"status": "failed"}, final=True)
+    assert writer.pending() == 1
+
+    # the database is back by shutdown
+    writer.stop()
+    assert db.row("analysis_jobs", job_id)["status"] == "failed"
+
+
+def test_recover_requeues_stale_jobs(env):
+    db, _, files, make_queue = env
+    lost = db.table("analysis_jobs").insert(_stale_row(files)).execute().data[0]["id"]
+    fresh = db.table("analysis_jobs").insert(
+        _stale_row(files, heartbeat_at=datetime.utcnow().isoformat(), worker_id="alive:2:beef")
+    ).execute().data[0]["id"]
+
+    q = make_queue()
+    q.start()
+
+    row = _wait_for(db, lost, "completed", "failed")
+    assert row["status"] == "completed", row.get("error")
+    assert row["worker_id"] == q.worker_id
+    assert row["attempts"] == 2
+    # still heartbeating elsewhere
+    assert db.row("analysis_jobs", fresh)["status"] == "running"
+    assert db.row("analysis_jobs", fresh)["worker_id"] == "alive:2:beef"
+
+
+def test_recover_fails_what_it_cannot_rerun(env):
+    db, _, files, make_queue = env
+    no_payload = db.table("analysis_jobs").insert(
+        _stale_row(files, payload=None)
+    ).execute().data[0]["id"]
+    worn_out = db.table("analysis_jobs").insert(
+        _stale_row(files, attempts=3)
+    ).execute().data[0]["id"]
+
+    q = make_queue(max_attempts=3)
+    assert q.recover() == 0
+
+    assert db.row("analysis_jobs", no_payload)["status"] == "failed"
+    assert db.row("analysis_jobs", worn_out)["status"] == "failed"
+    assert "3 times" in db.row("analysis_jobs", worn_out)["error"]
+
+
+def test_recover_claims_each_job_once(env):
+    db, _, files, make_queue = env
+    job_id = db.table("analysis_jobs").insert(_stale_row(files)).execute().data[0]["id"]
+
+    first, second = make_queue(), make_queue()
+    assert first.recover() == 1
+    assert second.recover() == 0
+    assert db.row("analysis_jobs", job_id)["worker_id"] == first.worker_id
+
+
+def test_stop_hands_jobs_back(env):
+    db, storage, files, make_queue = env
+    storage.gate.clear()
+    q = make_queue()
+    q.start()
+
+    running = _submit(db, q, _job(files))
+    _wait_for(db, running, "running")
+    queued = _submit(db, q, _job(files))
+
+    # stop() waits for the running job, which is held in its download
+    threading.Timer(0.5, storage.gate.set).start()
+    q.stop()
+
+    for job_id in (running, queued):
+        row = db.row("analysis_jobs", job_id)
+        assert row["status"] == "queued"
+        assert row["heartbeat_at"] is None
+
+    # the next process picks them up straight away
+    q2 = make_queue()
+    q2.start()
+    assert _wait_for(db, running, "completed", "failed")["status"] == "completed"
+    assert _wait_for(db, queued, "completed", "failed")["status"] == "completed"
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import join_engine
+from join_engine import asof_join, sorted_join
+
+
+def _visits(rng, n, patients, days=60):
+    return pd.DataFrame({
+        "patientid": rng.integers(0, patients, n),
+        "visitdate": (np.datetime64("2024-01-01") + rng.integers(0, days, n).astype("timedelta64[D]")).astype("datetime64[us]"),
+        "charge": rng.random(n),
+    })
+
+
+def _metrics(rng, n, patients, days=60):
+    # few patients and days, so many rows share (patient, day)
+    return pd.DataFrame({
+        "patientid": rng.integers(0, patients, n),
+        "metricdate": (np.datetime64("2024-01-01") + rng.integers(0, days, n).astype("timedelta64[D]")).astype("datetime64[us]"),
+        "pain": np.arange(n),
+    })
+
+
+def _canon(df):
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("how", ["inner", "left"])
+def test_sorted_join_matches_merge_on_two_keys(how):
+    rng = np.random.default_rng(0)
+    v, m = _visits(rng, 3000, 40), _metrics(rng, 2000, 40)
+    v.loc[::37, "visitdate"] = pd.NaT
+    m.loc[::41, "metricdate"] = pd.NaT
+
+    expected = v.merge(m, how=how, left_on=["patientid", "visitdate"], right_on=["patientid", "metricdate"])
+    got = sorted_join(v, m, ["patientid", "visitdate"], ["patientid", "metricdate"], how)
+
+    pd.testing.assert_frame_equal(_canon(got), _canon(expected), check_dtype=False)
+
+
+@pytest.mark.parametrize("how", ["inner", "left"])
+def test_sorted_join_matches_merge_through_lookup(how):
+    rng = np.random.default_rng(1)
+    v = _visits(rng, 3000, 60)
+    patients = pd.DataFrame({
+        "patientid": np.arange(50),
+        "insurance": pd.Categorical(rng.choice(["Aetna", "Cigna", "Medicare"], 50)),
+    })
+
+    expected = v.merge(patients, how=how, on="patientid")
+    got = sorted_join(v, patients, ["patientid"], ["patientid"], how)
+
+    assert got["patientid"].tolist() == expected["patientid"].tolist()
+    pd.testing.assert_frame_equal(
+        got.astype({"insurance": object}), expected.astype({"insurance": object}), check_dtype=False
+    )
+
+
+@pytest.mark.parametrize("direction", ["nearest", "backward", "forward"])
+@pytest.mark.parametrize("tolerance", [None, "1D"])
+def test_asof_join_matches_merge_asof_with_duplicate_keys(direction, tolerance):
+    rng = np.random.default_rng(2)
+    v = _visits(rng, 5000, 30).sort_values("visitdate", kind="stable").reset_index(drop=True)
+    m = _metrics(rng, 4000, 30)
+    assert m.duplicated(["patientid", "metricdate"]).sum() > 100
+
+    expected = pd.merge_asof(
+        v, m.sort_values("metricdate", kind="stable"),
+        left_on="visitdate", right_on="metricdate", by="patientid",
+        direction=direction,
+        tolerance=pd.Timedelta(tolerance) if tolerance else None,
+    )
+    got = asof_join(
+        v, m, ["patientid", "visitdate"], ["patientid", "metricdate"],
+        direction=direction, tolerance=tolerance,
+    )
+
+    assert got["pain"].fillna(-1).tolist() == expected["pain"].fillna(-1).tolist()
+
+
+def test_asof_join_skips_null_times():
+    left = pd.DataFrame({"patientid": [1, 1, 2], "visitdate": pd.to_datetime(["2024-01-02", None, "2024-01-05"])})
+    right = pd.DataFrame({
+        "patientid": [1, 1, 2],
+        "metricdate": pd.to_datetime([None, "2024-01-01", "2024-01-04"]),
+        "pain": [9, 3, 5],
+    })
+
+    out = asof_join(left, right, ["patientid", "visitdate"], ["patientid", "metricdate"])
+
+    assert out["pain"].tolist()[0] == 3
+    assert np.isnan(out["pain"].tolist()[1])
+    assert out["pain"].tolist()[2] == 5
+
+
+def test_asof_join_inner_drops_unmatched():
+    left = pd.DataFrame({"patientid": [1, 2], "visitdate": pd.to_datetime(["2024-01-10", "2024-01-10"])})
+    right = pd.DataFrame({"patientid": [1], "metricdate": pd.to_datetime(["2024-01-09"]), "pain": [4]})
+
+    out = asof_join(left, right, ["patientid", "visitdate"], ["patientid", "metricdate"], how="inner")
+
+    assert out["patientid"].tolist() == [1]
+    assert out["pain"].tolist() == [4]
+
+
+@pytest.mark.parametrize("packed", [True, False])
+@pytest.mark.parametrize("direction", ["nearest", "backward", "forward"])
+def test_asof_join_on_timestamps_over_a_wide_key_space(direction, packed, monkeypatch):
+    if not packed:
+        # keys that cannot be packed at all go through pd.merge_asof
+        monkeypatch.setattr(join_engine, "MAX_KEY_SPACE", 16)
+
+    # times to the second over two years and sparse patient ids: packing
+    # both keys would need more than 64 bits
+    rng = np.random.default_rng(3)
+    start = np.datetime64("2023-01-01T00:00:00", "ns")
+    seconds = 2 * 365 * 86_400
+
+    def stamps(n):
+        return start + rng.integers(0, seconds, n).astype("timedelta64[s]")
+
+    ids = rng.integers(0, 10**9, 200)
+    v = pd.DataFrame({"patientid": rng.choice(ids, 4000), "visitdate": stamps(4000)})
+    m = pd.DataFrame({"patientid": rng.choice(ids, 3000), "metricdate": stamps(3000), "pain": np.arange(3000)})
+    v = v.sort_values("visitdate", kind="stable").reset_index(drop=True)
+
+    expected = pd.merge_asof(
+        v, m.sort_values("metricdate", kind="stable"),
+        left_on="visitdate", right_on="metricdate", by="patientid",
+        direction=direction, tolerance=pd.Timedelta("30D"),
+    )
+    got = asof_join(
+        v, m, ["patientid", "visitdate"], ["patientid", "metricdate"],
+        direction=direction, tolerance="30D",
+    )
+
+    assert expected["pain"].notna().sum() > 1000
+    assert got["pain"].fillna(-1).tolist() == expected["pain"].fillna(-1).tolist()
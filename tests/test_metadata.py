@@ -0,0 +1,172 @@
+import queue
+import threading
+import time
+
+import pytest
+
+import metadata
+from metadata import RedisInvalidations, UserCache
+
+
+class FakeRedis:
+    """publish / pubsub for one process's view of a shared Redis."""
+
+    def __init__(self):
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def publish(self, channel, data):
+        with self.lock:
+            for sub in self.subscribers:
+                if channel in sub.channels:
+                    sub.messages.put({"type": "message", "channel": channel, "data": data})
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        sub = FakePubSub()
+        with self.lock:
+            self.subscribers.append(sub)
+        return sub
+
+
+class FakePubSub:
+    def __init__(self):
+        self.channels = set()
+        self.messages = queue.Queue()
+
+    def subscribe(self, channel):
+        self.channels.add(channel)
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.channels.clear()
+
+
+def _eventually(check, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return
+        time.sleep(0.01)
+    raise AssertionError("condition never held")
+
+
+def test_entries_are_copies_and_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(metadata.time, "monotonic", lambda: now[0])
+    cache = UserCache(ttl=15)
+
+    rows = [{"id": 1}]
+    cache.put("files", "u1", rows)
+    rows.append({"id": 2})
+    got = cache.get("files", "u1")
+    assert got == [{"id": 1}]
+    got.append({"id": 3})
+    assert cache.get("files", "u1") == [{"id": 1}]
+
+    now[0] += 15
+    assert cache.get("files", "u1") is None
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_invalidate_drops_one_kind_for_one_user():
+    cache = UserCache(ttl=15)
+    cache.put("files", "u1", [1])
+    cache.put("jobs", "u1", [2])
+    cache.put("files", "u2", [3])
+
+    cache.invalidate("files", "u1")
+
+    assert cache.get("files", "u1") is None
+    assert cache.get("jobs", "u1") == [2] and cache.get("files", "u2") == [3]
+
+
+@pytest.fixture
+def workers():
+    shared = FakeRedis()
+    caches, listeners = [], []
+    for _ in range(2):
+        cache = UserCache(ttl=60)
+        listener = RedisInvalidations(cache, client=shared)
+        cache.broadcast = listener.start()
+        caches.append(cache)
+        listeners.append(listener)
+
+    # both listeners subscribed before anything is published
+    _eventually(lambda: sum(bool(s.channels) for s in shared.subscribers) == 2)
+    yield caches
+
+    for listener in listeners:
+        listener.stop()
+
+
+def test_invalidation_reaches_every_worker(workers):
+    a, b = workers
+    for cache in workers:
+        cache.put("files", "u1", ["old.csv"])
+        cache.put("files", "u2", ["other.csv"])
+
+    # an upload handled by worker a
+    a.invalidate("files", "u1")
+
+    assert a.get("files", "u1") is None
+    _eventually(lambda: b.get("files", "u1") is None)
+    assert b.get("files", "u2") == ["other.csv"]
+
+
+def test_resubscribing_clears_what_may_have_been_missed():
+    class Flaky(FakeRedis):
+        def __init__(self):
+            super().__init__()
+            self.fail = threading.Event()
+
+        def pubsub(self, ignore_subscribe_messages=False):
+            sub = super().pubsub()
+            get = sub.get_message
+
+            def get_message(timeout=0.0):
+                if self.fail.is_set():
+                    self.fail.clear()
+                    raise ConnectionError("lost")
+                return get(timeout=min(timeout, 0.05))
+
+            sub.get_message = get_message
+            return sub
+
+    client = Flaky()
+    cache = UserCache(ttl=60)
+    listener = RedisInvalidations(cache, client=client).start()
+    _eventually(lambda: client.subscribers)
+
+    cache.put("files", "u1", ["old.csv"])
+    client.fail.set()
+    try:
+        _eventually(lambda: cache.get("files", "u1") is None)
+        assert len(client.subscribers) == 2
+    finally:
+        listener.stop()
+
+
+def test_failed_broadcast_still_drops_the_local_entry(capsys):
+    class Down(FakeRedis):
+        def publish(self, channel, data):
+            raise ConnectionError("down")
+
+    cache = UserCache(ttl=60)
+    cache.broadcast = RedisInvalidations(cache, client=Down())
+    cache.put("files", "u1", [1])
+
+    cache.invalidate("files", "u1")
+
+    assert cache.get("files", "u1") is None
+    assert "LIST CACHE ERROR" in capsys.readouterr().out
+
+
+def test_local_backend_has_no_broadcast():
+    assert metadata.make_list_cache("local").broadcast is None
+    with pytest.raises(ValueError):
+        metadata.make_list_cache("memcached")
@@ -0,0 +1,136 @@
+import ipaddress
+
+import pytest
+
+import analysis_engine
+import metrics
+from benchmarks.synthetic import generate
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "REGISTRY", {})
+    monkeypatch.setattr(metrics, "COLLECTORS", [])
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    return metrics.REGISTRY
+
+
+def test_render(registry):
+    hits = metrics.Counter("hits_total", "Hits.")
+    depth = metrics.Gauge("depth", "Queue depth.")
+    latency = metrics.Histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+
+    hits.inc(route='/a"b')
+    hits.inc(2, route='/a"b')
+    depth.set(3)
+    depth.set(5)
+    for v in (0.05, 0.5, 0.5, 7):
+        latency.observe(v, op="get")
+    metrics.Counter("unused_total", "Never incremented.")
+
+    assert metrics.render() == "\n".join([
+        "# HELP hits_total Hits.",
+        "# TYPE hits_total counter",
+        'hits_total{route="/a\\"b"} 3',
+        "# HELP depth Queue depth.",
+        "# TYPE depth gauge",
+        "depth 5",
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{op="get",le="0.1"} 1',
+        'latency_seconds_bucket{op="get",le="1"} 3',
+        'latency_seconds_bucket{op="get",le="+Inf"} 4',
+        'latency_seconds_sum{op="get"} 8.05',
+        'latency_seconds_count{op="get"} 4',
+    ]) + "\n"
+
+
+def test_collectors_run_at_scrape_time(registry):
+    depth = metrics.Gauge("depth", "Queue depth.")
+    state = {"depth": 1}
+    metrics.register_collector(lambda: depth.set(state["depth"]))
+    metrics.register_collector(lambda: 1 / 0)
+
+    state["depth"] = 4
+    assert "depth 4" in metrics.render()
+
+
+def test_disabled_metrics_record_nothing(registry, monkeypatch):
+    latency = metrics.Histogram("latency_seconds", "Latency.")
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+
+    with latency.time():
+        pass
+    assert metrics.render() == "\n"
+
+
+def test_forwarded_observations_are_applied(registry, monkeypatch):
+    hits = metrics.Counter("hits_total", "Hits.")
+    sent = []
+
+    monkeypatch.setattr(metrics, "_forward", None)
+    metrics.forward_to(lambda *a: sent.append(a))
+    hits.inc(2, route="/a")
+    metrics.forward_to(None)
+
+    assert hits.samples() == []
+    assert sent == [("hits_total", 2, {"route": "/a"})]
+
+    for observation in sent:
+        metrics.apply(*observation)
+    assert hits.samples() == ['hits_total{route="/a"} 2']
+
+
+def test_captured_observations_are_handed_back(registry, monkeypatch):
+    hits = metrics.Counter("hits_total", "Hits.")
+    forwarded = []
+    monkeypatch.setattr(metrics, "_forward", lambda *a: forwarded.append(a))
+
+    with metrics.captured() as observations:
+        hits.inc(route="/a")
+    assert observations == [("hits_total", 1, {"route": "/a"})]
+    assert forwarded == []
+
+    # applied in a process that forwards, they are passed on
+    metrics.apply(*observations[0])
+    assert forwarded == observations
+
+
+def test_parallel_workers_report_to_the_parent(tmp_path):
+    generate(5_000, str(tmp_path), seed=5, parquet=True)
+    p = analysis_engine.plan("basic_clinic")
+    timer = metrics.AGGREGATE_SECONDS
+
+    def count(output):
+        key = tuple(sorted({"analysis": p["key"], "output": output, "op": p["results"][output]["op"]}.items()))
+        return timer._values.get(key, [None, 0.0, 0])[2]
+
+    before = {name: count(name) for name in p["results"]}
+    analysis_engine.execute_parallel(p, str(tmp_path), 2)
+
+    # one observation per partition, recorded here rather than in the workers
+    assert {name: count(name) - before[name] for name in p["results"]} == {
+        name: 2 for name in p["results"]
+    }
+
+
+NETWORKS = [ipaddress.ip_network("127.0.0.1/32"), ipaddress.ip_network("10.0.0.0/8")]
+
+
+@pytest.mark.parametrize("client, authorization, allowed", [
+    ("127.0.0.1", None, True),
+    ("10.2.3.4", None, True),
+    ("203.0.113.9", None, False),
+    ("203.0.113.9", "Bearer scrape-me", True),
+    ("203.0.113.9", "Bearer wrong", False),
+    ("203.0.113.9", "scrape-me", False),
+    (None, None, False),
+    ("testclient", None, False),
+])
+def test_scrape_allowed(client, authorization, allowed):
+    assert metrics.scrape_allowed(client, authorization, NETWORKS, "scrape-me") is allowed
+
+
+def test_scrape_without_a_token_needs_an_allowed_network():
+    assert not metrics.scrape_allowed("203.0.113.9", "Bearer ", NETWORKS, "")
+    assert metrics.scrape_allowed("::1", None, metrics._networks("127.0.0.1/32, ::1/128"), "")
@@ -0,0 +1,98 @@
+import os
+import pstats
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import ANALYSIS_PROFILE, NO_PROFILER, JobProfiler, profile_call, should_profile
+
+
+def pooled_work():
+    return sum(i * i for i in range(20_000))
+
+
+def untraced_pool_work():
+    return sum(i for i in range(20_000))
+
+
+def job_thread_work():
+    time.sleep(0.01)
+
+
+def analysis_work():
+    return sorted(range(10_000), key=lambda i: -i)
+
+
+def _functions(path):
+    return {name for _, _, name in pstats.Stats(path).stats}
+
+
+def test_pool_threads_are_traced_when_wrapped(tmp_path):
+    profiler = JobProfiler()
+
+    with profiler.section("download", trace=False):
+        work = profiler.traced("download", pooled_work)
+        with ThreadPoolExecutor(2) as pool:
+            assert [f.result() for f in [pool.submit(work) for _ in range(3)]] == [pooled_work()] * 3
+            pool.submit(untraced_pool_work).result()
+
+    with profiler.section("lookup"):
+        job_thread_work()
+
+    txt, prof = profiler.write(str(tmp_path))
+
+    functions = _functions(prof)
+    assert {"pooled_work", "job_thread_work"} <= functions
+    # cProfile never sees a pool thread on its own
+    assert "untraced_pool_work" not in functions
+    calls = [v[1] for (_, _, name), v in pstats.Stats(prof).stats.items() if name == "pooled_work"]
+    assert calls == [3]
+
+    with open(txt) as f:
+        steps = f.read().split("\n\n")[0].splitlines()[1:]
+    assert [line.split(None, 2)[::2] for line in steps] == [
+        ["download", "pool threads"],
+        ["lookup", "job thread"],
+    ]
+
+
+def test_untraced_sections_are_labelled_wall_clock_only(tmp_path):
+    profiler = JobProfiler()
+
+    with profiler.section("upload", trace=False):
+        job_thread_work()
+    with profiler.section("analysis", trace=False, scope="analysis process"):
+        pass
+
+    assert profiler.sections["upload"] >= 0.01
+    assert profiler.scopes == {"upload": "wall clock only", "analysis": "analysis process"}
+
+    txt, _ = profiler.write(str(tmp_path))
+    with open(txt) as f:
+        text = f.read()
+    assert "wall clock only" in text
+    assert "job_thread_work" not in text
+
+
+def test_analysis_profile_is_merged(tmp_path):
+    profile_call(str(tmp_path), analysis_work)
+    assert os.path.exists(tmp_path / ANALYSIS_PROFILE)
+
+    profiler = JobProfiler()
+    with profiler.section("lookup"):
+        job_thread_work()
+    txt, prof = profiler.write(str(tmp_path))
+
+    assert {"analysis_work", "job_thread_work"} <= _functions(prof)
+    with open(txt) as f:
+        assert "# analysis memory" in f.read()
+
+
+def test_no_profiler_is_a_pass_through():
+    with NO_PROFILER.section("download", trace=False):
+        assert NO_PROFILER.traced("download", pooled_work) is pooled_work
+
+
+def test_should_profile():
+    assert should_profile(requested=True, rate=0)
+    assert not should_profile(rate=0)
+    assert should_profile(rate=1)
@@ -0,0 +1,34 @@
+import copy
+
+import result_cache
+
+ARGS = ("u1", "basic_clinic", {"patients": "e1", "visits": "e2"}, None, "2024-12-31")
+
+
+def test_fingerprint_is_stable():
+    assert result_cache.fingerprint(*ARGS) == result_cache.fingerprint(*ARGS)
+
+
+def test_fingerprint_changes_with_the_spec(monkeypatch):
+    before = result_cache.fingerprint(*ARGS)
+
+    spec = copy.deepcopy(result_cache.ANALYSES["basic_clinic"])
+    spec["results"]["visit_counts"]["name"] = "visits"
+    monkeypatch.setitem(result_cache.ANALYSES, "basic_clinic", spec)
+
+    assert result_cache.fingerprint(*ARGS) != before
+
+
+def test_fingerprint_changes_with_the_engine_version(monkeypatch):
+    before = result_cache.fingerprint(*ARGS)
+    monkeypatch.setattr(result_cache, "ENGINE_VERSION", result_cache.ENGINE_VERSION + 1)
+
+    assert result_cache.fingerprint(*ARGS) != before
+
+
+def test_fingerprint_changes_with_inputs_and_dates():
+    user, key, versions, start, end = ARGS
+    before = result_cache.fingerprint(*ARGS)
+
+    assert result_cache.fingerprint(user, key, {**versions, "visits": "e3"}, start, end) != before
+    assert result_cache.fingerprint(user, key, versions, "2024-01-01", end) != before
@@ -0,0 +1,93 @@
+import gzip
+
+import pytest
+
+import result_publisher
+from fakes import FakeStorage
+from result_publisher import bundle_member, publish, read_member, sign_member, verify_member
+
+
+@pytest.fixture(autouse=True)
+def url_secret(monkeypatch):
+    monkeypatch.setattr(result_publisher, "RESULT_URL_SECRET", "result-links")
+
+
+@pytest.fixture
+def published(tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    files = {
+        "a.csv": b"x,y\n1,2\n",
+        "b.csv": b"k,v\n" + b"row,1\n" * 500,
+        "c.csv": b"only\n",
+        "big.csv": b"n\n" + b"123456789\n" * 40_000,
+    }
+    for name, body in files.items():
+        (out / name).write_bytes(body)
+
+    storage = FakeStorage(str(tmp_path / "bucket"))
+    names, manifest = publish(
+        storage, str(out), str(tmp_path / "stage"), "results/1", bundle_max_kb=16
+    )
+    return storage, files, names, manifest
+
+
+def _decode(data, encoding):
+    return gzip.decompress(data) if encoding == "gzip" else data
+
+
+def test_small_outputs_are_bundled(published):
+    storage, files, names, manifest = published
+
+    assert names == sorted(files)
+    assert set(manifest["bundle"]["members"]) == {"a.csv", "b.csv", "c.csv"}
+    assert bundle_member(manifest, "big.csv") is None
+    assert storage.exists("results/1/big.csv")
+    assert not storage.exists("results/1/a.csv")
+
+
+def test_bundled_outputs_read_back_from_the_bundle(published):
+    storage, files, _, manifest = published
+
+    for name in manifest["bundle"]["members"]:
+        data = read_member(storage, "results/1", name, manifest)
+        assert _decode(data, manifest["encoding"][name]) == files[name]
+
+
+def test_member_links_are_signed_and_expire(monkeypatch):
+    params = sign_member("7", "a.csv")
+
+    assert verify_member("7", "a.csv", params["expires"], params["signature"])
+    assert not verify_member("8", "a.csv", params["expires"], params["signature"])
+    assert not verify_member("7", "b.csv", params["expires"], params["signature"])
+    assert not verify_member("7", "a.csv", params["expires"] + 1, params["signature"])
+
+    monkeypatch.setattr(result_publisher.time, "time", lambda: params["expires"] + 1)
+    assert not verify_member("7", "a.csv", params["expires"], params["signature"])
+
+
+def test_member_links_fail_closed_without_a_secret(monkeypatch):
+    params = sign_member("7", "a.csv")
+    monkeypatch.setattr(result_publisher, "RESULT_URL_SECRET", "")
+
+    with pytest.raises(result_publisher.LinkSigningDisabled):
+        sign_member("7", "a.csv")
+    assert not verify_member("7", "a.csv", params["expires"], params["signature"])
+
+    # a key other than the one that signed never verifies
+    monkeypatch.setattr(result_publisher, "RESULT_URL_SECRET", "rotated")
+    assert not verify_member("7", "a.csv", params["expires"], params["signature"])
+
+
+def test_nothing_is_bundled_without_a_secret(monkeypatch, tmp_path):
+    monkeypatch.setattr(result_publisher, "RESULT_URL_SECRET", "")
+    out = tmp_path / "out"
+    out.mkdir()
+    for name in ("a.csv", "b.csv", "c.csv"):
+        (out / name).write_bytes(b"x,y\n1,2\n")
+
+    storage = FakeStorage(str(tmp_path / "bucket"))
+    names, manifest = publish(storage, str(out), str(tmp_path / "staging"), "results/1")
+
+    assert "bundle" not in manifest
+    assert all(storage.exists(f"results/1/{n}") for n in names)
@@ -0,0 +1,77 @@
+import os
+
+import pandas as pd
+import pytest
+
+import analysis_engine
+from benchmarks.synthetic import generate
+from column_normalization import normalize_columns
+from ingest import ingest_csv
+from rollups import build_rollup, rollup_path
+
+WINDOWS = [(None, None), ("2023-03-01", "2024-10-01"), ("2024-02-10", "2024-02-10")]
+
+
+def _rename(c):
+    # what the upload endpoint passes
+    return c.strip().lower().replace(" ", "_")
+
+
+@pytest.fixture(scope="module", params=["cents", "whole"])
+def dirs(request, tmp_path_factory):
+    raw = tmp_path_factory.mktemp("raw")
+    generate(20_000, str(raw), seed=3)
+    if request.param == "whole":
+        visits = pd.read_csv(raw / "visits.csv")
+        visits["Service_Charge"] = visits["Service_Charge"].round().astype("int64")
+        visits.to_csv(raw / "visits.csv", index=False)
+
+    data = tmp_path_factory.mktemp("data")
+    for name in ("patients", "visits"):
+        csv, parquet = str(data / f"{name}.csv"), str(data / f"{name}.parquet")
+        with open(raw / f"{name}.csv", "rb") as f:
+            ingest_csv(f, csv, parquet, rename=_rename)
+        build_rollup(parquet, rollup_path(csv))
+
+    return str(raw), str(data)
+
+
+def _baseline_basic_clinic(data_dir, start_date, end_date):
+    # the pandas code basic_clinic ran before the rollups, on the raw CSVs
+    patients = normalize_columns(pd.read_csv(os.path.join(data_dir, "patients.csv")))
+    visits = normalize_columns(pd.read_csv(os.path.join(data_dir, "visits.csv")))
+    full = patients.merge(visits, on="patientid", how="inner")
+
+    if start_date:
+        full["visitdate"] = pd.to_datetime(full["visitdate"], errors="coerce")
+        full = full[full["visitdate"] >= pd.to_datetime(start_date)]
+    if end_date:
+        full = full[full["visitdate"] <= pd.to_datetime(end_date)]
+
+    return {
+        "avg_charge_by_insurance": full.groupby("insurance")["servicecharge"].mean().reset_index(),
+        "revenue_by_city": full.groupby("city")["servicecharge"].sum().reset_index(),
+        "visit_counts": full.groupby("patientid").size().reset_index(name="visit_count"),
+    }
+
+
+@pytest.mark.parametrize("start_date, end_date", WINDOWS)
+def test_rollup_matches_the_pandas_baseline(dirs, start_date, end_date, tmp_path):
+    raw, data = dirs
+    p = analysis_engine.plan("basic_clinic")
+    assert analysis_engine.rollup_role(p, data) == "visits"
+
+    expected = _baseline_basic_clinic(raw, start_date, end_date)
+    analysis_engine.run_analysis("basic_clinic", data, str(tmp_path), start_date, end_date)
+
+    for name, df in expected.items():
+        got = pd.read_csv(tmp_path / f"{name}.csv")
+        pd.testing.assert_frame_equal(got, df, check_dtype=False, rtol=1e-9, obj=name)
+
+    # execute() reads the same typed Parquet copies without the rollup
+    got = analysis_engine.execute(p, data, start_date, end_date)
+    for name, df in expected.items():
+        pd.testing.assert_frame_equal(
+            got[name].reset_index(drop=True), df,
+            check_dtype=False, check_categorical=False, rtol=1e-9, obj=name,
+        )
@@ -0,0 +1,80 @@
+import io
+
+from schema_check import MAX_BAD_VALUES, check_schema, satisfies, schema_error_message, stored_schema
+
+REQUIRED = ["patient_id", "visit_date", "service_charge"]
+
+
+def _csv(rows, header="Patient ID,Visit Date,Service Charge,Insurance"):
+    return io.BytesIO(("\n".join([header, *rows]) + "\n").encode())
+
+
+def test_accepts_a_well_typed_file():
+    f = _csv(["1,2024-01-02,120.50,Aetna", "2,01/03/2024,80,", "3,,,Cigna"])
+
+    result = check_schema(f, REQUIRED)
+
+    assert result["ok"]
+    assert result["columns"] == ["patientid", "visitdate", "servicecharge", "insurance"]
+    assert result["missing_columns"] == [] and result["type_errors"] == []
+    assert result["types"] == {
+        "patientid": "integer",
+        "visitdate": "date",
+        "servicecharge": "number",
+        "insurance": "string",
+    }
+    # the caller goes on to ingest from the same file object
+    assert f.tell() == 0
+    assert stored_schema(result) == {"columns": result["columns"], "types": result["types"]}
+
+
+def test_reports_missing_columns():
+    result = check_schema(_csv(["1,2024-01-02"], header="Patient ID,Visit Date"), REQUIRED)
+
+    assert not result["ok"]
+    assert result["missing_columns"] == ["service_charge"]
+    assert schema_error_message(result) == "Missing required columns: ['service_charge']"
+
+
+def test_rejects_a_file_without_a_header():
+    result = check_schema(io.BytesIO(b""), REQUIRED)
+
+    assert not result["ok"]
+    assert schema_error_message(result) == "Missing required columns: " + str(REQUIRED)
+    assert schema_error_message(check_schema(io.BytesIO(b""))) == "File has no header row"
+
+
+def test_rejects_bad_dates_and_numbers_in_the_sample():
+    rows = [f"{i},2024-01-02,12.5,Aetna" for i in range(20)]
+    rows[3] = "3,yesterday,12.5,Aetna"
+    for i in (5, 6, 7, 8, 9):
+        rows[i] = f"{i},2024-01-02,free,Aetna"
+
+    result = check_schema(_csv(rows), REQUIRED)
+
+    assert not result["ok"]
+    assert result["type_errors"] == [
+        {"column": "visitdate", "expected": "date", "examples": ["yesterday"]},
+        {"column": "servicecharge", "expected": "number", "examples": ["free"] * MAX_BAD_VALUES},
+    ]
+    assert schema_error_message(result) == (
+        "visitdate should be a date (got ['yesterday']); "
+        "servicecharge should be a number (got ['free', 'free', 'free'])"
+    )
+
+
+def test_only_the_sample_is_type_checked():
+    rows = [f"{i},2024-01-02,12.5,Aetna" for i in range(20)] + ["20,2024-01-02,free,Aetna"]
+
+    assert check_schema(_csv(rows), REQUIRED, sample_rows=20)["ok"]
+    assert not check_schema(_csv(rows), REQUIRED, sample_rows=21)["ok"]
+
+
+def test_satisfies():
+    schema = {"columns": ["patientid", "visitdate", "servicecharge"], "types": {}}
+
+    assert satisfies(schema, REQUIRED)
+    assert satisfies(schema, ["Patient ID"])
+    assert not satisfies(schema, REQUIRED + ["insurance"])
+    assert not satisfies(None, REQUIRED)
+    assert not satisfies({"columns": []}, [])
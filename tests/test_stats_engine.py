@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from analysis_engine import STREAMING_AGGREGATES
+from stats_engine import GroupMoments, group_corr, welch_pairs
+
+COLUMNS = ["pain", "mobility", "charge"]
+
+
+@pytest.fixture(scope="module")
+def df():
+    rng = np.random.default_rng(4)
+    n = 5000
+    out = pd.DataFrame({
+        "insurance": rng.choice(["Aetna", "Cigna", "Medicare", "Self Pay"], n, p=[0.4, 0.3, 0.29, 0.01]),
+        "pain": rng.normal(5, 2, n),
+        "charge": rng.gamma(2.0, 150.0, n),
+    })
+    out["mobility"] = 10 - out["pain"] * 0.7 + rng.normal(0, 1, n)
+    out.loc[::17, "pain"] = np.nan
+    out.loc[::23, "mobility"] = np.nan
+    out.loc[::29, "insurance"] = None
+    # one group with a single value, one with none at all
+    out.loc[len(out)] = {"insurance": "Solo", "pain": 3.0, "mobility": 4.0, "charge": 99.0}
+    out.loc[len(out)] = {"insurance": "Empty", "pain": np.nan, "mobility": np.nan, "charge": np.nan}
+    return out
+
+
+def _chunks(df, size=700):
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)]
+
+
+def _groups(df, column):
+    # groups without a single value are left out
+    groups = {k: g[column].dropna().to_numpy() for k, g in df.groupby("insurance")}
+    return {k: v for k, v in groups.items() if len(v)}
+
+
+def _assert_welch_matches_scipy(got, df):
+    groups = _groups(df, "charge")
+    assert len(got) == len(groups) * (len(groups) - 1) // 2
+
+    for row in got.itertuples(index=False):
+        a, b = groups[row.insurance_a], groups[row.insurance_b]
+        assert (row.n_a, row.n_b) == (len(a), len(b))
+
+        if len(a) < 2 or len(b) < 2:
+            assert np.isnan(row.t_stat) and np.isnan(row.p_value)
+            continue
+
+        expected = stats.ttest_ind(a, b, equal_var=False)
+        assert row.t_stat == pytest.approx(expected.statistic, rel=1e-9)
+        assert row.p_value == pytest.approx(expected.pvalue, rel=1e-7, abs=1e-300)
+        assert row.df == pytest.approx(expected.df, rel=1e-9)
+
+
+def test_welch_pairs_match_scipy(df):
+    moments = GroupMoments.from_values(df["insurance"], df["charge"])
+    _assert_welch_matches_scipy(welch_pairs(moments, "insurance", "charge"), df)
+
+
+def test_welch_pairs_from_merged_chunks_match_scipy(df):
+    agg = STREAMING_AGGREGATES["welch_pairs"](by="insurance", column="charge")
+    for chunk in _chunks(df):
+        agg.update(chunk)
+
+    _assert_welch_matches_scipy(agg.result(), df)
+
+
+def test_merged_moments_match_one_pass(df):
+    whole = GroupMoments.from_values(df["insurance"], df["pain"])
+
+    merged = None
+    for chunk in _chunks(df):
+        part = GroupMoments.from_values(chunk["insurance"], chunk["pain"])
+        merged = part if merged is None else merged.merge(part)
+
+    assert list(merged.labels) == list(whole.labels)
+    np.testing.assert_array_equal(merged.n, whole.n)
+    np.testing.assert_allclose(merged.mean, whole.mean, rtol=1e-12)
+    np.testing.assert_allclose(merged.variance(), whole.variance(), rtol=1e-9)
+
+    expected = df.groupby("insurance")["pain"].var()
+    np.testing.assert_allclose(whole.variance(), expected.loc[list(whole.labels)].to_numpy(), rtol=1e-9)
+
+
+def _pandas_group_corr(df):
+    expected = df.groupby("insurance")[COLUMNS].corr()
+    return expected.rename_axis(["insurance", "index"]).reset_index()
+
+
+def _assert_corr_matches_pandas(got, df):
+    expected = _pandas_group_corr(df)
+    # pandas lists a group without one complete row as all NaN; it is left out
+    assert expected.loc[expected["insurance"] == "Empty", COLUMNS].isna().all().all()
+    expected = expected[expected["insurance"] != "Empty"].reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False, rtol=1e-9)
+
+
+def test_group_corr_matches_pandas(df):
+    _assert_corr_matches_pandas(group_corr(df, "insurance", COLUMNS), df)
+
+
+def test_group_corr_from_merged_chunks_matches_pandas(df):
+    agg = STREAMING_AGGREGATES["group_corr"](by="insurance", columns=COLUMNS)
+    for chunk in _chunks(df):
+        agg.update(chunk)
+
+    _assert_corr_matches_pandas(agg.result(), df)
+
+
+def test_streaming_corr_matches_pandas(df):
+    first, second = (STREAMING_AGGREGATES["corr"](columns=COLUMNS) for _ in range(2))
+    chunks = _chunks(df)
+    for chunk in chunks[:3]:
+        first.update(chunk)
+    for chunk in chunks[3:]:
+        second.update(chunk)
+    first.merge(second)
+
+    expected = df[COLUMNS].corr().reset_index()
+    pd.testing.assert_frame_equal(first.result(), expected, check_dtype=False, rtol=1e-9)
@@ -0,0 +1,76 @@
+import os
+import time
+
+import pytest
+
+from workspace import WorkspaceManager, WorkspaceQuotaExceeded
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return WorkspaceManager(str(tmp_path / "ws"), quota_bytes=1024, max_age_seconds=60)
+
+
+def test_each_job_gets_its_own_directory(manager):
+    with manager.workspace("job") as a, manager.workspace("job") as b:
+        assert a.root != b.root
+        for ws in (a, b):
+            assert os.path.dirname(ws.root) == manager.root
+            assert os.path.basename(ws.root).startswith("job-")
+            assert os.path.isdir(ws.data_dir) and os.path.isdir(ws.out_dir)
+
+        # client file names can't leave the workspace
+        assert a.path("../../etc/passwd") == os.path.join(a.root, "passwd")
+
+
+def test_workspace_is_removed_on_success(manager):
+    with manager.workspace() as ws:
+        with open(ws.path("visits.csv"), "w") as f:
+            f.write("patient_id\n1\n")
+
+    assert not os.path.exists(ws.root)
+    assert os.listdir(manager.root) == []
+
+
+def test_workspace_is_removed_on_failure(manager):
+    with pytest.raises(RuntimeError):
+        with manager.workspace() as ws:
+            with open(ws.path("visits.csv"), "w") as f:
+                f.write("patient_id\n1\n")
+            raise RuntimeError("job failed")
+
+    assert not os.path.exists(ws.root)
+    assert os.listdir(manager.root) == []
+
+
+def test_stale_workspaces_are_reaped(manager):
+    # left behind by a worker that crashed mid-job
+    stale = os.path.join(manager.root, "job-crashed")
+    fresh = os.path.join(manager.root, "job-running")
+    for path in (stale, fresh):
+        os.makedirs(os.path.join(path, "data"))
+    old = time.time() - 2 * manager.max_age_seconds
+    os.utime(stale, (old, old))
+
+    assert manager.gc() == 1
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
+
+    # a new workspace reaps before it starts
+    os.utime(fresh, (old, old))
+    with manager.workspace():
+        assert not os.path.exists(fresh)
+
+
+def test_quota_covers_every_workspace(manager):
+    with manager.workspace() as ws:
+        with open(ws.path("big.bin"), "wb") as f:
+            f.write(b"x" * 2048)
+
+        with pytest.raises(WorkspaceQuotaExceeded):
+            ws.check_quota()
+        with pytest.raises(WorkspaceQuotaExceeded):
+            with manager.workspace():
+                pass
+
+    manager.check_quota()
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+
+WORKSPACE_ROOT = os.environ.get("WORKSPACE_ROOT", "/tmp/workspaces")
+WORKSPACE_QUOTA_MB = int(os.environ.get("WORKSPACE_QUOTA_MB", "4096"))
+WORKSPACE_MAX_AGE_SECONDS = float(
+    os.environ.get("WORKSPACE_MAX_AGE_SECONDS", str(6 * 3600))
+)
+
+
+class WorkspaceQuotaExceeded(Exception):
+    pass
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                # removed by a concurrent cleanup
+                pass
+    return total
+
+
+class Workspace:
+    """Private scratch directory for one job or upload."""
+
+    def __init__(self, manager, root):
+        self.manager = manager
+        self.root = root
+        self.data_dir = os.path.join(root, "data")
+        self.out_dir = os.path.join(root, "output")
+
+        os.makedirs(self.data_dir)
+        os.makedirs(self.out_dir)
+
+    def path(self, filename):
+        # never let a client-supplied name escape the workspace
+        return os.path.join(self.root, os.path.basename(filename))
+
+    def size(self):
+        return dir_size(self.root)
+
+    def check_quota(self):
+        self.manager.check_quota()
+
+
+class WorkspaceManager:
+    """
+    Hands out per-job temp directories under a shared root, removes them
+    when the job finishes, enforces a disk quota across all of them and
+    garbage-collects directories left behind by crashed workers.
+
+    max_age_seconds must exceed the longest job, otherwise GC can remove
+    the directory of a job that is still running in another worker.
+    """
+
+    def __init__(
+        self,
+        root=WORKSPACE_ROOT,
+        quota_bytes=WORKSPACE_QUOTA_MB * 1024 * 1024,
+        max_age_seconds=WORKSPACE_MAX_AGE_SECONDS,
+    ):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.max_age_seconds = max_age_seconds
+        self._gc_lock = threading.Lock()
+
+        os.makedirs(self.root, exist_ok=True)
+
+    def usage(self):
+        return dir_size(self.root)
+
+    def check_quota(self):
+        used = self.usage()
+        if used > self.quota_bytes:
+            raise WorkspaceQuotaExceeded(
+                f"Scratch disk quota exceeded "
+                f"({used // (1024 * 1024)} MB used, "
+                f"{self.quota_bytes // (1024 * 1024)} MB allowed)"
+            )
+
+    def gc(self):
+        """Remove workspaces older than max_age_seconds. Returns the count."""
+        removed = 0
+        cutoff = time.time() - self.max_age_seconds
+
+        with self._gc_lock:
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        shutil.rmtree(path, ignore_errors=True)
+                        removed += 1
+                except OSError:
+                    pass
+
+        return removed
+
+    @contextmanager
+    def workspace(self, prefix="job"):
+        self.gc()
+        self.check_quota()
+
+        root = tempfile.mkdtemp(prefix=f"{prefix}-", dir=self.root)
+
+        try:
+            yield Workspace(self, root)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+workspaces = WorkspaceManager()